@@ -1,3 +1,5 @@
+__version__ = '0.1'
+
 # The following packages are the ones currently available
 from . import sat
 from . import stats
@@ -5,12 +5,43 @@ from __future__ import with_statement
 
 import sys
 import itertools
+from functools import reduce
 
 from krrt.planning import pddl
 from . import tools
 from . import timers
 
-def convert_rules(prog):
+class SymbolTable:
+    """Dense integer ids for hashable symbols (objects or predicates)."""
+    def __init__(self):
+        self.ids = {}
+        self.symbols = []
+    def __len__(self):
+        return len(self.symbols)
+    def intern(self, symbol):
+        result = self.ids.get(symbol)
+        if result is None:
+            result = self.ids[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return result
+
+class Symbols:
+    """The object and predicate tables of an exploration. Facts are
+    encoded as tuples (predicate id, object id, object id, ...)."""
+    def __init__(self):
+        self.objects = SymbolTable()
+        self.predicates = SymbolTable()
+    def encode(self, atom):
+        return ((self.predicates.intern(atom.predicate),) +
+                tuple([self.objects.intern(arg) for arg in atom.args]))
+    def decode(self, fact):
+        objects = self.objects.symbols
+        return pddl.Atom(self.predicates.symbols[fact[0]],
+                         [objects[arg] for arg in fact[1:]])
+    def decode_all(self, facts):
+        return [self.decode(fact) for fact in facts]
+
+def convert_rules(prog, symbols):
     RULE_TYPES = {
         "join": JoinRule,
         "product": ProductRule,
@@ -23,6 +54,7 @@ def convert_rules(prog):
             rule.effect, rule.conditions)
         rule = RuleType(new_effect, new_conditions)
         rule.validate()
+        rule.encode(symbols)
         result.append(rule)
     return result
 
@@ -53,12 +85,28 @@ def variables_to_numbers(effect, conditions):
     return new_effect, new_conditions
 
 class BuildRule:
+    def encode(self, symbols):
+        # Interned predicates and constants, and for every condition the
+        # (fact tuple position, effect variable) pairs that it binds.
+        # Positions are offset by one for the predicate at the front.
+        intern = symbols.objects.intern
+        self.effect_predicate = symbols.predicates.intern(self.effect.predicate)
+        self.effect_args = [arg if isinstance(arg, int) else intern(arg)
+                            for arg in self.effect.args]
+        self.condition_predicates = [symbols.predicates.intern(cond.predicate)
+                                     for cond in self.conditions]
+        self.condition_constants = [
+            [(pos + 1, intern(arg)) for pos, arg in enumerate(cond.args)
+             if not isinstance(arg, int) and arg[0] != "?"]
+            for cond in self.conditions]
+        self.condition_bindings = [
+            [(pos + 1, var_no) for pos, var_no in enumerate(cond.args)
+             if isinstance(var_no, int)]
+            for cond in self.conditions]
     def prepare_effect(self, new_atom, cond_index):
-        effect_args = list(self.effect.args)
-        cond = self.conditions[cond_index]
-        for var_no, obj in zip(cond.args, new_atom.args):
-            if isinstance(var_no, int):
-                effect_args[var_no] = obj
+        effect_args = list(self.effect_args)
+        for pos, var_no in self.condition_bindings[cond_index]:
+            effect_args[var_no] = new_atom[pos]
         return effect_args
     def __str__(self):
         return "%s :- %s" % (self.effect, ", ".join(map(str, self.conditions)))
@@ -73,7 +121,7 @@ class JoinRule(BuildRule):
         right_vars = set([var for var in right_args if isinstance(var, int)])
         common_vars = left_vars & right_vars
         self.common_var_positions = [
-            [args.index(var) for var in common_vars]
+            [args.index(var) + 1 for var in common_vars]
             for args in (list(left_args), list(right_args))]
         self.atoms_by_key = ({}, {})
     def validate(self):
@@ -90,24 +138,19 @@ class JoinRule(BuildRule):
         assert left_vars & right_vars, self
         assert (left_vars | right_vars) == (left_vars & right_vars) | eff_vars
     def update_index(self, new_atom, cond_index):
-        ordered_common_args = [
-            new_atom.args[position]
-            for position in self.common_var_positions[cond_index]]
-        key = tuple(ordered_common_args)
+        key = tuple([new_atom[position]
+                     for position in self.common_var_positions[cond_index]])
         self.atoms_by_key[cond_index].setdefault(key, []).append(new_atom)
     def fire(self, new_atom, cond_index, enqueue_func):
         effect_args = self.prepare_effect(new_atom, cond_index)
-        ordered_common_args = [
-            new_atom.args[position]
-            for position in self.common_var_positions[cond_index]]
-        key = tuple(ordered_common_args)
+        key = tuple([new_atom[position]
+                     for position in self.common_var_positions[cond_index]])
         other_cond_index = 1 - cond_index
-        other_cond = self.conditions[other_cond_index]
+        other_bindings = self.condition_bindings[other_cond_index]
         for atom in self.atoms_by_key[other_cond_index].get(key, []):
-            for var_no, obj in zip(other_cond.args, atom.args):
-                if isinstance(var_no, int):
-                    effect_args[var_no] = obj
-            enqueue_func(self.effect.predicate, effect_args)
+            for pos, var_no in other_bindings:
+                effect_args[var_no] = atom[pos]
+            enqueue_func(self.effect_predicate, effect_args)
 
 class ProductRule(BuildRule):
     def __init__(self, effect, conditions):
@@ -131,9 +174,9 @@ class ProductRule(BuildRule):
             self.empty_atom_list_no -= 1
         atom_list.append(new_atom)
         
-    def _get_bindings(self, atom, cond):
-        return [(var_no, obj) for var_no, obj in zip(cond.args, atom.args)
-                if isinstance(var_no, int)]
+    def _get_bindings(self, atom, cond_index):
+        return [(var_no, atom[pos])
+                for pos, var_no in self.condition_bindings[cond_index]]
         
     def fire(self, new_atom, cond_index, enqueue_func):
         if self.empty_atom_list_no:
@@ -144,12 +187,12 @@ class ProductRule(BuildRule):
         # BindingsFactor: List-of(Bindings)
         # BindingsFactors: List-of(BindingsFactor)
         bindings_factors = []
-        for pos, cond in enumerate(self.conditions):
+        for pos in range(len(self.conditions)):
             if pos == cond_index:
                 continue
             atoms = self.atoms_by_index[pos]
             assert atoms, "if we have no atoms, this should never be called"
-            factor = [self._get_bindings(atom, cond) for atom in atoms]
+            factor = [self._get_bindings(atom, pos) for atom in atoms]
             bindings_factors.append(factor)
             
         eff_args = self.prepare_effect(new_atom, cond_index)
@@ -158,7 +201,7 @@ class ProductRule(BuildRule):
             bindings = itertools.chain(*bindings_list)
             for var_no, obj in bindings:
                 eff_args[var_no] = obj
-            enqueue_func(self.effect.predicate, eff_args)
+            enqueue_func(self.effect_predicate, eff_args)
 
 
 class ProjectRule(BuildRule):
@@ -171,7 +214,7 @@ class ProjectRule(BuildRule):
         pass
     def fire(self, new_atom, cond_index, enqueue_func):
         effect_args = self.prepare_effect(new_atom, cond_index)
-        enqueue_func(self.effect.predicate, effect_args)
+        enqueue_func(self.effect_predicate, effect_args)
 
 class Unifier:
     def __init__(self, rules):
@@ -181,21 +224,20 @@ class Unifier:
                 self._insert_condition(rule, i)
     def unify(self, atom):
         result = []
-        generator = self.predicate_to_rule_generator.get(atom.predicate)
+        generator = self.predicate_to_rule_generator.get(atom[0])
         if generator:
             generator.generate(atom, result)
         return result
     def _insert_condition(self, rule, cond_index):
-        condition = rule.conditions[cond_index]
-        root = self.predicate_to_rule_generator.get(condition.predicate)
+        # Keyed on the interned predicate, matching the interned constants
+        # at their fact tuple positions
+        predicate = rule.condition_predicates[cond_index]
+        root = self.predicate_to_rule_generator.get(predicate)
         if not root:
             root = LeafGenerator()
-        constant_arguments = [
-            (arg_index, arg)
-            for (arg_index, arg) in enumerate(condition.args)
-            if not isinstance(arg, int) and arg[0] != "?"]
+        constant_arguments = rule.condition_constants[cond_index]
         newroot = root._insert(constant_arguments, (rule, cond_index))
-        self.predicate_to_rule_generator[condition.predicate] = newroot
+        self.predicate_to_rule_generator[predicate] = newroot
     def dump(self):
         predicates = self.predicate_to_rule_generator.keys()
         predicates.sort()
@@ -240,7 +282,7 @@ class MatchGenerator:
         return False
     def generate(self, atom, result):
         result += self.matches
-        generator = self.match_generator.get(atom.args[self.index])
+        generator = self.match_generator.get(atom[self.index])
         if generator:
             generator.generate(atom, result)
         self.next.generate(atom, result)
@@ -280,8 +322,7 @@ class Queue:
     def __init__(self, atoms):
         self.queue = atoms
         self.queue_pos = 0
-        self.enqueued = set([(atom.predicate,) + tuple(atom.args)
-                             for atom in self.queue])
+        self.enqueued = set(self.queue)
         self.num_pushes = len(atoms)
     def __nonzero__(self):
         return self.queue_pos < len(self.queue)
@@ -290,7 +331,7 @@ class Queue:
         eff_tuple = (predicate,) + tuple(args)
         if eff_tuple not in self.enqueued:
             self.enqueued.add(eff_tuple)
-            self.queue.append(pddl.Atom(predicate, list(args)))
+            self.queue.append(eff_tuple)
     def pop(self):
         result = self.queue[self.queue_pos]
         self.queue_pos += 1
@@ -298,13 +339,19 @@ class Queue:
     def popped_elements(self):
         return queue.queue[:self.queue_pos]
 
-def compute_model(prog):
+def compute_model(prog, decode=True):
+    """Compute the relaxed reachable atoms of the program. The exploration
+    runs on interned fact tuples; with decode=False these are returned
+    along with their Symbols, rather than as a list of pddl.Atom."""
     with timers.timing("Preparing model"):
-        rules = convert_rules(prog)
+        symbols = Symbols()
+        rules = convert_rules(prog, symbols)
         unifier = Unifier(rules)
         # unifier.dump()
-        fact_atoms = [fact.atom for fact in prog.facts]
+        fact_atoms = [symbols.encode(fact.atom) for fact in prog.facts]
         queue = Queue(fact_atoms)
+        auxiliary = [isinstance(pred, str) and "$" in pred
+                     for pred in symbols.predicates.symbols]
 
     print ("Generated %d rules." % len(rules))
     with timers.timing("Computing model"):
@@ -312,8 +359,7 @@ def compute_model(prog):
         auxiliary_atoms = 0
         while queue:
             next_atom = queue.pop()
-            pred = next_atom.predicate
-            if isinstance(pred, str) and "$" in pred:
+            if auxiliary[next_atom[0]]:
                 auxiliary_atoms += 1
             else:
                 relevant_atoms += 1
@@ -325,7 +371,9 @@ def compute_model(prog):
     print ("%d auxiliary atoms" % auxiliary_atoms)
     print ("%d final queue length" % len(queue.queue))
     print ("%d total queue pushes" % queue.num_pushes)
-    return queue.queue
+    if decode:
+        return symbols.decode_all(queue.queue)
+    return queue.queue, symbols
 
 if __name__ == "__main__":
     import sys
@@ -1,7 +1,7 @@
 import sys
 
 from krrt.planning import pddl
-import pddl_to_prolog
+from . import pddl_to_prolog
 
 class OccurrencesTracker(object):
     """Keeps track of the number of times each variable appears
@@ -3,9 +3,12 @@
 
 from __future__ import with_statement
 from collections import defaultdict
+import gc
+import multiprocessing
 
 from . import build_model
 from . import pddl_to_prolog
+from . import seminaive
 from krrt.planning import pddl
 from . import timers
 
@@ -30,53 +33,166 @@ def get_objects_by_type(typed_objects, types):
             result[type].append(obj.name)
     return result
 
-def instantiate(task, model):
+def instantiate_atom(atom, init_facts, fluent_facts, type_to_objects):
+    """Instantiate the action or axiom of a model atom (None if impossible)."""
+    schema = atom.predicate
+    parameters = schema.parameters
+    if isinstance(schema, pddl.Action):
+        condition = schema.precondition
+    else:
+        condition = schema.condition
+    if isinstance(condition, pddl.ExistentialCondition):
+        parameters = list(parameters)
+        parameters += condition.parameters
+    variable_mapping = dict([(par.name, arg)
+                             for par, arg in zip(parameters, atom.args)])
+    if isinstance(schema, pddl.Action):
+        return schema.instantiate(variable_mapping, init_facts,
+                                  fluent_facts, type_to_objects)
+    return schema.instantiate(variable_mapping, init_facts, fluent_facts)
+
+# Read-only state of a worker process: the atoms to instantiate, the fact
+# sets and the codes of the fluent literals. Set once per worker (and
+# inherited without copying under fork).
+_worker_state = None
+
+def _init_worker(state):
+    global _worker_state
+    _worker_state = state
+    # Workers only build acyclic objects, and the collector's passes over
+    # the inherited heap cost more than the instantiation itself
+    gc.disable()
+
+def _instantiate_chunk(bounds):
+    atoms, init_facts, fluent_facts, type_to_objects, codes = _worker_state
+    start, end = bounds
+    result = []
+    for atom in atoms[start:end]:
+        inst = instantiate_atom(atom, init_facts, fluent_facts, type_to_objects)
+        result.append(_encode(inst, codes))
+    return result
+
+# Pickling the instantiated actions back is slower than instantiating them,
+# so workers send tuples in which every fluent literal is replaced by its
+# position in the literal table shared with the parent.
+def _encode(inst, codes):
+    if inst is None:
+        return None
+    def encode_all(literals):
+        return [codes.get(lit, lit) for lit in literals]
+    if isinstance(inst, pddl.PropositionalAxiom):
+        return (inst.name, encode_all(inst.condition),
+                codes.get(inst.effect, inst.effect))
+    return (inst.name, encode_all(inst.precondition),
+            [(encode_all(cond), codes.get(eff, eff)) for cond, eff in inst.add_effects],
+            [(encode_all(cond), codes.get(eff, eff)) for cond, eff in inst.del_effects],
+            inst.cost)
+
+def _decode(code, table, is_action):
+    if code is None:
+        return None
+    def decode(lit):
+        if isinstance(lit, int):
+            return table[lit]
+        return lit
+    def decode_all(literals):
+        return [decode(lit) for lit in literals]
+    if not is_action:
+        name, condition, effect = code
+        return pddl.PropositionalAxiom(name, decode_all(condition), decode(effect))
+    name, precondition, add_effects, del_effects, cost = code
+    action = pddl.PropositionalAction(name, decode_all(precondition), [], cost)
+    action.add_effects = [(decode_all(cond), decode(eff)) for cond, eff in add_effects]
+    action.del_effects = [(decode_all(cond), decode(eff)) for cond, eff in del_effects]
+    return action
+
+def instantiate_all(atoms, init_facts, fluent_facts, type_to_objects,
+                    processes=None):
+    """Instantiate the atoms, in order. With processes > 1, contiguous
+    chunks of the atoms are instantiated by a pool of worker processes and
+    the results are concatenated in chunk order, so the result does not
+    depend on the number of workers."""
+    if not processes or processes <= 1 or len(atoms) < 2:
+        return [instantiate_atom(atom, init_facts, fluent_facts, type_to_objects)
+                for atom in atoms]
+
+    table = []
+    for fact in fluent_facts:
+        table.append(fact)
+        table.append(fact.negate())
+    codes = dict([(lit, i) for i, lit in enumerate(table)])
+
+    chunk_size = max(1, -(-len(atoms) // (4 * processes)))
+    chunks = [(start, min(start + chunk_size, len(atoms)))
+              for start in range(0, len(atoms), chunk_size)]
+    state = (atoms, init_facts, fluent_facts, type_to_objects, codes)
+    pool = multiprocessing.Pool(processes, _init_worker, (state,))
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        results = pool.map(_instantiate_chunk, chunks)
+        instances = []
+        for (start, end), result in zip(chunks, results):
+            for atom, code in zip(atoms[start:end], result):
+                is_action = isinstance(atom.predicate, pddl.Action)
+                instances.append(_decode(code, table, is_action))
+    finally:
+        if gc_enabled:
+            gc.enable()
+        pool.terminate()
+        pool.join()
+    return instances
+
+def instantiate(task, model, processes=None):
     relaxed_reachable = False
     fluent_facts = get_fluent_facts(task, model)
     init_facts = set(task.init)
 
     type_to_objects = get_objects_by_type(task.objects, task.types)
 
-    instantiated_actions = []
-    instantiated_axioms = []
+    schema_atoms = []
     reachable_action_parameters = defaultdict(list)
     for atom in model:
         if isinstance(atom.predicate, pddl.Action):
             action = atom.predicate
-            parameters = action.parameters
-            inst_parameters = atom.args[:len(parameters)]
+            inst_parameters = atom.args[:len(action.parameters)]
             reachable_action_parameters[action.name].append(inst_parameters)
-            if isinstance(action.precondition, pddl.ExistentialCondition):
-                parameters = list(parameters)
-                parameters += action.precondition.parameters
-            variable_mapping = dict([(par.name, arg)
-                                     for par, arg in zip(parameters, atom.args)])
-            inst_action = action.instantiate(variable_mapping, init_facts,
-                                             fluent_facts, type_to_objects)
-            if inst_action:
-                instantiated_actions.append(inst_action)
+            schema_atoms.append(atom)
         elif isinstance(atom.predicate, pddl.Axiom):
-            axiom = atom.predicate
-            parameters = axiom.parameters
-            if isinstance(axiom.condition, pddl.ExistentialCondition):
-                parameters = list(parameters)
-                parameters += axiom.condition.parameters
-            variable_mapping = dict([(par.name, arg)
-                                     for par, arg in zip(parameters, atom.args)])
-            inst_axiom = axiom.instantiate(variable_mapping, init_facts, fluent_facts)
-            if inst_axiom:
-                instantiated_axioms.append(inst_axiom)
+            schema_atoms.append(atom)
         elif atom.predicate == "@goal-reachable":
             relaxed_reachable = True
 
+    instances = instantiate_all(schema_atoms, init_facts, fluent_facts,
+                                type_to_objects, processes)
+
+    instantiated_actions = []
+    instantiated_axioms = []
+    for atom, inst in zip(schema_atoms, instances):
+        if not inst:
+            continue
+        if isinstance(atom.predicate, pddl.Action):
+            instantiated_actions.append(inst)
+        else:
+            instantiated_axioms.append(inst)
+
     return (relaxed_reachable, fluent_facts, instantiated_actions,
            instantiated_axioms, reachable_action_parameters)
 
-def explore(task):
+def explore(task, engine="queue", use_numpy=False, processes=None):
+    """Ground the task. The engine computing the relaxed reachable atoms
+    is either the "queue" of build_model or the "seminaive" evaluation
+    (optionally over NumPy arrays). With processes > 1 the actions and
+    axioms are instantiated in parallel (see instantiate_all)."""
     prog = pddl_to_prolog.translate(task)
-    model = build_model.compute_model(prog)
+    if engine == "seminaive":
+        facts, symbols = seminaive.compute_model(prog, decode=False,
+                                                 use_numpy=use_numpy)
+    else:
+        assert engine == "queue", engine
+        facts, symbols = build_model.compute_model(prog, decode=False)
     with timers.timing("Completing instantiation"):
-        return instantiate(task, model)
+        return instantiate(task, symbols.decode_all(facts), processes)
 
 if __name__ == "__main__":
     from krrt.planning import pddl
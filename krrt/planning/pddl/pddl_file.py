@@ -5,7 +5,7 @@ import sys
 import os.path
 import re
 
-import parser
+from . import parser
 
 from . import tasks
 
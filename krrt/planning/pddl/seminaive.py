@@ -0,0 +1,306 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Set-at-a-time, semi-naive evaluation of the exploration program, as an
+# alternative to the atom-at-a-time queue of build_model.compute_model.
+#
+# Every round takes the facts derived in the previous round (the delta),
+# adds them to the relations of the rule conditions they match, and then
+# joins each condition's delta with everything known for the other
+# conditions. Join rules keep a hash index on the common variables that
+# greedy_join chose for them, so a round costs one probe per delta fact.
+# With use_numpy, the relations are integer arrays and each batch is
+# joined with a vectorized sort-merge instead.
+
+from __future__ import with_statement
+
+import itertools
+from collections import defaultdict
+from operator import itemgetter
+
+from . import build_model
+from . import timers
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def _getter(indices):
+    # itemgetter returns a bare item rather than a tuple for a single index
+    if not indices:
+        return lambda fact: ()
+    if len(indices) == 1:
+        index = indices[0]
+        return lambda fact: (fact[index],)
+    return itemgetter(*indices)
+
+class EvalRule:
+    """A converted build_model rule, evaluated over batches of fact tuples.
+
+    Effects are built from the tuple base + fact_0 + fact_1 + ..., where
+    base holds the effect predicate and constants, and fact_i is a fact
+    matching condition i."""
+    def __init__(self, rule):
+        self.rule = rule
+        self.predicates = rule.condition_predicates
+        if isinstance(rule, build_model.JoinRule):
+            self.kind = "join"
+        elif isinstance(rule, build_model.ProductRule):
+            self.kind = "product"
+        else:
+            self.kind = "project"
+
+        base = [rule.effect_predicate]
+        for arg, value in zip(rule.effect.args, rule.effect_args):
+            if not isinstance(arg, int):
+                base.append(value)
+        self.base = tuple(base)
+
+        offsets = []
+        offset = len(base)
+        for cond in rule.conditions:
+            offsets.append(offset)
+            offset += len(cond.args) + 1
+
+        var_sources = {}
+        for cond_index, bindings in enumerate(rule.condition_bindings):
+            for pos, var_no in bindings:
+                var_sources.setdefault(var_no, offsets[cond_index] + pos)
+
+        sources = [0]
+        next_constant = 1
+        for i, arg in enumerate(rule.effect.args):
+            if isinstance(arg, int):
+                sources.append(var_sources[arg])
+            else:
+                sources.append(next_constant)
+                next_constant += 1
+        self.sources = sources
+        self.build = _getter(sources)
+
+        self.facts = [[] for cond in rule.conditions]
+        if self.kind == "join":
+            self.keys = [_getter(positions) for positions in rule.common_var_positions]
+            self.index = ({}, {})
+
+    def add(self, cond_index, facts):
+        if self.kind == "join":
+            key = self.keys[cond_index]
+            index = self.index[cond_index]
+            for fact in facts:
+                index.setdefault(key(fact), []).append(fact)
+        elif self.kind == "product":
+            self.facts[cond_index].extend(facts)
+
+    def fire(self, cond_index, delta):
+        base = self.base
+        build = self.build
+        if self.kind == "project":
+            return [build(base + fact) for fact in delta]
+
+        result = []
+        if self.kind == "join":
+            key = self.keys[cond_index]
+            index = self.index[1 - cond_index]
+            for fact in delta:
+                partners = index.get(key(fact))
+                if partners:
+                    if cond_index == 0:
+                        result.extend([build(base + fact + other) for other in partners])
+                    else:
+                        result.extend([build(base + other + fact) for other in partners])
+        else:
+            factors = list(self.facts)
+            factors[cond_index] = delta
+            if all(factors):
+                for facts in itertools.product(*factors):
+                    result.append(build(base + tuple(itertools.chain(*facts))))
+        return result
+
+class NumpyEvalRule(EvalRule):
+    """EvalRule over integer arrays, one row per fact."""
+    def __init__(self, rule):
+        EvalRule.__init__(self, rule)
+        self.chunks = [[] for cond in rule.conditions]
+        self.arrays = [None for cond in rule.conditions]
+        self.sources = numpy.array(self.sources)
+        if self.kind == "join":
+            self.key_columns = [numpy.array(positions)
+                                for positions in rule.common_var_positions]
+
+    def add(self, cond_index, facts):
+        self.chunks[cond_index].append(numpy.array(facts, dtype=numpy.int64))
+        self.arrays[cond_index] = None
+
+    def relation(self, cond_index):
+        if self.arrays[cond_index] is None:
+            self.arrays[cond_index] = numpy.concatenate(self.chunks[cond_index])
+            self.chunks[cond_index] = [self.arrays[cond_index]]
+        return self.arrays[cond_index]
+
+    def fire(self, cond_index, delta):
+        delta = numpy.array(delta, dtype=numpy.int64)
+        if self.kind == "project":
+            parts = [delta]
+        elif self.kind == "join":
+            parts = self._join(cond_index, delta)
+            if parts is None:
+                return []
+        else:
+            factors = []
+            for i in range(len(self.facts)):
+                if i == cond_index:
+                    factors.append(delta)
+                elif not self.chunks[i]:
+                    return []
+                else:
+                    factors.append(self.relation(i))
+            parts = _cartesian(factors)
+
+        rows = len(parts[0])
+        base = numpy.tile(numpy.array(self.base, dtype=numpy.int64), (rows, 1))
+        combined = numpy.hstack([base] + parts)
+        return [tuple(row) for row in combined[:, self.sources].tolist()]
+
+    def _join(self, cond_index, delta):
+        other_index = 1 - cond_index
+        if not self.chunks[other_index]:
+            return None
+        other = self.relation(other_index)
+        if not len(self.key_columns[cond_index]):
+            return _cartesian([delta, other] if cond_index == 0 else [other, delta])
+
+        # Dense ids for composite keys of both sides, then a sort-merge on them
+        if len(self.key_columns[cond_index]) == 1:
+            delta_ids = delta[:, self.key_columns[cond_index][0]]
+            other_ids = other[:, self.key_columns[other_index][0]]
+        else:
+            keys = numpy.concatenate([delta[:, self.key_columns[cond_index]],
+                                      other[:, self.key_columns[other_index]]])
+            inverse = numpy.unique(keys, axis=0, return_inverse=True)[1].ravel()
+            delta_ids = inverse[:len(delta)]
+            other_ids = inverse[len(delta):]
+        order = numpy.argsort(other_ids, kind="mergesort")
+        sorted_ids = other_ids[order]
+        low = numpy.searchsorted(sorted_ids, delta_ids, "left")
+        counts = numpy.searchsorted(sorted_ids, delta_ids, "right") - low
+        total = counts.sum()
+        if not total:
+            return None
+
+        delta_rows = numpy.repeat(numpy.arange(len(delta)), counts)
+        within = numpy.arange(total) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        other_rows = order[numpy.repeat(low, counts) + within]
+        if cond_index == 0:
+            return [delta[delta_rows], other[other_rows]]
+        return [other[other_rows], delta[delta_rows]]
+
+def _cartesian(factors):
+    # Row i of the product takes row (i // stride) % len(factor) of each
+    # factor, with the last factor varying fastest
+    total = 1
+    for factor in factors:
+        total *= len(factor)
+    rows = numpy.arange(total)
+    parts = []
+    stride = total
+    for factor in factors:
+        stride //= len(factor)
+        parts.append(factor[(rows // stride) % len(factor)])
+    return parts
+
+class Consumers:
+    """The rule conditions that each predicate feeds. Conditions with
+    constants are grouped by the positions of their constants, and looked
+    up by the values at those positions, so a batch of facts is routed
+    with one probe per fact and group."""
+    def __init__(self, rules):
+        self.plain = defaultdict(list)
+        self.patterns = defaultdict(dict)
+        for rule in rules:
+            for cond_index, predicate in enumerate(rule.predicates):
+                constants = rule.rule.condition_constants[cond_index]
+                if not constants:
+                    self.plain[predicate].append((rule, cond_index))
+                    continue
+                positions = tuple([pos for pos, value in constants])
+                values = tuple([value for pos, value in constants])
+                if positions not in self.patterns[predicate]:
+                    self.patterns[predicate][positions] = (_getter(positions), {})
+                table = self.patterns[predicate][positions][1]
+                table.setdefault(values, []).append((rule, cond_index))
+
+    def select(self, predicate, facts):
+        """Return the (rule, condition index, matching facts) batches."""
+        batches = [(rule, cond_index, facts)
+                   for rule, cond_index in self.plain.get(predicate, [])]
+        patterns = self.patterns.get(predicate, {})
+        for positions in sorted(patterns):
+            getter, table = patterns[positions]
+            selected = defaultdict(list)
+            for fact in facts:
+                values = getter(fact)
+                if values in table:
+                    selected[values].append(fact)
+            for values in sorted(selected):
+                for rule, cond_index in table[values]:
+                    batches.append((rule, cond_index, selected[values]))
+        return batches
+
+def compute_model(prog, decode=True, use_numpy=False):
+    """Compute the relaxed reachable atoms of the program, like
+    build_model.compute_model, but semi-naively and a batch at a time.
+    The model lists the initial facts and then the facts of each round."""
+    assert not use_numpy or numpy is not None, "use_numpy needs NumPy"
+    RuleType = NumpyEvalRule if use_numpy else EvalRule
+
+    with timers.timing("Preparing model"):
+        symbols = build_model.Symbols()
+        rules = [RuleType(rule) for rule in build_model.convert_rules(prog, symbols)]
+        consumers = Consumers(rules)
+
+        model = []
+        reached = set()
+        for fact in prog.facts:
+            fact = symbols.encode(fact.atom)
+            if fact not in reached:
+                reached.add(fact)
+                model.append(fact)
+
+    print ("Generated %d rules." % len(rules))
+    with timers.timing("Computing model"):
+        rounds = 0
+        delta = model
+        while delta:
+            rounds += 1
+            by_predicate = defaultdict(list)
+            for fact in delta:
+                by_predicate[fact[0]].append(fact)
+
+            # Bring every relation up to date before firing, so that each
+            # delta is joined with the other conditions' deltas as well
+            batches = []
+            for predicate in sorted(by_predicate):
+                batches += consumers.select(predicate, by_predicate[predicate])
+            for rule, cond_index, facts in batches:
+                rule.add(cond_index, facts)
+
+            delta = []
+            for rule, cond_index, facts in batches:
+                for fact in rule.fire(cond_index, facts):
+                    if fact not in reached:
+                        reached.add(fact)
+                        delta.append(fact)
+            model.extend(delta)
+
+    predicates = symbols.predicates.symbols
+    auxiliary_atoms = len([fact for fact in model
+                           if isinstance(predicates[fact[0]], str) and "$" in predicates[fact[0]]])
+    print ("%d relevant atoms" % (len(model) - auxiliary_atoms))
+    print ("%d auxiliary atoms" % auxiliary_atoms)
+    print ("%d rounds" % rounds)
+    if decode:
+        return symbols.decode_all(model)
+    return model, symbols
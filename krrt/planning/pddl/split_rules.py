@@ -4,9 +4,9 @@
 
 import copy
 
-from pddl_to_prolog import Rule, get_variables
-import graph
-import greedy_join
+from .pddl_to_prolog import Rule, get_variables
+from . import graph
+from . import greedy_join
 from krrt.planning import pddl
 
 def get_connected_conditions(conditions):
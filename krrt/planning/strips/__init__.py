@@ -1,2 +1,4 @@
 from .representation import Action, Fluent, parse_init_state, parse_goal_state, parse_problem
+from .cache import GroundingCache
+from .bitset import CompiledTask, CompiledAction
 from .reasoning import is_applicable, progress_state, regress_state
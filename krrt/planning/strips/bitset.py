@@ -0,0 +1,128 @@
+
+import binascii
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class CompiledAction(object):
+    """
+    A STRIPS action over states packed as bitmasks, with the masks of its
+    preconditions (pre), adds and deletes (dels).
+    """
+    def __init__(self, action, pre, adds, dels):
+        self.action = action
+        self.line = action.line
+        self.cost = action.cost
+        self.pre = pre
+        self.adds = adds
+        self.dels = dels
+
+    def is_applicable(self, state, regress = False):
+        if not regress:
+            return (state & self.pre) == self.pre
+        else:
+            return not (state & self.dels)
+
+    def progress(self, state):
+        return (state & ~self.dels) | self.adds
+
+    def regress(self, state):
+        return (state & ~self.adds) | self.pre
+
+    def __str__(self):
+        return "(%s)" % self.line
+
+    def __repr__(self):
+        return self.__str__()
+
+class CompiledTask(object):
+    """
+    The (F, A, I, G) tuple of parse_problem over packed bitsets.
+
+    Every fluent (of F, and of the init, goal and actions) gets an index
+    i, and a set of fluents is the python int with bit i set for each of
+    them. The actions (a list sorted by name, and action_map by the names
+    of A) carry the masks of their preconditions, adds and deletes, so
+    applicability and progression are a few bitwise operations.
+
+    With use_numpy, the masks can also be converted to arrays of uint64
+    words (see words), and the applicable actions are found with one
+    vectorized test over the precondition words of all the actions.
+    """
+    def __init__(self, F, A, I, G, use_numpy = False):
+        assert not use_numpy or numpy is not None, "use_numpy needs NumPy"
+
+        self.problem = (F, A, I, G)
+
+        fluents = set(F) | set(I) | set(G)
+        for a in A.values():
+            fluents |= a.precond | a.adds | a.dels
+        self.fluents = sorted(fluents, key = lambda f: f.name)
+        self.index = dict([(f, i) for (i, f) in enumerate(self.fluents)])
+
+        self.action_map = {}
+        self.actions = []
+        for name in sorted(A):
+            a = A[name]
+            act = CompiledAction(a, self.encode(a.precond), self.encode(a.adds), self.encode(a.dels))
+            self.action_map[name] = act
+            self.actions.append(act)
+
+        self.fluent_mask = self.encode(F)
+        self.init = self.encode(I)
+        self.goal = self.encode(G)
+
+        self.num_words = (len(self.fluents) + 63) // 64
+        self.pre_words = None
+        if use_numpy:
+            self.pre_words = numpy.array([self.words(act.pre) for act in self.actions],
+                                         dtype = numpy.uint64).reshape(len(self.actions), self.num_words)
+
+    #--- Conversion
+
+    def encode(self, fluents):
+        """Return the bitmask of a set of fluents."""
+        index = self.index
+        mask = 0
+        for f in fluents:
+            mask |= 1 << index[f]
+        return mask
+
+    def decode(self, mask):
+        """Return the set of fluents of a bitmask."""
+        fluents = set([])
+        while mask:
+            low = mask & -mask
+            fluents.add(self.fluents[low.bit_length() - 1])
+            mask ^= low
+        return fluents
+
+    def words(self, mask):
+        """Return the bitmask as a NumPy array of uint64 words (lowest first)."""
+        digits = ('%x' % mask).zfill(16 * self.num_words)
+        words = numpy.frombuffer(binascii.unhexlify(digits.encode('ascii')), dtype = '>u8')
+        return words[::-1].astype(numpy.uint64)
+
+    def from_words(self, words):
+        """Return the bitmask of a NumPy array of uint64 words."""
+        data = numpy.ascontiguousarray(words[::-1], dtype = '>u8').tobytes()
+        return int(binascii.hexlify(data) or b'0', 16)
+
+    #--- Reasoning
+
+    def is_goal(self, state):
+        return (state & self.goal) == self.goal
+
+    def applicable(self, state):
+        """Return the actions applicable in state."""
+        if self.pre_words is not None and self.actions:
+            pre = self.pre_words
+            holds = ((pre & self.words(state)) == pre).all(axis = 1)
+            return [self.actions[i] for i in numpy.flatnonzero(holds)]
+        return [act for act in self.actions if (state & act.pre) == act.pre]
+
+    def successors(self, state):
+        """Return the (action, state) pairs of the actions applicable in state."""
+        return [(act, (state & ~act.dels) | act.adds) for act in self.applicable(state)]
@@ -0,0 +1,178 @@
+
+import gc
+import os
+import sys
+import zlib
+import hashlib
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from array import array
+
+import krrt
+
+# Bumped whenever the layout of an entry changes
+FORMAT_VERSION = 1
+
+class GroundingCache(object):
+    """
+    Persistent cache of the (F, A, I, G) tuples of parse_problem, one file
+    per grounded problem.
+
+    Entries are keyed by a hash of the domain and problem text, the toolkit
+    version and the python version. An entry keeps every fluent name once,
+    and the actions, init and goal as packed int32 arrays of indices into
+    those names (compressed with zlib). Loading an entry refreshes its
+    modification time, and the least recently used entries are evicted
+    whenever the cache grows past max_bytes.
+    """
+    def __init__(self, directory, max_bytes = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.HITS = 0
+        self.MISSES = 0
+
+    def key(self, pddl_domain_name, pddl_file_name):
+        digest = hashlib.sha1()
+        header = "%s %d %d\n" % (krrt.__version__, FORMAT_VERSION, sys.version_info[0])
+        digest.update(header.encode('ascii'))
+        for file_name in (pddl_domain_name, pddl_file_name):
+            f = open(file_name, 'rb')
+            text = f.read()
+            f.close()
+            digest.update(("%d\n" % len(text)).encode('ascii'))
+            digest.update(text)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.grounding')
+
+    def load(self, key):
+        """Return the (F, A, I, G) tuple stored under key, or None."""
+        from .representation import Action, Fluent
+
+        path = self.path(key)
+        try:
+            f = open(path, 'rb')
+            try:
+                entry = pickle.loads(zlib.decompress(f.read()))
+            finally:
+                f.close()
+            os.utime(path, None)
+        except Exception:
+            # Missing, or left unreadable by an interrupted run
+            self.MISSES += 1
+            return None
+        self.HITS += 1
+
+        (names, num_fluents, action_names, sizes, ids, init, goal) = entry
+        sizes = _unpack(sizes)
+        ids = _unpack(ids)
+
+        # Only acyclic objects are built, and collecting while building the
+        # larger problems costs more than the building
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            fluents = [Fluent(name) for name in names.split('\n')] if names else []
+
+            A = {}
+            pos = 0
+            for (i, name) in enumerate(action_names.split('\n') if action_names else []):
+                parts = []
+                for size in sizes[3 * i:3 * i + 3]:
+                    parts.append(set([fluents[j] for j in ids[pos:pos + size]]))
+                    pos += size
+                A[name] = Action(parts[0], parts[1], parts[2], name)
+
+            return (set(fluents[:num_fluents]), A,
+                    set([fluents[i] for i in _unpack(init)]),
+                    set([fluents[i] for i in _unpack(goal)]))
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def store(self, key, problem):
+        """Store the (F, A, I, G) tuple of parse_problem under key."""
+        (F, A, I, G) = problem
+
+        names = [f.name for f in F]
+        index = dict([(name, i) for (i, name) in enumerate(names)])
+        num_fluents = len(names)
+        for f in list(I) + list(G):
+            if f.name not in index:
+                index[f.name] = len(names)
+                names.append(f.name)
+
+        # The fluents of all the actions in one array, with the number of
+        # preconditions, adds and deletes of each action in another
+        sizes = array('i')
+        ids = array('i')
+        for a in A.values():
+            for fluents in (a.precond, a.adds, a.dels):
+                sizes.append(len(fluents))
+                ids.extend([index[f.name] for f in fluents])
+
+        entry = ('\n'.join(names), num_fluents, '\n'.join(A.keys()),
+                 _pack(sizes), _pack(ids),
+                 _pack(array('i', [index[f.name] for f in I])),
+                 _pack(array('i', [index[f.name] for f in G])))
+        data = zlib.compress(pickle.dumps(entry, 2))
+
+        # Write aside and rename, so readers never see a partial entry
+        path = self.path(key)
+        temp = "%s.%d.tmp" % (path, os.getpid())
+        f = open(temp, 'wb')
+        f.write(data)
+        f.close()
+        os.rename(temp, path)
+
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.grounding'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+            total += stat.st_size
+
+        entries.sort()
+        while total > self.max_bytes and entries:
+            (mtime, name, size) = entries.pop(0)
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Remove every entry of the cache."""
+        for name in os.listdir(self.directory):
+            if name.endswith('.grounding'):
+                os.remove(os.path.join(self.directory, name))
+
+def _pack(values):
+    if hasattr(values, 'tobytes'):
+        return values.tobytes()
+    return values.tostring()
+
+def _unpack(data):
+    values = array('i')
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    return values
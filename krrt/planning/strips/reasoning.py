@@ -1,14 +1,18 @@
 
+from .bitset import CompiledAction
+
 def is_applicable(state, action, regress=False):
     """
     Given a state and an action in STRIPS format, return
       whether or not the action is applicable. Alternatively
       decide if the regression is valid or not.
       
-        state:   Set of fluent objects.
-        action:  Action object.
+        state:   Set of fluent objects (or bitmask).
+        action:  Action object (or CompiledAction).
         reverse: Flag to test for regression validity.
     """
+    if isinstance(action, CompiledAction):
+        return action.is_applicable(state, regress)
     if not regress:
         return action.precond.issubset(state)
     else:
@@ -20,9 +24,11 @@ def progress_state(state, action):
       the state and return the new state after applying the
       provided action.
     
-        state:  Set of fluent objects.
-        action: Action object.
+        state:  Set of fluent objects (or bitmask).
+        action: Action object (or CompiledAction).
     """
+    if isinstance(action, CompiledAction):
+        return action.progress(state)
     return (state - action.dels) | action.adds
 
 def regress_state(state, action):
@@ -30,7 +36,9 @@ def regress_state(state, action):
     Given a partial state and an action in STRIPS,
       return the regressed state.
     
-        state:  Set of fluent objects.
-        action: Action object.
+        state:  Set of fluent objects (or bitmask).
+        action: Action object (or CompiledAction).
     """
+    if isinstance(action, CompiledAction):
+        return action.regress(state)
     return (state - action.adds) | action.precond
@@ -4,6 +4,7 @@ from krrt.planning.pddl import open as parsePDDL
 from krrt.planning.pddl import Assign, Atom, Conjunction, NegatedAtom
 from krrt.planning.pddl.instantiate import explore
 from krrt.planning import Action as GroundAction
+from .cache import GroundingCache
 
 # Degrade gracefully when using python < 2.6
 try:
@@ -64,8 +65,9 @@ class Fluent(object):
         return not self.__cmp__(other)
 
 def parse_init_state(pddl_domain_name, pddl_file_name):
+    return lift_init_state(parsePDDL(task_filename=pddl_file_name, domain_filename=pddl_domain_name))
 
-    t = parsePDDL(task_filename=pddl_file_name, domain_filename=pddl_domain_name)
+def lift_init_state(t):
 
     # Lift the initial state
     inits = set([])
@@ -88,8 +90,9 @@ def parse_init_state(pddl_domain_name, pddl_file_name):
     return inits
 
 def parse_goal_state(pddl_domain_name, pddl_file_name):
+    return lift_goal_state(parsePDDL(task_filename=pddl_file_name, domain_filename=pddl_domain_name))
 
-    t = parsePDDL(task_filename=pddl_file_name, domain_filename=pddl_domain_name)
+def lift_goal_state(t):
 
     # Only lift the goal if it is a conjunction of atoms
     if Conjunction != t.goal.__class__:
@@ -146,14 +149,33 @@ def generate_action(action, act):
 
     return Action(PRE, ADD, DEL, ' '.join([act.operator] + act.arguments))
 
-def parse_problem(pddl_domain_name, pddl_file_name):
-
-    # Get the init and goal conditions
-    I = parse_init_state(pddl_domain_name, pddl_file_name)
-    G = parse_goal_state(pddl_domain_name, pddl_file_name)
-
-    # Parse our task
+def parse_problem(pddl_domain_name, pddl_file_name, cache = None):
+    """
+    Ground the problem into its fluents F, actions A (by name), and initial
+    and goal states I and G. With a cache (a GroundingCache, or the
+    directory of one), problems that were grounded before are loaded from
+    it rather than parsed and grounded again.
+    """
+
+    if cache is not None:
+        if not isinstance(cache, GroundingCache):
+            cache = GroundingCache(cache)
+        key = cache.key(pddl_domain_name, pddl_file_name)
+        problem = cache.load(key)
+        if problem is None:
+            problem = ground_problem(pddl_domain_name, pddl_file_name)
+            cache.store(key, problem)
+        return problem
+
+    return ground_problem(pddl_domain_name, pddl_file_name)
+
+def ground_problem(pddl_domain_name, pddl_file_name):
+
+    # Parse our task, and get the init and goal conditions before grounding
     t = parsePDDL(task_filename=pddl_file_name, domain_filename=pddl_domain_name)
+    I = lift_init_state(t)
+    G = lift_goal_state(t)
+
     _, atoms, actions, _, _ = explore(t)
 
     F = set([])
@@ -0,0 +1,824 @@
+import sys
+import random
+import time
+
+from krrt.sat.CNF import Formula
+from krrt.sat.Dimacs import parseFile
+
+
+USAGE_STRING = "\n\
+Usage: python CDCL.py -<option> <argument> -<option> <argument> ... <FLAG> <FLAG> ...\n\n\
+        Where options are:\n\
+          -i <input-file>\n\
+          -timeout <timeout>\n\
+          -voh [vsids|static|random]\n\
+          -restarts [luby|geometric|none]\n\
+          -seed <seed>\n\n\
+        And the flags include:\n\
+          DEBUG\n\
+          DISABLE_RESULTS\n\
+        "
+
+# Number of conflicts in a unit of the restart schedule
+RESTART_BASE = 100
+
+# Growth factor of the geometric restart schedule
+RESTART_GROWTH = 1.5
+
+# Activity decay factors for variables and learned clauses
+VAR_DECAY = 0.95
+CLAUSE_DECAY = 0.999
+
+# Learned clauses with an LBD this small are never deleted
+GLUE_LBD = 2
+
+
+def luby(i):
+    """Return element i (counting from 0) of the Luby sequence 1 1 2 1 1 2 4 ..."""
+    size = 1
+    seq = 0
+    while size < i + 1:
+        seq += 1
+        size = 2 * size + 1
+    while size - 1 != i:
+        size = (size - 1) >> 1
+        seq -= 1
+        i = i % size
+    return 2 ** seq
+
+
+class VarHeap:
+    """
+    Binary max-heap of variables keyed on their activity. The position of
+    each variable is tracked so that a bumped variable can be moved up in
+    place rather than pushed again.
+    """
+
+    def __init__(self, activity):
+        self.activity = activity
+        self.heap = []
+        self.indices = [-1] * len(activity)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, var):
+        return -1 != self.indices[var]
+
+    def grow(self, size):
+        self.indices.extend([-1] * (size - len(self.indices)))
+
+    def insert(self, var):
+        if -1 == self.indices[var]:
+            self.indices[var] = len(self.heap)
+            self.heap.append(var)
+            self._up(self.indices[var])
+
+    def increased(self, var):
+        if -1 != self.indices[var]:
+            self._up(self.indices[var])
+
+    def pop(self):
+        heap = self.heap
+        top = heap[0]
+        last = heap.pop()
+        self.indices[top] = -1
+        if heap:
+            heap[0] = last
+            self.indices[last] = 0
+            self._down(0)
+        return top
+
+    def _up(self, i):
+        heap = self.heap
+        act = self.activity
+        indices = self.indices
+        var = heap[i]
+        a = act[var]
+        while i > 0:
+            parent = (i - 1) >> 1
+            pvar = heap[parent]
+            if act[pvar] >= a:
+                break
+            heap[i] = pvar
+            indices[pvar] = i
+            i = parent
+        heap[i] = var
+        indices[var] = i
+
+    def _down(self, i):
+        heap = self.heap
+        act = self.activity
+        indices = self.indices
+        size = len(heap)
+        var = heap[i]
+        a = act[var]
+        while True:
+            child = 2 * i + 1
+            if child >= size:
+                break
+            if child + 1 < size and act[heap[child + 1]] > act[heap[child]]:
+                child += 1
+            if act[heap[child]] <= a:
+                break
+            heap[i] = heap[child]
+            indices[heap[i]] = i
+            i = child
+        heap[i] = var
+        indices[var] = i
+
+
+class CDCL:
+    """
+    Conflict driven clause learning SAT solver over the DIMACS integers of
+    a Formula (or a DIMACS file).
+
+    Literals are kept as DIMACS integers throughout. The literal indexed
+    tables (values and watches) have 2n+1 entries so that a negative
+    literal -v indexes slot 2n+1-v through Python's negative indexing.
+
+    The search uses two watched literals, 1-UIP clause learning with
+    clause minimization, VSIDS branching on an activity heap, phase
+    saving, Luby / geometric restarts and LBD based deletion of learned
+    clauses.
+    """
+
+    def __init__(self, input = None, timeout = None, voh = 'vsids', restarts = 'luby',
+                 seed = None, debug = False):
+
+        #--- Clause database and assignment
+        self.num_vars = 0
+        self.val = [0]
+        self.watches = [[]]
+        self.level = [0]
+        self.reason = [None]
+        self.activity = [0.0]
+        self.polarity = [False]
+        self.seen = [False]
+        self.order = VarHeap(self.activity)
+
+        self.clauses = []
+        self.learnts = []
+        self.learnt_info = {}
+        self.trail = []
+        self.trail_lim = []
+        self.qhead = 0
+        self.ok = True
+        self.model = None
+        self.core = None
+
+        #--- Set up the control and statistic variables
+        self.debug = debug
+        self.timedout = False
+        self.TIMEOUT = timeout
+        self.rng = random.Random(seed)
+
+        self.var_inc = 1.0
+        self.cla_inc = 1.0
+        self.max_learnts = 0
+
+        self.MAX_DEPTH = 0
+        self.SUM_DEPTH = 0
+        self.NODE_COUNT = 0
+        self.BACKTRACK_COUNT = 0
+        self.RESTART_COUNT = 0
+        self.PROPAGATIONS = 0
+        self.DELETED_COUNT = 0
+
+        #--- Set up the variable ordering heuristic
+        if voh not in ['vsids', 'static', 'random']:
+            print ("Error: Unknown variable ordering heuristic, %s" % voh)
+            sys.exit(0)
+        self.voh = voh
+        self.static_ptr = 1
+
+        if restarts not in ['luby', 'geometric', 'none']:
+            print ("Error: Unknown restart policy, %s" % restarts)
+            sys.exit(0)
+        self.restarts = restarts
+
+        #--- Load the clauses
+        if input is not None:
+            if isinstance(input, Formula):
+                theory = input
+            else:
+                theory = parseFile(input, compact = True)
+            self.addFormula(theory)
+
+    @property
+    def decision_level(self):
+        return len(self.trail_lim)
+
+    @property
+    def num_clauses(self):
+        return len(self.clauses)
+
+    @property
+    def num_learnts(self):
+        return len(self.learnts)
+
+    def addFormula(self, theory):
+        """Add every clause of a Formula. Returns False if it is unsat."""
+        self.growTo(theory.num_vars)
+        for cls in theory.iterIntClauses():
+            if not self.addClause(cls):
+                break
+        return self.ok
+
+    def growTo(self, num_vars):
+        """Make room for the variables 1..num_vars."""
+        old = self.num_vars
+        if num_vars <= old:
+            return
+        extra = num_vars - old
+
+        # Literal indexed tables keep the negative literals at the end
+        self.val = self.val[:old + 1] + [0] * (2 * extra) + self.val[old + 1:]
+        self.watches = self.watches[:old + 1] + [[] for i in range(2 * extra)] + self.watches[old + 1:]
+
+        self.level.extend([0] * extra)
+        self.reason.extend([None] * extra)
+        self.activity.extend([0.0] * extra)
+        self.polarity.extend([False] * extra)
+        self.seen.extend([False] * extra)
+        self.order.grow(num_vars + 1)
+
+        self.num_vars = num_vars
+        for v in range(old + 1, num_vars + 1):
+            self.order.insert(v)
+
+    def addClause(self, lits):
+        """
+        Add a clause of DIMACS integers at decision level 0. Returns False
+        if the clauses are now known to be unsatisfiable.
+        """
+        if not self.ok:
+            return False
+
+        if self.trail_lim:
+            self._cancelUntil(0)
+
+        top = max([abs(l) for l in lits] + [0])
+        if top > self.num_vars:
+            self.growTo(top)
+
+        # Drop false and repeated literals, and skip satisfied / tautological clauses
+        val = self.val
+        clause = []
+        seen = set()
+        for l in lits:
+            if (-l in seen) or (1 == val[l]):
+                return True
+            if (l not in seen) and (-1 != val[l]):
+                seen.add(l)
+                clause.append(l)
+
+        if 0 == len(clause):
+            self.ok = False
+
+        elif 1 == len(clause):
+            self._enqueue(clause[0], None)
+            self.ok = (self._propagate() is None)
+
+        else:
+            self.clauses.append(clause)
+            self._watch(clause)
+
+        return self.ok
+
+    def solve(self, assumptions = None):
+        """
+        Search for a satisfying assignment. Returns True (with the solution
+        in self.model), False if the clauses are unsatisfiable, or None if
+        the timeout was reached.
+
+        The optional assumptions are DIMACS literals that are forced true
+        for this call only. If they make the clauses unsatisfiable, then
+        self.core holds the subset of the assumptions responsible (empty
+        when the clauses are unsatisfiable on their own). Learned clauses
+        are kept from one call to the next.
+        """
+        self.model = None
+        self.core = None
+        self.timedout = False
+        assumptions = list(assumptions or [])
+
+        top = max([abs(l) for l in assumptions] + [0])
+        if top > self.num_vars:
+            self.growTo(top)
+
+        if not self.ok:
+            self.core = []
+            return False
+
+        self.start_time = time.time()
+        self.max_learnts = max(self.max_learnts, len(self.clauses) // 3, 1000)
+
+        restart_num = 0
+        restart_limit = self._restartLimit(restart_num)
+        restart_conflicts = 0
+        checks = 0
+
+        while True:
+            confl = self._propagate()
+
+            if confl is not None:
+                self.BACKTRACK_COUNT += 1
+                restart_conflicts += 1
+
+                if 0 == self.decision_level:
+                    self.ok = False
+                    self.core = []
+                    return False
+
+                (learnt, bt_level, lbd) = self._analyze(confl)
+                self._cancelUntil(bt_level)
+
+                if 1 == len(learnt):
+                    self._enqueue(learnt[0], None)
+                else:
+                    self.learnts.append(learnt)
+                    self.learnt_info[id(learnt)] = [self.cla_inc, lbd]
+                    self._watch(learnt)
+                    self._enqueue(learnt[0], learnt)
+
+                self.var_inc /= VAR_DECAY
+                self.cla_inc /= CLAUSE_DECAY
+
+            else:
+                checks += 1
+                if self.TIMEOUT and 0 == (checks & 255) and (time.time() - self.start_time) > self.TIMEOUT:
+                    self.timedout = True
+                    self._cancelUntil(0)
+                    return None
+
+                if restart_limit and restart_conflicts >= restart_limit:
+                    self.RESTART_COUNT += 1
+                    restart_num += 1
+                    restart_limit = self._restartLimit(restart_num)
+                    restart_conflicts = 0
+                    self._cancelUntil(0)
+                    continue
+
+                if len(self.learnts) - len(self.trail) >= self.max_learnts:
+                    self._reduceDB()
+                    self.max_learnts = int(self.max_learnts * 1.1)
+
+                # Assumptions are decided first, one per decision level
+                lit = None
+                while self.decision_level < len(assumptions):
+                    p = assumptions[self.decision_level]
+                    if 1 == self.val[p]:
+                        self.trail_lim.append(len(self.trail))
+                    elif -1 == self.val[p]:
+                        self.core = self._analyzeFinal(p)
+                        self._cancelUntil(0)
+                        return False
+                    else:
+                        lit = p
+                        break
+
+                if lit is None:
+                    lit = self._pickBranchLit()
+
+                if lit is None:
+                    self.model = [v if 1 == self.val[v] else -v for v in range(1, self.num_vars + 1)]
+                    self._cancelUntil(0)
+                    return True
+
+                self._decide(lit)
+
+    def print_stats(self):
+        print ("Nodes Expanded: " + str(self.NODE_COUNT))
+        print ("# of Backtracks: " + str(self.BACKTRACK_COUNT))
+        print ("Max Depth: " + str(self.MAX_DEPTH))
+        print ("Avg Depth: " + str(float(self.SUM_DEPTH) / max(self.NODE_COUNT, 1)))
+        print ("Restarts: " + str(self.RESTART_COUNT))
+        print ("Propagations: " + str(self.PROPAGATIONS))
+        print ("Learned Clauses: " + str(len(self.learnts)) + " (" + str(self.DELETED_COUNT) + " deleted)")
+
+    #--- Search internals
+
+    def _restartLimit(self, num):
+        if 'luby' == self.restarts:
+            return RESTART_BASE * luby(num)
+        elif 'geometric' == self.restarts:
+            return int(RESTART_BASE * (RESTART_GROWTH ** num))
+        else:
+            return 0
+
+    def _watch(self, clause):
+        self.watches[clause[0]].append(clause)
+        self.watches[clause[1]].append(clause)
+
+    def _enqueue(self, lit, reason):
+        var = abs(lit)
+        self.val[lit] = 1
+        self.val[-lit] = -1
+        self.level[var] = len(self.trail_lim)
+        self.reason[var] = reason
+        self.trail.append(lit)
+
+    def _decide(self, lit):
+        self.trail_lim.append(len(self.trail))
+        depth = len(self.trail_lim)
+
+        self.NODE_COUNT += 1
+        self.SUM_DEPTH += depth
+        if depth > self.MAX_DEPTH:
+            self.MAX_DEPTH = depth
+
+        if self.debug:
+            print ("Variable and setting picked: " + str(lit))
+
+        self._enqueue(lit, None)
+
+    def _propagate(self):
+        """Unit propagate the trail, returning a conflicting clause or None."""
+        val = self.val
+        watches = self.watches
+        trail = self.trail
+        level = self.level
+        reason = self.reason
+        dl = len(self.trail_lim)
+
+        while self.qhead < len(trail):
+            false_lit = -trail[self.qhead]
+            self.qhead += 1
+            self.PROPAGATIONS += 1
+
+            ws = watches[false_lit]
+            size = len(ws)
+            i = j = 0
+            while i < size:
+                c = ws[i]
+                i += 1
+
+                # Keep the falsified watch in position 1
+                if c[0] == false_lit:
+                    c[0] = c[1]
+                    c[1] = false_lit
+                first = c[0]
+
+                if 1 == val[first]:
+                    ws[j] = c
+                    j += 1
+                    continue
+
+                # Look for a replacement watch
+                for k in range(2, len(c)):
+                    lk = c[k]
+                    if -1 != val[lk]:
+                        c[1] = lk
+                        c[k] = false_lit
+                        watches[lk].append(c)
+                        break
+                else:
+                    ws[j] = c
+                    j += 1
+
+                    if -1 == val[first]:
+                        # Conflict -- keep the remaining watches and stop
+                        while i < size:
+                            ws[j] = ws[i]
+                            j += 1
+                            i += 1
+                        del ws[j:]
+                        self.qhead = len(trail)
+                        return c
+
+                    val[first] = 1
+                    val[-first] = -1
+                    var = abs(first)
+                    level[var] = dl
+                    reason[var] = c
+                    trail.append(first)
+
+            del ws[j:]
+
+        return None
+
+    def _analyze(self, confl):
+        """
+        Derive the first UIP clause from a conflict. Returns the learned
+        clause (asserting literal first), the level to jump back to, and
+        the clause's LBD.
+        """
+        seen = self.seen
+        level = self.level
+        reason = self.reason
+        trail = self.trail
+        dl = len(self.trail_lim)
+
+        learnt = [0]
+        path_count = 0
+        p = 0
+        index = len(trail) - 1
+        cls = confl
+
+        while True:
+            if id(cls) in self.learnt_info:
+                self._bumpClause(cls)
+
+            for q in (cls if 0 == p else cls[1:]):
+                var = abs(q)
+                if not seen[var] and level[var] > 0:
+                    self._bumpVar(var)
+                    seen[var] = True
+                    if level[var] >= dl:
+                        path_count += 1
+                    else:
+                        learnt.append(q)
+
+            # Walk back to the next marked literal on the trail
+            while not seen[abs(trail[index])]:
+                index -= 1
+            p = trail[index]
+            index -= 1
+            cls = reason[abs(p)]
+            seen[abs(p)] = False
+            path_count -= 1
+            if 0 == path_count:
+                break
+
+        learnt[0] = -p
+
+        # Drop literals implied by the rest of the clause
+        marked = [abs(q) for q in learnt[1:]]
+        kept = [learnt[0]]
+        for q in learnt[1:]:
+            r = reason[abs(q)]
+            if r is None:
+                kept.append(q)
+                continue
+            for other in r[1:]:
+                ov = abs(other)
+                if not seen[ov] and level[ov] > 0:
+                    kept.append(q)
+                    break
+        learnt = kept
+        for var in marked:
+            seen[var] = False
+
+        # Put a literal of the highest remaining level in the second watch
+        if 1 == len(learnt):
+            bt_level = 0
+        else:
+            best = 1
+            for i in range(2, len(learnt)):
+                if level[abs(learnt[i])] > level[abs(learnt[best])]:
+                    best = i
+            learnt[1], learnt[best] = learnt[best], learnt[1]
+            bt_level = level[abs(learnt[1])]
+
+        lbd = len(set([level[abs(q)] for q in learnt]))
+
+        return (learnt, bt_level, lbd)
+
+    def _analyzeFinal(self, lit):
+        """Return the assumptions that imply the negation of assumption lit."""
+        seen = self.seen
+        core = [lit]
+        if 0 == self.decision_level:
+            return core
+
+        seen[abs(lit)] = True
+        for i in range(len(self.trail) - 1, self.trail_lim[0] - 1, -1):
+            x = self.trail[i]
+            var = abs(x)
+            if seen[var]:
+                r = self.reason[var]
+                if r is None:
+                    # Only assumptions are decided below the conflict
+                    # (including -lit itself, when it was assumed too)
+                    core.append(x)
+                else:
+                    for q in r[1:]:
+                        if self.level[abs(q)] > 0:
+                            seen[abs(q)] = True
+                seen[var] = False
+        seen[abs(lit)] = False
+
+        return core
+
+    def _cancelUntil(self, target):
+        if len(self.trail_lim) <= target:
+            return
+
+        val = self.val
+        reason = self.reason
+        polarity = self.polarity
+        order = self.order
+        stop = self.trail_lim[target]
+
+        for i in range(len(self.trail) - 1, stop - 1, -1):
+            lit = self.trail[i]
+            var = abs(lit)
+            val[lit] = 0
+            val[-lit] = 0
+            reason[var] = None
+            polarity[var] = lit > 0
+            order.insert(var)
+            if var < self.static_ptr:
+                self.static_ptr = var
+
+        del self.trail[stop:]
+        del self.trail_lim[target:]
+        self.qhead = len(self.trail)
+
+    def _pickBranchLit(self):
+        val = self.val
+        var = 0
+
+        if 'random' == self.voh:
+            for attempt in range(16):
+                v = self.rng.randint(1, self.num_vars)
+                if 0 == val[v]:
+                    var = v
+                    break
+
+        if 0 == var and 'static' == self.voh:
+            while self.static_ptr <= self.num_vars and 0 != val[self.static_ptr]:
+                self.static_ptr += 1
+            if self.static_ptr <= self.num_vars:
+                var = self.static_ptr
+
+        while 0 == var and len(self.order) > 0:
+            v = self.order.pop()
+            if 0 == val[v]:
+                var = v
+
+        if 0 == var:
+            return None
+
+        if 'random' == self.voh:
+            return self.rng.choice([-1, 1]) * var
+        elif self.polarity[var]:
+            return var
+        else:
+            return -var
+
+    def _bumpVar(self, var):
+        act = self.activity
+        act[var] += self.var_inc
+        if act[var] > 1e100:
+            for v in range(1, self.num_vars + 1):
+                act[v] *= 1e-100
+            self.var_inc *= 1e-100
+        self.order.increased(var)
+
+    def _bumpClause(self, cls):
+        info = self.learnt_info[id(cls)]
+        info[0] += self.cla_inc
+        if info[0] > 1e20:
+            for other in self.learnt_info.values():
+                other[0] *= 1e-20
+            self.cla_inc *= 1e-20
+
+    def _locked(self, cls):
+        var = abs(cls[0])
+        return self.reason[var] is cls and 1 == self.val[cls[0]]
+
+    def _reduceDB(self):
+        """Delete the less useful half of the learned clauses."""
+        info = self.learnt_info
+        ranked = sorted(self.learnts, key = lambda c: (-info[id(c)][1], info[id(c)][0]))
+
+        limit = len(ranked) // 2
+        keep = []
+        removed = set()
+        for (i, c) in enumerate(ranked):
+            if i < limit and info[id(c)][1] > GLUE_LBD and len(c) > 2 and not self._locked(c):
+                removed.add(id(c))
+            else:
+                keep.append(c)
+
+        if not removed:
+            return
+
+        for ws in self.watches:
+            if ws:
+                ws[:] = [c for c in ws if id(c) not in removed]
+        for c in ranked:
+            if id(c) in removed:
+                del info[id(c)]
+
+        self.DELETED_COUNT += len(removed)
+        self.learnts = keep
+
+
+class IncrementalSolver:
+    """
+    Incremental SAT interface to a live Formula. Clauses added to the
+    formula (directly or through this object) are loaded into the
+    underlying CDCL solver before the next call to solve, and everything
+    the solver has learned is kept from one call to the next.
+
+    Assumptions and cores can be given either as DIMACS integers or as
+    Variable / Not literals of the formula, and the core is returned in
+    the same form the assumptions were given in.
+    """
+
+    def __init__(self, theory = None, **kwargs):
+        if theory is None:
+            theory = Formula()
+        self.theory = theory
+        self.solver = CDCL(None, **kwargs)
+        self.loaded = 0
+
+    @property
+    def model(self):
+        return self.solver.model
+
+    @property
+    def ok(self):
+        return self.solver.ok
+
+    def addClause(self, cls):
+        """Add a clause of Variable / Not literals to the formula."""
+        self.theory.addClause(cls)
+
+    def addIntClause(self, lits):
+        """Add a clause of DIMACS integers to the formula."""
+        self.theory.addIntClause(lits)
+
+    def sync(self):
+        """Load the clauses added to the formula since the last call."""
+        self.solver.growTo(self.theory.num_vars)
+        for i in range(self.loaded, self.theory.num_clauses):
+            self.solver.addClause(self.theory.getIntClause(i))
+        self.loaded = self.theory.num_clauses
+
+    def solve(self, assumptions = None):
+        """
+        Solve the formula under the assumption literals. Returns True,
+        False or None (timeout) just as CDCL.solve does.
+        """
+        self.sync()
+
+        given = {}
+        lits = []
+        for a in (assumptions or []):
+            if isinstance(a, int):
+                lit = a
+            else:
+                lit = self.theory.intLiteral(a)
+            given.setdefault(lit, a)
+            lits.append(lit)
+
+        result = self.solver.solve(lits)
+
+        self.core = None
+        if result is False:
+            self.core = [given[lit] for lit in self.solver.core]
+
+        return result
+
+    def getModel(self):
+        """Return the last model as a dict from Variable to bool."""
+        if self.solver.model is None:
+            return None
+        unmapping = self.theory.unmapping
+        return {unmapping[abs(l)]: l > 0 for l in self.solver.model if abs(l) < len(unmapping)}
+
+
+if __name__ == '__main__':
+    from krrt.utils import get_opts
+    import os
+    myargs, flags = get_opts()
+
+    if '-i' not in myargs:
+        print ("Must specify input:")
+        print (USAGE_STRING)
+        os._exit(1)
+
+    timeout = 120
+    if '-timeout' in myargs:
+        timeout = int(myargs['-timeout'])
+
+    voh = 'vsids'
+    if '-voh' in myargs:
+        voh = myargs['-voh']
+
+    restarts = 'luby'
+    if '-restarts' in myargs:
+        restarts = myargs['-restarts']
+
+    seed = None
+    if '-seed' in myargs:
+        seed = int(myargs['-seed'])
+
+    solver = CDCL(myargs['-i'], timeout = timeout, voh = voh, restarts = restarts,
+                  seed = seed, debug = 'DEBUG' in flags)
+    result = solver.solve()
+
+    if 'DISABLE_RESULTS' not in flags:
+        solver.print_stats()
+
+    print ("\n\nSolution:")
+    if result is None:
+        print (" -timeout- ")
+    elif result:
+        print (solver.model)
+    else:
+        print (" -unsatisfiable- ")
@@ -1,6 +1,126 @@
-from krrt.utils import write_file
-
-class Formula:
+import io
+from array import array
+from bisect import bisect_left, insort
+from itertools import islice
+
+from krrt.utils import write_file, open_file
+
+# Number of clause lines joined together for each write when streaming
+WRITE_BATCH = 8192
+
+# Type code of the 64 bit arrays of the compact formulas: python 2 has no
+# array('q'), but its array('l') is 64 bit on LP64 platforms
+try:
+    INT64 = array('q').typecode
+except ValueError:
+    INT64 = 'l'
+
+def writeDimacs(sourceFile, header, lines, compress = None):
+    """
+    Stream a DIMACS style file out to sourceFile, which can either be a
+    file name or a writable stream. The header is a list of lines, and
+    lines is an iterable of clause lines written WRITE_BATCH at a time.
+    """
+    if hasattr(sourceFile, 'write'):
+        out = sourceFile
+    else:
+        out = open_file(sourceFile, 'w', compress)
+
+    binary = isinstance(out, (io.RawIOBase, io.BufferedIOBase))
+    def emit(text):
+        if binary:
+            out.write(text.encode())
+        else:
+            out.write(text)
+
+    emit('\n'.join(header) + '\n')
+
+    lines = iter(lines)
+    batch = list(islice(lines, WRITE_BATCH))
+    while batch:
+        batch.append('')
+        emit('\n'.join(batch))
+        batch = list(islice(lines, WRITE_BATCH))
+
+    if out is not sourceFile:
+        out.close()
+
+
+def orderedClauseWidth(var_sets, order, num_vars, avg = False):
+    """
+    Return the clause width (see Formula.getClauseWidth) of the clauses,
+    given as sets of variable numbers, when placed in the given order.
+    """
+    first = [-1] * (num_vars + 1)
+    last = [-1] * (num_vars + 1)
+    for (pos, ci) in enumerate(order):
+        for v in var_sets[ci]:
+            if -1 == first[v]:
+                first[v] = pos
+            last[v] = pos
+
+    widths = [l - f for (f, l) in zip(first, last)]
+    if avg:
+        return float(sum(widths)) / float(max(num_vars, 1))
+    else:
+        return max(widths)
+
+
+class ClauseWidthTracker:
+    """
+    Keeps the clause width of an ordering up to date as clauses are
+    swapped. Every variable has the sorted list of positions it occurs
+    at, so a swap only touches the variables in one clause but not the
+    other. The total width is kept as a running sum, and the max width
+    through a histogram of the variable widths.
+    """
+
+    def __init__(self, var_sets, order, num_vars):
+        self.var_sets = var_sets
+        self.order = list(order)
+        self.positions = [[] for i in range(num_vars + 1)]
+        for (pos, ci) in enumerate(self.order):
+            for v in var_sets[ci]:
+                self.positions[v].append(pos)
+
+        self.widths = [(p[-1] - p[0]) if p else 0 for p in self.positions]
+        self.total = sum(self.widths)
+        self.histogram = [0] * (len(self.order) + 1)
+        for w in self.widths:
+            self.histogram[w] += 1
+        self.max_width = max(self.widths)
+
+    def swap(self, i, j):
+        """Swap the clauses at positions i and j."""
+        a = self.var_sets[self.order[i]]
+        b = self.var_sets[self.order[j]]
+        for v in a:
+            if v not in b:
+                self._move(v, i, j)
+        for v in b:
+            if v not in a:
+                self._move(v, j, i)
+        self.order[i], self.order[j] = self.order[j], self.order[i]
+
+    def _move(self, v, old, new):
+        p = self.positions[v]
+        del p[bisect_left(p, old)]
+        insort(p, new)
+
+        width = p[-1] - p[0]
+        previous = self.widths[v]
+        if width != previous:
+            self.widths[v] = width
+            self.total += width - previous
+            self.histogram[previous] -= 1
+            self.histogram[width] += 1
+            if width > self.max_width:
+                self.max_width = width
+            while self.max_width > 0 and 0 == self.histogram[self.max_width]:
+                self.max_width -= 1
+
+
+class Formula(object):
     def __init__(self, clauses = None):
         self.clauses = []
         self.mapping = {}
@@ -57,6 +177,46 @@ class Formula:
         self.unmapping.append(var)
         self.varnum += 1
 
+    def reserveVariables(self, count):
+        """
+        Make sure the variables 1..count exist. Any missing ones are
+        created as Variable(i), so DIMACS numbering is kept intact.
+        """
+        while self.varnum <= count:
+            var = Variable(self.varnum)
+            assert var not in self.mapping, "Variable %s already mapped to %d" % (str(var), self.mapping[var])
+            self.addVariable(var)
+
+    def intLiteral(self, lit):
+        """Return the DIMACS integer for a Variable / Not literal."""
+        if isinstance(lit, Not):
+            return -self.mapping[lit.obj]
+        return self.mapping[lit]
+
+    def objLiteral(self, num):
+        """Return the Variable / Not literal for a DIMACS integer."""
+        if num < 0:
+            return Not(self.unmapping[-num])
+        return self.unmapping[num]
+
+    def addIntClause(self, lits):
+        """Add a new clause given as a list of DIMACS integers"""
+        self.reserveVariables(max([abs(l) for l in lits] + [0]))
+        self.addClause([self.objLiteral(l) for l in lits])
+
+    def getIntClause(self, index):
+        """Return clause number index as a list of DIMACS integers."""
+        return [self.intLiteral(lit) for lit in self.clauses[index]]
+
+    def setIntClauses(self, clauses):
+        """Replace all of the clauses with lists of DIMACS integers."""
+        self.clauses = [set([self.objLiteral(l) for l in cls]) for cls in clauses]
+
+    def iterIntClauses(self):
+        """Iterate over the clauses as lists of DIMACS integers."""
+        for cls in self.clauses:
+            yield [self.intLiteral(lit) for lit in cls]
+
     def getUnitClauses(self):
         """Return all of the unit clauses in the CNF representation."""
         return filter(lambda x: 1 == len(x), self.clauses)
@@ -73,44 +233,39 @@ class Formula:
         or average over all variable widths. This function can optionally
         be called with 'avg = True' to return the average variation
         of clause width.
-        """
-        max = 0
-        for var in self.variables:
-            low_index = -1
-            high_index = -1
-            for clsNum in range(self.num_clauses):
-                if (var in self.clauses[clsNum]) or (Not(var) in self.clauses[clsNum]):
-                    if low_index == -1:
-                        low_index = clsNum
-
-                    high_index = clsNum
-
-            if avg:
-                max += high_index - low_index
-            else:
-                if (high_index - low_index) > max:
-                    max = high_index - low_index
 
-        if avg:
-            return float(max) / float(self.num_vars)
-        else:
-            return max
+        The first / last occurrence of every variable is found in a single
+        pass over the clauses.
+        """
+        var_sets = self._clauseVarSets()
+        return orderedClauseWidth(var_sets, range(len(var_sets)), self.num_vars, avg)
 
-    def minimizeClauseWidth(self, method = 'all', invert = False, avg = False):
+    def minimizeClauseWidth(self, method = 'all', invert = False, avg = False,
+                            iterations = 200, steps = None, seed = None):
         """
         Minimize the clause width of the CNF syntactic representation
         Parameters:
             method: Which method of minimization should be used. Currently
-                    supported for 'all', 'random', and 'litsort'
+                    supported for 'all', 'random', 'litsort', 'bfs' and
+                    'annealing'
 
             invert: If true, maximize the clause width
 
             avg:    Use the avg clause width rather than the max
 
+            iterations: Number of shuffles tried by the random method
+
+            steps:  Number of swaps tried by the annealing method (defaults
+                    to 10 per clause, up to 200000)
+
+            seed:   Seed for the random and annealing methods
+
 
         Methods:
-            all:        Take the best minimization (or maximization) over all
-                        methods available.
+            all:        Take the best minimization (or maximization) over the
+                        litsort, bfs and annealing methods. The random method
+                        is left out, as each of its iterations is a full pass
+                        over the clauses.
 
             random:     Randomly sort the clauses 200 times and pick the best
                         sorting
@@ -118,97 +273,180 @@ class Formula:
             litsort:    Sort the clauses based on the smallest variable in each
                         clause. This is a crude heuristic that has the effect
                         of minimizing the clause-width
-        """
-        if 'all' == method:
-            self._minimizeClauseWidth_Random(invert, avg)
-            self._minimizeClauseWidth_LitSort(invert, avg)
-        elif 'random' == method:
-            self._minimizeClauseWidth_Random(invert, avg)
-        elif 'litsort' == method:
-            self._minimizeClauseWidth_LitSort(invert, avg)
-        else:
-            print ("Error: Unknown clause-width minimization technique -- " + method)
 
+            bfs:        Order the clauses by a breadth first search of the
+                        clause / variable hypergraph, starting from a
+                        pseudo-peripheral clause (Cuthill-McKee style).
 
-
-    def _minimizeClauseWidth_Random(self, invert, avg):
+            annealing:  Simulated annealing over clause swaps, starting from
+                        the current order. Each swap is scored incrementally
+                        with a ClauseWidthTracker.
+        """
         import random
+        rng = random.Random(seed)
 
-        best_list = self.clauses
-        best_score = self.getClauseWidth(avg=avg)
+        var_sets = self._clauseVarSets()
 
-        self.clauses = []
-        for each in best_list:
-            self.clauses.append(each)
+        if 'all' == method:
+            methods = ['litsort', 'bfs', 'annealing']
+        elif method in ['random', 'litsort', 'bfs', 'annealing']:
+            methods = [method]
+        else:
+            print ("Error: Unknown clause-width minimization technique -- " + method)
+            return
 
-        for i in range(200):
-            random.shuffle(self.clauses)
+        best_order = list(range(len(var_sets)))
+        best_score = orderedClauseWidth(var_sets, best_order, self.num_vars, avg)
 
-            score = self.getClauseWidth(avg=avg)
+        for m in methods:
+            if 'random' == m:
+                order = self._minimizeClauseWidth_Random(var_sets, invert, avg, iterations, rng)
+            elif 'litsort' == m:
+                order = self._minimizeClauseWidth_LitSort(var_sets)
+            elif 'bfs' == m:
+                order = self._minimizeClauseWidth_BFS(var_sets)
+            else:
+                order = self._minimizeClauseWidth_Annealing(var_sets, best_order, invert, avg, steps, rng)
 
-            #print "Score:" + str(score)
+            score = orderedClauseWidth(var_sets, order, self.num_vars, avg)
 
             if (invert and score > best_score) or (not invert and score < best_score):
-                best_list = self.clauses
+                best_order = order
                 best_score = score
 
-                self.clauses = []
-                for each in best_list:
-                    self.clauses.append(each)
+        self._reorderClauses(best_order)
 
-        self.clauses = best_list
+    def _clauseVarSets(self):
+        return [set([abs(l) for l in cls]) for cls in self.iterIntClauses()]
 
-    def _minimizeClauseWidth_LitSort(self, invert, avg):
+    def _reorderClauses(self, order):
+        clauses = self.clauses
+        self.clauses = [clauses[i] for i in order]
 
-        def sortClause(cls1, cls2):
-            return minLit(cls1) - minLit(cls2)
+    def _minimizeClauseWidth_Random(self, var_sets, invert, avg, iterations, rng):
 
-        def minLit(clause):
-            return min([self.mapping[lit.var] for lit in clause])
+        order = list(range(len(var_sets)))
+        best_order = list(order)
+        best_score = orderedClauseWidth(var_sets, order, self.num_vars, avg)
 
-        best_list = self.clauses
-        best_score = self.getClauseWidth(avg=avg)
+        for i in range(iterations):
+            rng.shuffle(order)
 
-        self.clauses = []
-        for each in best_list:
-            self.clauses.append(each)
-
-        self.clauses.sort(sortClause)
-        score = self.getClauseWidth(avg=avg)
+            score = orderedClauseWidth(var_sets, order, self.num_vars, avg)
 
-        #print "Sorted Score:" + str(score)
+            if (invert and score > best_score) or (not invert and score < best_score):
+                best_order = list(order)
+                best_score = score
 
-        if (invert and score > best_score) or (not invert and score < best_score):
-            best_list = self.clauses
-            best_score = score
+        return best_order
+
+    def _minimizeClauseWidth_LitSort(self, var_sets):
+        return sorted(range(len(var_sets)), key = lambda i: min(var_sets[i] or [0]))
+
+    def _minimizeClauseWidth_BFS(self, var_sets):
+
+        occurrences = [[] for i in range(self.num_vars + 1)]
+        for (ci, vs) in enumerate(var_sets):
+            for v in vs:
+                occurrences[v].append(ci)
+
+        def bfs(start, visited, expanded):
+            order = [start]
+            visited[start] = True
+            head = 0
+            while head < len(order):
+                ci = order[head]
+                head += 1
+                for v in sorted(var_sets[ci], key = lambda v: len(occurrences[v])):
+                    if expanded[v]:
+                        continue
+                    expanded[v] = True
+                    for cj in occurrences[v]:
+                        if not visited[cj]:
+                            visited[cj] = True
+                            order.append(cj)
+            return order
+
+        # Start every component from the far end of a first sweep
+        visited = [False] * len(var_sets)
+        expanded = [False] * (self.num_vars + 1)
+        final_visited = [False] * len(var_sets)
+        final_expanded = [False] * (self.num_vars + 1)
+        order = []
+        for ci in sorted(range(len(var_sets)), key = lambda ci: len(var_sets[ci])):
+            if not final_visited[ci]:
+                sweep = bfs(ci, visited, expanded)
+                order.extend(bfs(sweep[-1], final_visited, final_expanded))
+
+        return order
+
+    def _minimizeClauseWidth_Annealing(self, var_sets, order, invert, avg, steps, rng):
+        import math
+
+        num_clauses = len(var_sets)
+        if num_clauses < 2:
+            return list(order)
+        if steps is None:
+            steps = min(10 * num_clauses, 200000)
+
+        tracker = ClauseWidthTracker(var_sets, order, self.num_vars)
+        sign = -1 if invert else 1
+
+        def cost():
+            if avg:
+                return sign * tracker.total
+            # The sum breaks ties on the plateaus of the max
+            return sign * (tracker.max_width * (self.num_vars + 1) + tracker.total)
+
+        current = cost()
+        best = current
+        best_order = list(tracker.order)
+
+        temperature = max(1.0, abs(current) / float(num_clauses))
+        epoch = max(1, steps // 50)
+        window = max(2, min(num_clauses, 64))
+
+        for step in range(steps):
+            i = rng.randrange(num_clauses)
+            j = min(num_clauses - 1, max(0, i + rng.randint(-window, window)))
+            if i == j:
+                continue
+
+            tracker.swap(i, j)
+            new = cost()
+            delta = new - current
+            if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+                current = new
+            else:
+                tracker.swap(i, j)
 
-            self.clauses = []
-            for each in best_list:
-                self.clauses.append(each)
+            if 0 == (step + 1) % epoch:
+                temperature *= 0.9
+                if current < best:
+                    best = current
+                    best_order = list(tracker.order)
 
-        self.clauses = best_list
+        if current < best:
+            best_order = list(tracker.order)
 
-    def writeCNF(self, sourceFile):
-        output = ''
-        output += 'c\n'
-        output += 'c SAT instance in DIMACS CNF input format.\n'
-        for comment in self.comments:
-            output += 'c ' + comment + '\n'
-        output += 'c\n'
-        output += "p cnf %d %d" % (self.num_vars, self.num_clauses)
-        output += '\n'
+        return best_order
 
-        for cls in self.clauses:
-            for lit in cls:
-                if isinstance(lit, Not):
-                    output += "-%d" % self.mapping[lit.obj]
-                else:
-                    output += "%d" % self.mapping[lit]
-                output += ' '
+    def writeCNF(self, sourceFile, compress = None):
+        """
+        Write the theory in DIMACS CNF format. The sourceFile can be a file
+        name or any writable stream, and the clauses are streamed out in
+        batches so the full text is never held in memory. Compression is
+        enabled with compress ('gzip', 'bz2', 'lzma' or True for gzip) or
+        by a .gz / .bz2 / .xz file name.
+        """
+        header = ['c', 'c SAT instance in DIMACS CNF input format.']
+        header.extend(['c ' + comment for comment in self.comments])
+        header.append('c')
+        header.append("p cnf %d %d" % (self.num_vars, self.num_clauses))
 
-            output += '0\n'
+        lines = (' '.join(map(str, cls + [0])) for cls in self.iterIntClauses())
 
-        write_file(sourceFile, output)
+        writeDimacs(sourceFile, header, lines, compress)
 
     def writeMapping(self, sourceFile):
         write_file(sourceFile, ["%d %s" % (k,v) for (k,v) in sorted([(self.mapping[var], str(var)) for var in self.variables])])
@@ -251,6 +489,24 @@ class WeightedFormula(Formula):
 
         self.clauses.append((new_clause, weight))
 
+    def addIntClause(self, lits, weight):
+        """Add a new clause given as a list of DIMACS integers"""
+        self.reserveVariables(max([abs(l) for l in lits] + [0]))
+        self.addClause([self.objLiteral(l) for l in lits], weight)
+
+    def setIntClauses(self, clauses):
+        assert False, "Replacing the clauses of a %s would drop their weights" % self.__class__.__name__
+
+    def iterIntClauses(self):
+        """Iterate over the clauses as lists of DIMACS integers."""
+        for (cls, weight) in self.clauses:
+            yield [self.intLiteral(lit) for lit in cls]
+
+    def iterIntWeightedClauses(self):
+        """Iterate over the (DIMACS integer clause, weight) pairs."""
+        for (cls, weight) in self.clauses:
+            yield ([self.intLiteral(lit) for lit in cls], weight)
+
     def getUnitClauses(self):
         """Return all of the unit clauses in the CNF representation."""
         return filter(lambda x: 1 == len(x[0]), self.clauses)
@@ -263,30 +519,19 @@ class WeightedFormula(Formula):
         """Return all of the soft clauses in the theory."""
         return filter(lambda x: -1 != x[1], self.clauses)
 
-    def writeCNF(self, sourceFile):
-        output = ''
-        output += 'c\n'
-        output += 'c SAT instance in DIMACS CNF input format.\n'
-        output += 'c\n'
-        output += "p wcnf %d %d %d" % (self.num_vars, self.num_clauses, self.top_weight)
-        output += '\n'
-
-        for (cls, weight) in self.clauses:
-            if -1 == weight:
-                output += "%d " % self.top_weight
-            else:
-                output += "%d " % weight
-
-            for lit in cls:
-                if isinstance(lit, Not):
-                    output += "-%d" % self.mapping[lit.obj]
-                else:
-                    output += "%d" % self.mapping[lit]
-                output += ' '
+    def writeCNF(self, sourceFile, compress = None):
+        """Write the theory in (streamed) DIMACS WCNF format."""
+        TOPW = self.top_weight
+        header = ['c', 'c SAT instance in DIMACS CNF input format.', 'c']
+        header.append("p wcnf %d %d %d" % (self.num_vars, self.num_clauses, TOPW))
 
-            output += '0\n'
+        def gen_lines():
+            for (cls, weight) in self.iterIntWeightedClauses():
+                if -1 == weight:
+                    weight = TOPW
+                yield ' '.join(map(str, [weight] + cls + [0]))
 
-        write_file(sourceFile, output)
+        writeDimacs(sourceFile, header, gen_lines(), compress)
 
 
 class OptimizedWeightedFormula(WeightedFormula):
@@ -323,6 +568,30 @@ class OptimizedWeightedFormula(WeightedFormula):
         else:
             self.hard_clauses.append(cls)
 
+    def addIntClause(self, lits, weight = None):
+        """Add a new clause given as a list of DIMACS integers"""
+        self.addClause(lits, weight)
+
+    def _reorderClauses(self, order):
+        # The order indexes iterIntClauses, which lists the hard clauses first
+        hard = len(self.hard_clauses)
+        self.hard_clauses = [self.hard_clauses[i] for i in order if i < hard]
+        self.clauses = [self.clauses[i - hard] for i in order if i >= hard]
+
+    def iterIntClauses(self):
+        """Iterate over the clauses as lists of DIMACS integers."""
+        for cls in self.hard_clauses:
+            yield list(cls)
+        for (cls, weight) in self.clauses:
+            yield list(cls)
+
+    def iterIntWeightedClauses(self):
+        """Iterate over the (DIMACS integer clause, weight) pairs."""
+        for cls in self.hard_clauses:
+            yield (list(cls), -1)
+        for (cls, weight) in self.clauses:
+            yield (list(cls), weight)
+
     def getUnitClauses(self):
         """Return all of the unit clauses in the CNF representation."""
         return filter(lambda x: 1 == len(x[0]), self.getHardClauses() + self.getSoftClauses())
@@ -335,31 +604,18 @@ class OptimizedWeightedFormula(WeightedFormula):
         """Return all of the soft clauses in the theory."""
         return self.clauses
 
-    def writeCNF(self, sourceFile, hard = False):
-        output = ''
-        output += 'c\n'
-        output += 'c SAT instance in DIMACS CNF input format.\n'
-        output += 'c\n'
+    def writeCNF(self, sourceFile, hard = False, compress = None):
+        """
+        Write the theory in (streamed) DIMACS WCNF format, or just the hard
+        clauses in DIMACS CNF format if hard is set.
+        """
         if hard:
-            output += "p cnf %d %d" % (self.num_vars, len(self.hard_clauses))
+            header = ['c', 'c SAT instance in DIMACS CNF input format.', 'c']
+            header.append("p cnf %d %d" % (self.num_vars, len(self.hard_clauses)))
+            lines = ("%s 0" % (' '.join(map(str, cls))) for cls in self.hard_clauses)
+            writeDimacs(sourceFile, header, lines, compress)
         else:
-            output += "p wcnf %d %d %d" % (self.num_vars, self.num_clauses, self.top_weight)
-        output += '\n'
-
-        if hard:
-            for cls in self.hard_clauses:
-                output += "%s 0\n" % (' '.join(map(str, cls)))
-            write_file(sourceFile, output)
-            return
-
-        TOPW = self.top_weight
-        for cls in self.hard_clauses:
-            output += "%d %s 0\n" % (TOPW, ' '.join(map(str, cls)))
-
-        for (cls, weight) in self.clauses:
-            output += "%d %s 0\n" % (weight, ' '.join(map(str, cls)))
-
-        write_file(sourceFile, output)
+            WeightedFormula.writeCNF(self, sourceFile, compress)
 
 
 class LevelWeightedFormula(WeightedFormula):
@@ -378,7 +634,7 @@ class LevelWeightedFormula(WeightedFormula):
     def top_weight(self):
         if not self._top_weight:
             total = 0
-            for level in sorted(self.clauses.keys()):
+            for level in sorted(self.getLevels()):
                 total += self.level_weight(level, total)
             self._top_weight = 1 + total
 
@@ -391,6 +647,10 @@ class LevelWeightedFormula(WeightedFormula):
     def level_weight(self, level, total):
         return sum([(total + cls[1]) for cls in filter(lambda x: -1 != x[1], self.clauses[level])])
 
+    def getLevels(self):
+        """Return the levels that clauses have been added to."""
+        return list(self.clauses.keys())
+
     def copy(self):
         """Return a deep copy of the CNF representation."""
         new_clauses = []
@@ -422,6 +682,35 @@ class LevelWeightedFormula(WeightedFormula):
         else:
             self.clauses[level].append((new_clause, weight))
 
+    def addIntClause(self, lits, weight, level):
+        """Add a new clause given as a list of DIMACS integers"""
+        self.reserveVariables(max([abs(l) for l in lits] + [0]))
+        self.addClause([self.objLiteral(l) for l in lits], weight, level)
+
+    def _reorderClauses(self, order):
+        # The clauses are kept by level, so the order only applies within each level
+        rows = [(level, row) for level in self.clauses.keys() for row in self.clauses[level]]
+        self.clauses = {}
+        for i in order:
+            (level, row) = rows[i]
+            self.clauses.setdefault(level, []).append(row)
+
+    def iterIntClauses(self):
+        """Iterate over the clauses as lists of DIMACS integers."""
+        for (lits, weight, level) in self.iterIntLevelClauses():
+            yield lits
+
+    def iterIntWeightedClauses(self):
+        """Iterate over the (DIMACS integer clause, weight) pairs."""
+        for (lits, weight, level) in self.iterIntLevelClauses():
+            yield (lits, weight)
+
+    def iterIntLevelClauses(self):
+        """Iterate over the (DIMACS integer clause, weight, level) triples."""
+        for level in self.clauses.keys():
+            for (cls, weight) in self.clauses[level]:
+                yield ([self.intLiteral(lit) for lit in cls], weight, level)
+
     def getUnitClauses(self):
         """Return all of the unit clauses in the CNF representation."""
         return reduce(lambda x,y: x+y, [filter(lambda x: 1 == len(x[0]), self.clauses[level]) for level in self.clauses.keys()])
@@ -434,37 +723,27 @@ class LevelWeightedFormula(WeightedFormula):
         """Return all of the soft clauses in the theory."""
         return reduce(lambda x,y: x+y, [filter(lambda x: -1 != x[1], self.clauses[level]) for level in self.clauses.keys()])
 
-    def writeCNF(self, sourceFile):
-        output = ''
-        output += 'c\n'
-        output += 'c SAT instance in DIMACS CNF input format.\n'
-        output += 'c\n'
-        output += "p wcnf %d %d %d" % (self.num_vars, self.num_clauses, self.top_weight)
-        output += '\n'
+    def writeCNF(self, sourceFile, compress = None):
+        """Write the theory in (streamed) DIMACS WCNF format."""
+        TOPW = self.top_weight
+        header = ['c', 'c SAT instance in DIMACS CNF input format.', 'c']
+        header.append("p wcnf %d %d %d" % (self.num_vars, self.num_clauses, TOPW))
 
         level_weights = {}
         total = 0
-        for level in sorted(self.clauses.keys()):
+        for level in sorted(self.getLevels()):
             level_weights[level] = total
             total += self.level_weight(level, total)
 
-        for level in self.clauses.keys():
-            for (cls, weight) in self.clauses[level]:
+        def gen_lines():
+            for (cls, weight, level) in self.iterIntLevelClauses():
                 if -1 == weight:
-                    output += "%d " % self.top_weight
+                    weight = TOPW
                 else:
-                    output += "%d " % (weight + level_weights[level])
+                    weight += level_weights[level]
+                yield ' '.join(map(str, [weight] + cls + [0]))
 
-                for lit in cls:
-                    if isinstance(lit, Not):
-                        output += "-%d" % self.mapping[lit.obj]
-                    else:
-                        output += "%d" % self.mapping[lit]
-                    output += ' '
-
-                output += '0\n'
-
-        write_file(sourceFile, output)
+        writeDimacs(sourceFile, header, gen_lines(), compress)
 
 
 class OptimizedLevelWeightedFormula(LevelWeightedFormula):
@@ -511,6 +790,24 @@ class OptimizedLevelWeightedFormula(LevelWeightedFormula):
 
         self.clauses[level].append((cls, weight))
 
+    def addIntClause(self, lits, weight = 1, level = -1):
+        """Add a new clause given as a list of DIMACS integers"""
+        self.addClause(lits, weight, level)
+
+    def _reorderClauses(self, order):
+        # iterIntLevelClauses lists the hard clauses first
+        hard = len(self.hard_clauses)
+        self.hard_clauses = [self.hard_clauses[i] for i in order if i < hard]
+        LevelWeightedFormula._reorderClauses(self, [i - hard for i in order if i >= hard])
+
+    def iterIntLevelClauses(self):
+        """Iterate over the (DIMACS integer clause, weight, level) triples."""
+        for cls in self.hard_clauses:
+            yield (list(cls), -1, -1)
+        for level in self.clauses.keys():
+            for (cls, weight) in self.clauses[level]:
+                yield (list(cls), weight, level)
+
     def getHardClauses(self):
         """Return all of the hard clauses in the theory."""
         return self.hard_clauses
@@ -519,37 +816,268 @@ class OptimizedLevelWeightedFormula(LevelWeightedFormula):
         """Return all of the soft clauses in the theory."""
         return reduce(lambda x,y: x+y, [self.clauses[level] for level in self.clauses.keys()])
 
-    def writeCNF(self, sourceFile, hard=False):
-        output = ''
-        output += 'c\n'
-        output += 'c SAT instance in DIMACS CNF input format.\n'
-        output += 'c\n'
+    def writeCNF(self, sourceFile, hard = False, compress = None):
+        """
+        Write the theory in (streamed) DIMACS WCNF format, or just the hard
+        clauses in DIMACS CNF format if hard is set.
+        """
         if hard:
-            output += "p cnf %d %d" % (self.num_vars, len(self.hard_clauses))
+            header = ['c', 'c SAT instance in DIMACS CNF input format.', 'c']
+            header.append("p cnf %d %d" % (self.num_vars, len(self.hard_clauses)))
+            lines = ("%s 0" % (' '.join(map(str, cls))) for cls in self.hard_clauses)
+            writeDimacs(sourceFile, header, lines, compress)
         else:
-            output += "p wcnf %d %d %d" % (self.num_vars, self.num_clauses, self.top_weight)
-        output += '\n'
+            LevelWeightedFormula.writeCNF(self, sourceFile, compress)
 
-        if hard:
-            for cls in self.hard_clauses:
-                output += "%s 0\n" % (' '.join(map(str, cls)))
-            write_file(sourceFile, output)
-            return
 
-        level_weights = {}
-        total = 0
-        for level in sorted(self.clauses.keys()):
-            level_weights[level] = total
-            total += self.level_weight(level, total)
+class CompactFormula(Formula):
+    """
+    A Formula that stores its clauses as DIMACS integers rather than as
+    sets of Variable / Not objects. All of the literals live in a single
+    flat array('i') buffer, and clause i spans the buffer slice
+    offsets[i]:offsets[i+1]. The object-level clauses are only built
+    when the clauses property is used.
+    """
 
-        for cls in self.hard_clauses:
-            output += "%d %s 0\n" % (self.top_weight, ' '.join(map(str, cls)))
+    def __init__(self, clauses = None):
+        assert 8 == array(INT64).itemsize, "The compact formulas need 64 bit integer arrays"
+        Formula.__init__(self, clauses)
 
-        for level in self.clauses.keys():
-            for (cls, weight) in self.clauses[level]:
-                output += "%d %s 0\n" % (weight + level_weights[level], ' '.join(map(str, cls)))
+    @property
+    def clauses(self):
+        return [self.getClause(i) for i in range(self.num_clauses)]
+
+    @clauses.setter
+    def clauses(self, clauses):
+        self._resetStore()
+        for cls in clauses:
+            self.addClause(cls)
+
+    @property
+    def num_clauses(self):
+        return len(self.offsets) - 1
+
+    def _resetStore(self):
+        self.literals = array('i')
+        self.offsets = array(INT64, [0])
+
+    def _storeClause(self, lits):
+        self.literals.extend(lits)
+        self.offsets.append(len(self.literals))
+
+    def _intClause(self, cls):
+        lits = []
+        for l in cls:
+
+            if isinstance(l, Not):
+                var = Variable(l.obj)
+                sign = -1
+
+            else:
+                var = Variable(l)
+                sign = 1
+
+            if var not in self.mapping:
+                self.addVariable(var)
+
+            lits.append(sign * self.mapping[var])
+
+        # Mirror the set semantics of the object representation
+        return list(dict.fromkeys(lits))
+
+    def copy(self):
+        """Return a deep copy of the CNF representation."""
+        newTheory = self.__class__()
+        newTheory.mapping = dict(self.mapping)
+        newTheory.unmapping = list(self.unmapping)
+        newTheory.varnum = self.varnum
+        newTheory.comments = list(self.comments)
+        newTheory.literals = array('i', self.literals)
+        newTheory.offsets = array(INT64, self.offsets)
+        return newTheory
+
+    def addClause(self, cls):
+        """Add a new clause to the CNF representation"""
+        self._storeClause(self._intClause(cls))
+
+    def addIntClause(self, lits):
+        """Add a new clause given as a list of DIMACS integers"""
+        self.reserveVariables(max([abs(l) for l in lits] + [0]))
+        # Mirror the set semantics of the object representation
+        self._storeClause(list(dict.fromkeys(lits)))
+
+    def getIntClause(self, index):
+        """Return clause number index as a list of DIMACS integers."""
+        return self.literals[self.offsets[index]:self.offsets[index + 1]].tolist()
+
+    def setIntClauses(self, clauses):
+        """Replace all of the clauses with lists of DIMACS integers."""
+        self._resetStore()
+        for cls in clauses:
+            CompactFormula.addIntClause(self, cls)
+
+    def _reorderClauses(self, order):
+        lits = self.literals
+        offsets = self.offsets
+        self.literals = array('i')
+        self.offsets = array(INT64, [0])
+        for i in order:
+            self._storeClause(lits[offsets[i]:offsets[i + 1]])
+
+    def getClause(self, index):
+        """Return clause number index as a set of Variable / Not objects."""
+        return set([self.objLiteral(l) for l in self.getIntClause(index)])
+
+    def iterIntClauses(self):
+        """Iterate over the clauses as lists of DIMACS integers."""
+        lits = self.literals
+        offsets = self.offsets
+        for i in range(len(offsets) - 1):
+            yield lits[offsets[i]:offsets[i + 1]].tolist()
+
+    def getUnitClauses(self):
+        """Return all of the unit clauses in the CNF representation."""
+        offsets = self.offsets
+        return [self.getClause(i) for i in range(self.num_clauses) if 1 == offsets[i + 1] - offsets[i]]
+
+class CompactWeightedFormula(CompactFormula, WeightedFormula):
+    """
+    Compact version of WeightedFormula. Clause weights are kept in a
+    64 bit array parallel to the clause index, with -1 marking a hard clause.
+    """
+
+    def __init__(self, clauses = None):
+        WeightedFormula.__init__(self, clauses)
+
+    @property
+    def clauses(self):
+        return [(self.getClause(i), self.weights[i]) for i in range(self.num_clauses)]
+
+    @clauses.setter
+    def clauses(self, clauses):
+        self._resetStore()
+        for (cls, weight) in clauses:
+            self.addClause(cls, weight)
+
+    @property
+    def top_weight(self):
+        return 1 + sum([w for w in self.weights if -1 != w])
+
+    def _resetStore(self):
+        CompactFormula._resetStore(self)
+        self.weights = array(INT64)
+
+    def copy(self):
+        """Return a deep copy of the CNF representation."""
+        newTheory = CompactFormula.copy(self)
+        newTheory.weights = array(INT64, self.weights)
+        return newTheory
+
+    def addClause(self, cls, weight):
+        """Add a new clause to the CNF representation"""
+        self._storeClause(self._intClause(cls))
+        self.weights.append(weight)
+
+    def addIntClause(self, lits, weight):
+        """Add a new clause given as a list of DIMACS integers"""
+        CompactFormula.addIntClause(self, lits)
+        self.weights.append(weight)
+
+    # CompactFormula comes first in the method resolution order
+    setIntClauses = WeightedFormula.setIntClauses
+
+    def _reorderClauses(self, order):
+        CompactFormula._reorderClauses(self, order)
+        self.weights = array(INT64, [self.weights[i] for i in order])
+
+    def iterIntWeightedClauses(self):
+        """Iterate over the (DIMACS integer clause, weight) pairs."""
+        return zip(self.iterIntClauses(), self.weights)
+
+    def getUnitClauses(self):
+        """Return all of the unit clauses in the CNF representation."""
+        return filter(lambda x: 1 == len(x[0]), self.clauses)
+
+class CompactLevelWeightedFormula(CompactWeightedFormula, LevelWeightedFormula):
+    """
+    Compact version of LevelWeightedFormula. Alongside the weights, the
+    level of every clause is kept in a parallel 64 bit array.
+    """
+
+    def __init__(self, clauses = None):
+        LevelWeightedFormula.__init__(self, clauses)
+
+    @property
+    def clauses(self):
+        clauses = {}
+        for i in range(self.num_clauses):
+            clauses.setdefault(self.levels[i], []).append((self.getClause(i), self.weights[i]))
+        return clauses
+
+    @clauses.setter
+    def clauses(self, clauses):
+        self._resetStore()
+        if isinstance(clauses, dict):
+            clauses = [(cls, weight, level) for level in clauses for (cls, weight) in clauses[level]]
+        for (cls, weight, level) in clauses:
+            self.addClause(cls, weight, level)
+
+    # The flat weighted top weight would otherwise shadow the level based one
+    top_weight = LevelWeightedFormula.top_weight
+
+    def getLevels(self):
+        """Return the levels that clauses have been added to."""
+        return list(self._levelSums().keys())
+
+    def level_weight(self, level, total):
+        (count, weight_sum) = self._levelSums().get(level, (0, 0))
+        return count * total + weight_sum
+
+    def _levelSums(self):
+        # (number of soft clauses, sum of soft weights) for every level
+        if self._level_sums is None:
+            self._level_sums = {}
+            for (weight, level) in zip(self.weights, self.levels):
+                (count, weight_sum) = self._level_sums.get(level, (0, 0))
+                if -1 != weight:
+                    count += 1
+                    weight_sum += weight
+                self._level_sums[level] = (count, weight_sum)
+        return self._level_sums
+
+    def _resetStore(self):
+        CompactWeightedFormula._resetStore(self)
+        self.levels = array(INT64)
+        self._top_weight = False
+        self._level_sums = None
+
+    def copy(self):
+        """Return a deep copy of the CNF representation."""
+        newTheory = CompactWeightedFormula.copy(self)
+        newTheory.levels = array(INT64, self.levels)
+        return newTheory
+
+    def addClause(self, cls, weight, level):
+        """Add a new clause to the CNF representation"""
+        CompactWeightedFormula.addClause(self, cls, weight)
+        self.levels.append(level)
+        self._top_weight = False
+        self._level_sums = None
+
+    def addIntClause(self, lits, weight, level):
+        """Add a new clause given as a list of DIMACS integers"""
+        CompactWeightedFormula.addIntClause(self, lits, weight)
+        self.levels.append(level)
+        self._top_weight = False
+        self._level_sums = None
+
+    def _reorderClauses(self, order):
+        CompactWeightedFormula._reorderClauses(self, order)
+        self.levels = array(INT64, [self.levels[i] for i in order])
 
-        write_file(sourceFile, output)
+    def iterIntLevelClauses(self):
+        """Iterate over the (DIMACS integer clause, weight, level) triples."""
+        return zip(self.iterIntClauses(), self.weights, self.levels)
 
 
 class Variable(object):
@@ -0,0 +1,1021 @@
+import mmap
+import struct
+import sys
+from array import array
+from math import exp, fsum, log, log1p
+
+# math.prod is only in python >= 3.8
+try:
+    from math import prod
+except ImportError:
+    from functools import reduce
+    from operator import mul
+    def prod(xs):
+        return reduce(mul, xs, 1)
+
+from krrt.utils import open_file
+from krrt.sat import CNF
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+LIT = 0
+AND = 1
+OR = 2
+
+# Markers for constant results while transforming a circuit
+_TRUE = -1
+_FALSE = -2
+
+
+#--- Arithmetic for counting
+
+class ExactArithmetic:
+    """Plain Python numbers: exact big integers (or Fractions) for counts."""
+
+    name = 'exact'
+    zero = 0
+    one = 1
+    product = staticmethod(prod)
+    total = staticmethod(sum)
+
+    def weight(self, w):
+        return w
+
+    def mul(self, a, b):
+        return a * b
+
+    def add(self, a, b):
+        return a + b
+
+
+class LogArithmetic:
+    """
+    Natural logs of the values as floats, adding with log-sum-exp. Zero
+    is -inf. Counts never overflow, at the cost of float precision.
+    """
+
+    name = 'log'
+    zero = float('-inf')
+    one = 0.0
+
+    def weight(self, w):
+        return log(w) if w > 0 else self.zero
+
+    def product(self, xs):
+        return fsum(xs)
+
+    def total(self, xs):
+        xs = list(xs)
+        if not xs:
+            return self.zero
+        m = max(xs)
+        if m == self.zero:
+            return self.zero
+        return m + log(fsum([exp(x - m) for x in xs]))
+
+    def mul(self, a, b):
+        return a + b
+
+    def add(self, a, b):
+        if a < b:
+            (a, b) = (b, a)
+        if b == self.zero:
+            return a
+        return a + log1p(exp(b - a))
+
+
+class ModularArithmetic:
+    """Integers modulo a (typically prime) modulus, so values stay small."""
+
+    name = 'mod'
+    zero = 0
+    one = 1
+
+    def __init__(self, modulus = (1 << 61) - 1):
+        self.modulus = modulus
+
+    def weight(self, w):
+        return w % self.modulus
+
+    def product(self, xs):
+        m = self.modulus
+        r = 1
+        for x in xs:
+            r = r * x % m
+        return r
+
+    def total(self, xs):
+        return sum(xs) % self.modulus
+
+    def mul(self, a, b):
+        return a * b % self.modulus
+
+    def add(self, a, b):
+        return (a + b) % self.modulus
+
+
+def getArithmetic(arithmetic):
+    """Turn 'exact', 'log', 'mod' (or an arithmetic object) into an arithmetic object."""
+    if arithmetic is None or 'exact' == arithmetic:
+        return ExactArithmetic()
+    elif 'log' == arithmetic:
+        return LogArithmetic()
+    elif 'mod' == arithmetic:
+        return ModularArithmetic()
+    elif isinstance(arithmetic, str):
+        assert False, "Unknown arithmetic: %s" % arithmetic
+    return arithmetic
+
+
+class Circuit:
+    """
+    A d-DNNF stored as flat arrays in topological order: every node comes
+    after its children, and the root is the last node.
+
+        kinds:      LIT, AND or OR for each node
+        lits:       the literal of each LIT node, as a signed variable index
+        switches:   the switch variable of each OR node (0 if unknown)
+        offsets:    node i has the children children[offsets[i]:offsets[i+1]]
+        children:   child node indices
+
+    True and False are the childless AND and OR nodes. The variables list
+    maps variable indices to Variable objects (index 0 is unused), and
+    allvars is the set of Variables the circuit ranges over, as in dDNNF.
+
+    Every operation is a single loop over the node arrays, so the depth of
+    the circuit does not matter and there is no memo state to reset.
+    Counting assumes a smooth circuit, just like dDNNF.count (see smooth).
+    Weighted counts and all literal marginals come from one bottom-up
+    (sweep) and one top-down (derivatives) pass.
+    """
+
+    def __init__(self, variables, allvars):
+        self.variables = variables
+        self.var_index = {v: i for (i, v) in enumerate(variables) if v is not None}
+        self.allvars = set(allvars)
+        self.kinds = array('b')
+        self.lits = array('i')
+        self.switches = array('i')
+        self.offsets = array('q', [0])
+        self.children = array('i')
+        self._usedvars = None
+        self._slot_cache = None
+
+    @property
+    def num_vars(self):
+        return len(self.variables) - 1
+
+    @property
+    def root(self):
+        return len(self.kinds) - 1
+
+    @property
+    def usedvars(self):
+        if self._usedvars is None:
+            variables = self.variables
+            self._usedvars = set([variables[abs(l)] for (k, l) in zip(self.kinds, self.lits) if LIT == k])
+        return self._usedvars
+
+    def size(self):
+        return len(self.kinds)
+
+    def num_edges(self):
+        return len(self.children)
+
+    def addNode(self, kind, lit = 0, children = (), switch = 0):
+        """Append a node (all children must already exist) and return its index."""
+        self.kinds.append(kind)
+        self.lits.append(lit)
+        self.switches.append(switch)
+        self.children.extend(children)
+        self.offsets.append(len(self.children))
+        self._usedvars = None
+        self._slot_cache = None
+        return len(self.kinds) - 1
+
+    def _switchIndex(self, switch_var):
+        # Parsed circuits carry the switch as a variable number
+        if isinstance(switch_var, int):
+            if 0 < switch_var <= self.num_vars and self.variables[switch_var] is not None \
+               and switch_var == self.variables[switch_var].obj:
+                return switch_var
+            return 0
+        return self.var_index.get(switch_var, 0)
+
+    def childrenOf(self, node):
+        return self.children[self.offsets[node]:self.offsets[node + 1]]
+
+    def is_constant(self):
+        return 0 == self.offsets[-1] - self.offsets[-2] and LIT != self.kinds[-1]
+
+    #--- Conversion
+
+    @staticmethod
+    def from_ddnnf(ddnnf):
+        """Compile a dDNNF object graph into a Circuit, without recursion."""
+        from krrt.sat.dDNNF import Lit, Or
+
+        allvars = set(ddnnf.allvars) | ddnnf.usedvars
+        circuit = Circuit(_numberVariables(allvars), allvars)
+        var_index = circuit.var_index
+
+        constants = {}
+        def constant(value):
+            if value not in constants:
+                constants[value] = circuit.addNode(OR if not value else AND)
+            return constants[value]
+
+        if bool == type(ddnnf.root):
+            constant(ddnnf.root)
+            return circuit
+
+        index = {}
+        stack = [(ddnnf.root, False)]
+        while stack:
+            (node, expanded) = stack.pop()
+            if id(node) in index:
+                continue
+
+            if not expanded:
+                stack.append((node, True))
+                for ch in node.children:
+                    if bool != type(ch) and id(ch) not in index:
+                        stack.append((ch, False))
+                continue
+
+            if isinstance(node, Lit):
+                lit = var_index[node.lit.var]
+                if isinstance(node.lit, CNF.Not):
+                    lit = -lit
+                index[id(node)] = circuit.addNode(LIT, lit)
+            else:
+                chs = [constant(ch) if bool == type(ch) else index[id(ch)] for ch in node.children]
+                if isinstance(node, Or):
+                    index[id(node)] = circuit.addNode(OR, 0, chs, circuit._switchIndex(node.switch_var))
+                else:
+                    index[id(node)] = circuit.addNode(AND, 0, chs)
+
+        # The root has to come last
+        root = index[id(ddnnf.root)]
+        if root != circuit.root:
+            circuit = circuit._prune(root)
+
+        return circuit
+
+    def to_ddnnf(self):
+        """Build the equivalent dDNNF object graph, sharing equal nodes."""
+        from krrt.sat.dDNNF import dDNNF, NodeFactory
+
+        factory = NodeFactory()
+        variables = self.variables
+        kinds = self.kinds
+        lits = self.lits
+        offsets = self.offsets
+        children = self.children
+
+        nodes = []
+        for i in range(len(kinds)):
+            kind = kinds[i]
+            if LIT == kind:
+                l = lits[i]
+                lit = variables[abs(l)]
+                nodes.append(factory.make_lit(lit if l > 0 else lit.negate()))
+            else:
+                chs = [nodes[c] for c in children[offsets[i]:offsets[i + 1]]]
+                if not chs:
+                    nodes.append(AND == kind)
+                elif AND == kind:
+                    nodes.append(factory.make_and(chs))
+                else:
+                    nodes.append(factory.make_or(chs, self.switches[i]))
+
+        return dDNNF(nodes[-1], self.allvars, factory)
+
+    #--- Evaluation
+
+    def litWeights(self, default = 1):
+        """A list indexed by signed literal (negatives wrap around) of weights."""
+        return [default] * (2 * self.num_vars + 1)
+
+    def sweep(self, weights, arithmetic = None):
+        """
+        Evaluate every node bottom-up, with LIT nodes taking the value of
+        weights[lit], AND nodes the product and OR nodes the sum of their
+        children (in the given arithmetic, see getArithmetic). Returns the
+        list of node values.
+        """
+        arith = getArithmetic(arithmetic)
+        product = arith.product
+        total = arith.total
+
+        kinds = self.kinds
+        lits = self.lits
+        offsets = self.offsets
+        children = self.children
+
+        vals = [arith.zero] * len(kinds)
+        get = vals.__getitem__
+        for i in range(len(kinds)):
+            kind = kinds[i]
+            if LIT == kind:
+                vals[i] = weights[lits[i]]
+            elif AND == kind:
+                vals[i] = product(map(get, children[offsets[i]:offsets[i + 1]]))
+            else:
+                vals[i] = total(map(get, children[offsets[i]:offsets[i + 1]]))
+        return vals
+
+    def derivatives(self, vals, arithmetic = None):
+        """
+        Top-down pass returning, for every node, the partial derivative of
+        the root value with respect to the node value (given the node
+        values vals from sweep). AND nodes pass each child the product of
+        its siblings, computed with prefix / suffix products so zeros are
+        handled exactly.
+        """
+        arith = getArithmetic(arithmetic)
+        (zero, one, mul, add) = (arith.zero, arith.one, arith.mul, arith.add)
+
+        kinds = self.kinds
+        offsets = self.offsets
+        children = self.children
+
+        ders = [zero] * len(kinds)
+        ders[-1] = one
+        for i in range(len(kinds) - 1, -1, -1):
+            d = ders[i]
+            kind = kinds[i]
+            if d == zero or LIT == kind:
+                continue
+            chs = children[offsets[i]:offsets[i + 1]]
+            if OR == kind or 1 == len(chs):
+                for c in chs:
+                    ders[c] = add(ders[c], d)
+            else:
+                suffix = [one] * (len(chs) + 1)
+                for j in range(len(chs) - 1, 0, -1):
+                    suffix[j] = mul(suffix[j + 1], vals[chs[j]])
+                for j in range(len(chs)):
+                    c = chs[j]
+                    ders[c] = add(ders[c], mul(d, suffix[j + 1]))
+                    d = mul(d, vals[c])
+        return ders
+
+    def weightList(self, weights = None, arithmetic = None):
+        """
+        Turn a dict from literals (Variable / Not objects) to weights into
+        the signed-literal list used by sweep. Missing literals weigh 1.
+        """
+        arith = getArithmetic(arithmetic)
+        lw = self.litWeights(arith.one)
+        if weights:
+            for (l, w) in weights.items():
+                i = self.var_index[l.var]
+                lw[-i if isinstance(l, CNF.Not) else i] = arith.weight(w)
+        return lw
+
+    def _freeFactors(self, lw, arith):
+        free = [self.var_index[v] for v in (self.allvars - self.usedvars)]
+        return (free, [arith.add(lw[i], lw[-i]) for i in free])
+
+    def wmc(self, weights = None, arithmetic = None):
+        """
+        Weighted model count over allvars, with weights a dict from
+        literals to their weight (missing literals weigh 1). With the log
+        arithmetic, the natural log of the count is returned.
+        """
+        arith = getArithmetic(arithmetic)
+        lw = self.weightList(weights, arith)
+        (free, factors) = self._freeFactors(lw, arith)
+        return arith.product([self.sweep(lw, arith)[-1]] + factors)
+
+    def marginals(self, weights = None, arithmetic = None):
+        """
+        Return a dict from every literal over allvars (Variable and Not
+        objects) to the weighted model count with that literal true. This
+        takes one bottom-up and one top-down pass, whatever the number of
+        variables.
+        """
+        arith = getArithmetic(arithmetic)
+        (one, mul, add) = (arith.one, arith.mul, arith.add)
+
+        lw = self.weightList(weights, arith)
+        vals = self.sweep(lw, arith)
+        ders = self.derivatives(vals, arith)
+
+        totals = self.litWeights(arith.zero)
+        for (k, l, d) in zip(self.kinds, self.lits, ders):
+            if LIT == k:
+                totals[l] = add(totals[l], d)
+
+        # Unused variables contribute a factor each; leave out one at a time
+        (free, factors) = self._freeFactors(lw, arith)
+        suffix = [one] * (len(free) + 1)
+        for j in range(len(free) - 1, -1, -1):
+            suffix[j] = mul(suffix[j + 1], factors[j])
+        scale = suffix[0]
+
+        toret = {}
+        for v in self.usedvars:
+            i = self.var_index[v]
+            toret[v] = arith.product([totals[i], lw[i], scale])
+            toret[v.negate()] = arith.product([totals[-i], lw[-i], scale])
+
+        prefix = vals[-1]
+        for (j, i) in enumerate(free):
+            v = self.variables[i]
+            rest = mul(prefix, suffix[j + 1])
+            toret[v] = mul(rest, lw[i])
+            toret[v.negate()] = mul(rest, lw[-i])
+            prefix = mul(prefix, factors[j])
+
+        return toret
+
+    def count(self, vars = set(), arithmetic = None):
+        """
+        Count the models over allvars. If vars is given, return instead a
+        dict from each of those variables to the number of models where it
+        is true (see marginals to get every literal at once).
+
+        The arithmetic is 'exact' (big integers, the default), 'log' (the
+        natural log of the count as a float) or 'mod' (the count modulo a
+        large prime; pass a ModularArithmetic for another modulus).
+        """
+        if not vars:
+            return self.wmc(arithmetic = arithmetic)
+
+        assert vars <= self.allvars
+
+        marginals = self.marginals(arithmetic = arithmetic)
+        return {v: marginals[v] for v in vars}
+
+    def is_sat(self):
+        return self.sweep(self.litWeights())[-1] > 0
+
+    #--- Batched queries
+
+    def _slots(self):
+        """
+        Assign every node a row of the batch value matrix, reusing the row
+        of a node once its last parent has been evaluated. Returns the slot
+        array and the number of rows needed.
+        """
+        if self._slot_cache is None:
+            offsets = self.offsets
+            children = self.children
+            n = self.size()
+
+            last_use = array('i', [-1]) * n
+            for i in range(n):
+                for c in children[offsets[i]:offsets[i + 1]]:
+                    last_use[c] = i
+
+            dying = [[] for i in range(n)]
+            for (c, i) in enumerate(last_use):
+                dying[i if -1 != i else c].append(c)
+            dying[n - 1] = [c for c in dying[n - 1] if c != n - 1]
+
+            slots = array('i', bytes(4 * n))
+            free = []
+            num_slots = 0
+            for i in range(n):
+                if free:
+                    slots[i] = free.pop()
+                else:
+                    slots[i] = num_slots
+                    num_slots += 1
+                for c in dying[i]:
+                    free.append(slots[c])
+
+            self._slot_cache = (slots, num_slots)
+        return self._slot_cache
+
+    def _queryMasks(self, queries):
+        """
+        Turn queries (collections of literals) into, for every signed literal,
+        the list of queries that falsify it, plus the factor that the unused
+        variables contribute to each query's count.
+        """
+        var_index = self.var_index
+        free = set([var_index[v] for v in (self.allvars - self.usedvars)])
+        falsified = {}
+        factors = []
+        for (q, lits) in enumerate(queries):
+            fixed = set()
+            for l in lits:
+                # As in condition, variables outside the circuit are skipped
+                if l.var not in var_index:
+                    continue
+                i = var_index[l.var]
+                if isinstance(l, CNF.Not):
+                    i = -i
+                fixed.add(i)
+                falsified.setdefault(-i, []).append(q)
+            fixed_free = set([abs(i) for i in fixed if abs(i) in free])
+            if any(-i in fixed for i in fixed if abs(i) in free):
+                factors.append(0)
+            else:
+                factors.append(2 ** (len(free) - len(fixed_free)))
+        return (falsified, factors)
+
+    def batch(self, queries, mode = 'count', batch_size = 256, exact = False):
+        """
+        Answer many queries against the circuit without conditioning it.
+        Each query is a collection of literals (Variable / Not objects), and
+        the answer is the model count under that partial assignment
+        (mode = 'count', as condition(query).count() would give) or whether
+        it is satisfiable (mode = 'sat').
+
+        Every query works by masking the weight of the literals it falsifies.
+        With numpy, batch_size queries at a time are evaluated in one sweep
+        over a preallocated value matrix, using float counts unless exact
+        is set. Without numpy, each query is its own sweep.
+        """
+        assert mode in ['count', 'sat'], "Unknown query mode: %s" % mode
+        queries = list(queries)
+
+        if numpy is None:
+            return self._batchPython(queries, mode)
+
+        results = []
+        for start in range(0, len(queries), batch_size):
+            results.extend(self._batchNumpy(queries[start:start + batch_size], mode, exact))
+        return results
+
+    def _batchPython(self, queries, mode):
+        (falsified, factors) = self._queryMasks(queries)
+        masks = [[] for q in queries]
+        for (lit, qs) in falsified.items():
+            for q in qs:
+                masks[q].append(lit)
+
+        results = []
+        weights = self.litWeights()
+        for (q, mask) in enumerate(masks):
+            for lit in mask:
+                weights[lit] = 0
+            value = self.sweep(weights)[-1] * factors[q]
+            for lit in mask:
+                weights[lit] = 1
+            results.append(value > 0 if 'sat' == mode else value)
+        return results
+
+    def _batchNumpy(self, queries, mode, exact):
+        (falsified, factors) = self._queryMasks(queries)
+        falsified = {lit: numpy.array(qs) for (lit, qs) in falsified.items()}
+        (slots, num_slots) = self._slots()
+
+        if 'sat' == mode:
+            dtype = bool
+            (one, zero) = (True, False)
+            (mul, add) = (numpy.logical_and, numpy.logical_or)
+        else:
+            dtype = object if exact else numpy.float64
+            (one, zero) = (1, 0)
+            (mul, add) = (numpy.multiply, numpy.add)
+
+        kinds = self.kinds
+        lits = self.lits
+        offsets = self.offsets
+        children = self.children
+
+        vals = numpy.empty((num_slots, len(queries)), dtype = dtype)
+        for i in range(len(kinds)):
+            row = vals[slots[i]]
+            kind = kinds[i]
+            if LIT == kind:
+                row.fill(one)
+                if lits[i] in falsified:
+                    row[falsified[lits[i]]] = zero
+                continue
+
+            chs = children[offsets[i]:offsets[i + 1]]
+            if 0 == len(chs):
+                row.fill(one if AND == kind else zero)
+                continue
+
+            op = mul if AND == kind else add
+            numpy.copyto(row, vals[slots[chs[0]]])
+            for c in chs[1:]:
+                op(row, vals[slots[c]], out = row)
+
+        root = vals[slots[len(kinds) - 1]]
+        if 'sat' == mode:
+            return [bool(r) and f > 0 for (r, f) in zip(root, factors)]
+        return [r * f for (r, f) in zip(root.tolist(), factors)]
+
+    #--- Output
+
+    def gen_nnf_lines(self):
+        """Generate the lines (without the header) of the c2d .nnf format."""
+        kinds = self.kinds
+        lits = self.lits
+        switches = self.switches
+        offsets = self.offsets
+        children = self.children
+        for i in range(len(kinds)):
+            kind = kinds[i]
+            if LIT == kind:
+                yield "L %d" % lits[i]
+            else:
+                chs = children[offsets[i]:offsets[i + 1]]
+                if AND == kind:
+                    yield "A %d %s" % (len(chs), ' '.join(map(str, chs)))
+                else:
+                    yield "O %d %d %s" % (switches[i], len(chs), ' '.join(map(str, chs)))
+
+    def writeNNF(self, fname, compress = None):
+        """Stream the circuit out in the c2d .nnf format."""
+        header = ["nnf %d %d %d" % (self.size(), self.num_edges(), self.num_vars)]
+        CNF.writeDimacs(fname, header, self.gen_nnf_lines(), compress)
+
+    def writeBinary(self, fname):
+        """
+        Write the circuit in the binary format read by loadCircuit: a header
+        followed by the raw node arrays (each 8-byte aligned), the allvars
+        indices and the variable names, one per line.
+        """
+        allvars = array('i', sorted([self.var_index[v] for v in self.allvars]))
+        names = '\n'.join(['' if v is None else str(v) for v in self.variables[1:]]).encode()
+
+        f = open(fname, 'wb')
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, sys.byteorder == 'little',
+                                   self.size(), self.num_edges(), self.num_vars,
+                                   len(allvars), len(names)))
+        for arr in (array('b', self.kinds), array('i', self.lits), array('i', self.switches),
+                    array('q', self.offsets), array('i', self.children), allvars):
+            data = arr.tobytes()
+            f.write(data)
+            f.write(bytes(-len(data) % 8))
+        f.write(names)
+        f.close()
+
+    #--- Transformations
+
+    def condition(self, lits):
+        """Condition on a collection of literals (Variable / Not objects)."""
+        fixed = {}
+        for l in lits:
+            if l.var not in self.var_index:
+                continue
+            i = self.var_index[l.var]
+            if isinstance(l, CNF.Not):
+                i = -i
+            fixed[i] = True
+            fixed[-i] = False
+        return self._transform(fixed, self.allvars - set([l.var for l in lits]))
+
+    def forget(self, vars):
+        """Existentially quantify away the given variables."""
+        fixed = {}
+        for v in vars:
+            if v in self.var_index:
+                fixed[self.var_index[v]] = True
+                fixed[-self.var_index[v]] = True
+        return self._transform(fixed, self.allvars - set(vars))
+
+    def simplify(self):
+        """Remove constants, collapse single-child nodes and drop dead nodes."""
+        return self._transform({}, self.allvars)
+
+    def _transform(self, fixed, allvars):
+        kinds = self.kinds
+        lits = self.lits
+        switches = self.switches
+        offsets = self.offsets
+        children = self.children
+
+        out = Circuit(self.variables, allvars)
+        new = array('i', bytes(4 * len(kinds)))
+
+        for i in range(len(kinds)):
+            kind = kinds[i]
+
+            if LIT == kind:
+                value = fixed.get(lits[i])
+                if value is None:
+                    new[i] = out.addNode(LIT, lits[i])
+                else:
+                    new[i] = _TRUE if value else _FALSE
+                continue
+
+            (neutral, absorbing) = (_TRUE, _FALSE) if AND == kind else (_FALSE, _TRUE)
+            result = None
+            chs = []
+            seen = set()
+            for c in children[offsets[i]:offsets[i + 1]]:
+                m = new[c]
+                if neutral == m:
+                    continue
+                if absorbing == m:
+                    result = absorbing
+                    break
+                if LIT == out.kinds[m]:
+                    if -out.lits[m] in seen:
+                        result = absorbing
+                        break
+                    seen.add(out.lits[m])
+                chs.append(m)
+
+            if result is None:
+                if not chs:
+                    result = neutral
+                elif 1 == len(chs):
+                    result = chs[0]
+                else:
+                    result = out.addNode(kind, 0, chs, switches[i])
+            new[i] = result
+
+        root = new[len(kinds) - 1]
+        if _TRUE == root:
+            out = Circuit(self.variables, allvars)
+            out.addNode(AND)
+            return out
+        if _FALSE == root:
+            out = Circuit(self.variables, allvars)
+            out.addNode(OR)
+            return out
+
+        return out._prune(root)
+
+    def _prune(self, root):
+        """Return a copy holding only the nodes reachable from root."""
+        offsets = self.offsets
+        children = self.children
+
+        reach = bytearray(root + 1)
+        reach[root] = 1
+        for i in range(root, -1, -1):
+            if reach[i]:
+                for c in children[offsets[i]:offsets[i + 1]]:
+                    reach[c] = 1
+
+        if all(reach) and root == self.root:
+            return self
+
+        out = Circuit(self.variables, self.allvars)
+        new = array('i', bytes(4 * (root + 1)))
+        for i in range(root + 1):
+            if reach[i]:
+                new[i] = out.addNode(self.kinds[i], self.lits[i],
+                                     [new[c] for c in children[offsets[i]:offsets[i + 1]]],
+                                     self.switches[i])
+        return out
+
+    def _varSets(self, visit):
+        """
+        Compute the variable index set of every node bottom-up, calling
+        visit(node, sets) once each node's set is known. A set is dropped
+        as soon as all of the parents of its node have been visited.
+        """
+        offsets = self.offsets
+        children = self.children
+
+        parents = array('i', bytes(4 * self.size()))
+        for c in children:
+            parents[c] += 1
+
+        empty = frozenset()
+        sets = [None] * self.size()
+        for i in range(self.size()):
+            if LIT == self.kinds[i]:
+                sets[i] = frozenset([abs(self.lits[i])])
+            else:
+                chs = children[offsets[i]:offsets[i + 1]]
+                if 0 == len(chs):
+                    sets[i] = empty
+                elif 1 == len(chs):
+                    sets[i] = sets[chs[0]]
+                else:
+                    sets[i] = frozenset().union(*[sets[c] for c in chs])
+
+            visit(i, sets)
+
+            for c in children[offsets[i]:offsets[i + 1]]:
+                parents[c] -= 1
+                if 0 == parents[c]:
+                    sets[c] = None
+
+        return sets[-1]
+
+    def smooth(self):
+        """
+        Return a smooth equivalent: every OR child mentions the same
+        variables, and the root mentions all of allvars. One shared
+        (v | ~v) gadget is used per missing variable.
+        """
+        simp = self.simplify()
+        if simp.is_constant() and OR == simp.kinds[-1]:
+            return simp
+
+        out = Circuit(simp.variables, simp.allvars)
+        new = array('i', bytes(4 * simp.size()))
+        gadgets = {}
+
+        def gadget(v):
+            if v not in gadgets:
+                pos = out.addNode(LIT, v)
+                neg = out.addNode(LIT, -v)
+                gadgets[v] = out.addNode(OR, 0, [pos, neg], v)
+            return gadgets[v]
+
+        def pad(node, missing):
+            extra = [gadget(v) for v in sorted(missing)]
+            if AND == out.kinds[node]:
+                return out.addNode(AND, 0, list(out.childrenOf(node)) + extra)
+            return out.addNode(AND, 0, [node] + extra)
+
+        def visit(i, sets):
+            kind = simp.kinds[i]
+            if LIT == kind:
+                new[i] = out.addNode(LIT, simp.lits[i])
+                return
+            chs = simp.childrenOf(i)
+            if AND == kind:
+                new[i] = out.addNode(AND, 0, [new[c] for c in chs])
+                return
+            mine = sets[i]
+            padded = []
+            for c in chs:
+                missing = mine - sets[c]
+                padded.append(pad(new[c], missing) if missing else new[c])
+            new[i] = out.addNode(OR, 0, padded, simp.switches[i])
+
+        root_vars = simp._varSets(visit)
+        root = new[simp.root]
+
+        missing = set([simp.var_index[v] for v in simp.allvars]) - root_vars
+        if missing:
+            if simp.is_constant():
+                extra = [gadget(v) for v in sorted(missing)]
+                root = extra[0] if 1 == len(extra) else out.addNode(AND, 0, extra)
+            else:
+                root = pad(root, missing)
+
+        return out._prune(root)
+
+    def is_smooth(self):
+        smooth = [True]
+        offsets = self.offsets
+        children = self.children
+
+        def visit(i, sets):
+            if OR == self.kinds[i]:
+                mine = sets[i]
+                for c in children[offsets[i]:offsets[i + 1]]:
+                    if sets[c] != mine:
+                        smooth[0] = False
+
+        self._varSets(visit)
+        return smooth[0]
+
+
+#--- Reading circuits
+
+BINARY_MAGIC = b'KRNNF\x00\x00\x01'
+BINARY_HEADER = struct.Struct('<8s?7xqqqqq')
+
+
+def _fromArrays(variables, allvars, kinds, lits, switches, offsets, children):
+    circuit = Circuit(variables, allvars)
+    circuit.kinds = kinds
+    circuit.lits = lits
+    circuit.switches = switches
+    circuit.offsets = offsets
+    circuit.children = children
+    return circuit
+
+
+def parseNNF(fname):
+    """
+    Stream a c2d / d4 .nnf file (possibly compressed) straight into a
+    Circuit, one line at a time. Variables are named by their number, and
+    allvars holds the variables 1..nVars of the header.
+    """
+    kinds = array('b')
+    lits = array('i')
+    switches = array('i')
+    offsets = array('q', [0])
+    children = array('i')
+
+    f = open_file(fname)
+    header = f.readline().split()
+    while header and 'c' == header[0]:
+        header = f.readline().split()
+    assert header and 'nnf' == header[0], "Bad header: %s" % ' '.join(header)
+    (nNodes, nEdges, nVars) = map(int, header[1:4])
+
+    for line in f:
+        parts = line.split()
+        if not parts or 'c' == parts[0]:
+            continue
+        kind = parts[0]
+        node = len(kinds)
+
+        if 'L' == kind:
+            kinds.append(LIT)
+            lits.append(int(parts[1]))
+            switches.append(0)
+
+        else:
+            if 'A' == kind:
+                kinds.append(AND)
+                switches.append(0)
+                chs = parts[2:]
+            elif 'O' == kind:
+                kinds.append(OR)
+                switches.append(int(parts[1]))
+                chs = parts[3:]
+            else:
+                assert False, "Unrecognized line: %s" % line
+            lits.append(0)
+
+            chs = list(map(int, chs))
+            assert int(parts[len(parts) - len(chs) - 1]) == len(chs), "Bad line? %s" % line
+            assert not chs or max(chs) < node, "Bad line? %s" % line
+            children.extend(chs)
+
+        offsets.append(len(children))
+
+    f.close()
+
+    assert nNodes == len(kinds), "Expected %d nodes but found %d" % (nNodes, len(kinds))
+
+    # The circuit ranges over all the variables of the header, including
+    # those that no literal mentions
+    num_vars = max(nVars, max(map(abs, lits), default = 0))
+    variables = [None] + [CNF.Variable(i) for i in range(1, num_vars + 1)]
+    allvars = set(variables[1:])
+
+    return _fromArrays(variables, allvars, kinds, lits, switches, offsets, children)
+
+
+def loadCircuit(fname, use_mmap = True):
+    """
+    Load a circuit written by Circuit.writeBinary. With use_mmap, the node
+    arrays are read-only views on the memory-mapped file, so loading costs
+    next to nothing until the nodes are touched.
+    """
+    f = open(fname, 'rb')
+    if use_mmap:
+        buf = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+    else:
+        buf = f.read()
+    f.close()
+
+    view = memoryview(buf)
+    (magic, little, nNodes, nEdges, nVars, nAll, nNames) = BINARY_HEADER.unpack_from(view)
+    assert BINARY_MAGIC == magic, "Not a binary circuit file: %s" % fname
+
+    # Views can only be used on files written with the same byte order
+    native = (little == ('little' == sys.byteorder))
+    pos = [BINARY_HEADER.size]
+
+    def section(typecode, count):
+        size = array(typecode).itemsize * count
+        data = view[pos[0]:pos[0] + size]
+        pos[0] += size + (-size % 8)
+        if use_mmap and native:
+            return data.cast(typecode)
+        arr = array(typecode)
+        arr.frombytes(data)
+        if not native:
+            arr.byteswap()
+        return arr
+
+    kinds = section('b', nNodes)
+    lits = section('i', nNodes)
+    switches = section('i', nNodes)
+    offsets = section('q', nNodes + 1)
+    children = section('i', nEdges)
+    allvars = section('i', nAll)
+    names = bytes(view[pos[0]:pos[0] + nNames]).decode().split('\n') if nVars else []
+
+    variables = [None]
+    for name in names:
+        if '' == name:
+            variables.append(None)
+        else:
+            variables.append(CNF.Variable(int(name) if name.isdigit() else name))
+
+    circuit = _fromArrays(variables, set([variables[i] for i in allvars]),
+                          kinds, lits, switches, offsets, children)
+    circuit._buffer = buf
+    return circuit
+
+
+def _numberVariables(allvars):
+    """
+    Return a list mapping indices to the given Variables. Variables named
+    by positive integers (as read from .nnf files) keep their number.
+    """
+    allvars = list(allvars)
+    if all(isinstance(v.obj, int) and v.obj > 0 for v in allvars):
+        variables = [None] * (max([v.obj for v in allvars] + [0]) + 1)
+        for v in allvars:
+            variables[v.obj] = v
+        return variables
+    return [None] + sorted(allvars, key = str)
@@ -0,0 +1,354 @@
+import sys
+import time
+from collections import OrderedDict
+
+from krrt.sat.CNF import Formula
+from krrt.sat.Dimacs import parseFile
+from krrt.sat.dDNNF import dDNNF, NodeFactory
+
+
+USAGE_STRING = "\n\
+Usage: python Compiler.py -<option> <argument> -<option> <argument> ... <FLAG> <FLAG> ...\n\n\
+        Where options are:\n\
+          -i <input-file>\n\
+          -o <output-nnf-file>\n\
+          -timeout <timeout>\n\
+          -cache <max cached literals>\n\n\
+        And the flags include:\n\
+          NO_SMOOTH\n\
+          DISABLE_STATS\n\
+        "
+
+# Default bound on the cache, in the total number of literals of the cached components
+CACHE_SIZE = 10000000
+
+
+#--- Component level helpers (shared with the model counter)
+
+def assign(clauses, lits):
+    """
+    Assign the literals and unit propagate over clauses (tuples of DIMACS
+    integers). Returns None on a conflict, and otherwise the set of
+    literals made true and the remaining (shortened) clauses.
+    """
+    assigned = set(lits)
+    for l in lits:
+        if -l in assigned:
+            return None
+
+    while True:
+        rest = []
+        units = set()
+        for cls in clauses:
+            if any(l in assigned for l in cls):
+                continue
+            cls = tuple([l for l in cls if -l not in assigned])
+            if not cls:
+                return None
+            if 1 == len(cls):
+                if -cls[0] in units:
+                    return None
+                units.add(cls[0])
+            rest.append(cls)
+
+        if not units:
+            return (assigned, rest)
+
+        assigned |= units
+        clauses = rest
+
+
+def components(clauses):
+    """Split clauses into the groups that share no variables."""
+    parent = {}
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for cls in clauses:
+        root = None
+        for l in cls:
+            v = abs(l)
+            if v not in parent:
+                parent[v] = v
+            if root is None:
+                root = find(v)
+            else:
+                r = find(v)
+                if r != root:
+                    parent[r] = root
+
+    groups = OrderedDict()
+    for cls in clauses:
+        groups.setdefault(find(abs(cls[0])), []).append(cls)
+    return list(groups.values())
+
+
+def pick_var(clauses):
+    """
+    Pick the variable with the most occurrences, in the style of
+    DPLL.vsids_pick_var. Returns the literal to try first, following the
+    more frequent polarity.
+    """
+    counts = {}
+    for cls in clauses:
+        for l in cls:
+            counts[l] = counts.get(l, 0) + 1
+
+    best = None
+    best_score = -1
+    for (l, c) in counts.items():
+        if l < 0 and -l in counts:
+            continue
+        pos = counts.get(abs(l), 0)
+        neg = counts.get(-abs(l), 0)
+        score = pos + neg
+        if score > best_score:
+            best_score = score
+            best = abs(l) if pos >= neg else -abs(l)
+    return best
+
+
+def canonical_clauses(theory):
+    """
+    The clauses of a Formula as sorted tuples, with tautologies and
+    duplicate literals dropped. Returns None if there is an empty clause.
+    """
+    clauses = []
+    for cls in theory.iterIntClauses():
+        lits = set(cls)
+        if any(-l in lits for l in lits):
+            continue
+        if not lits:
+            return None
+        clauses.append(tuple(sorted(lits, key = abs)))
+    return clauses
+
+
+class ComponentCache:
+    """
+    Least-recently-used cache from components (frozensets of clauses) to
+    results, bounded by the total number of literals in the cached
+    components.
+    """
+
+    def __init__(self, max_size = CACHE_SIZE):
+        self.max_size = max_size
+        self.size = 0
+        self.table = OrderedDict()
+
+        self.HITS = 0
+        self.MISSES = 0
+        self.EVICTIONS = 0
+
+    def __len__(self):
+        return len(self.table)
+
+    def get(self, key, default = None):
+        entry = self.table.get(key)
+        if entry is None:
+            self.MISSES += 1
+            return default
+        self.HITS += 1
+        self.table.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value):
+        if key in self.table:
+            return
+        size = sum([len(cls) for cls in key])
+        self.table[key] = (value, size)
+        self.size += size
+        while self.size > self.max_size and self.table:
+            (old, (v, s)) = self.table.popitem(last = False)
+            self.size -= s
+            self.EVICTIONS += 1
+
+    def hit_rate(self):
+        return float(self.HITS) / max(self.HITS + self.MISSES, 1)
+
+
+class _Timeout(Exception):
+    pass
+
+
+#--- The compiler
+
+def compile(theory, **options):
+    """Compile a Formula (or DIMACS file) into a dDNNF (see Compiler)."""
+    return Compiler(theory, **options).compile()
+
+
+class Compiler:
+    """
+    Top-down knowledge compiler from a Formula to a dDNNF, in the style of
+    an exhaustive DPLL search:
+        - the clauses are unit propagated after every decision,
+        - clauses that share no variables are compiled separately and
+          conjoined (the decomposable AND nodes),
+        - the remaining component branches on its most frequent variable
+          (the deterministic OR nodes, with that variable as the switch),
+        - compiled components are cached by their clauses, with least
+          recently used components evicted once the cache holds more than
+          cache_size literals.
+
+    The result is a decision-DNNF built from the usual And / Or / Lit nodes
+    over the variables of the theory, sharing equal nodes through a
+    NodeFactory. It is smoothed unless smooth = False, since dDNNF.count
+    expects a smooth circuit. Compilation is recursive in the number of
+    decisions, so it is aimed at medium sized theories.
+    """
+
+    def __init__(self, theory, cache_size = CACHE_SIZE, smooth = True, timeout = None,
+                 verbose = False):
+
+        if not isinstance(theory, Formula):
+            theory = parseFile(theory)
+        self.theory = theory
+        self.cache = ComponentCache(cache_size)
+        self.factory = NodeFactory()
+        self.smooth = smooth
+        self.TIMEOUT = timeout
+        self.verbose = verbose
+        self.timedout = False
+
+        self.NODE_COUNT = 0
+        self.DECOMPOSITIONS = 0
+
+    def compile(self):
+        """Return the compiled dDNNF, or None if the timeout was reached."""
+        self.start_time = time.time()
+        allvars = set(self.theory.unmapping[1:])
+
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, 10 * self.theory.num_vars + 1000))
+        try:
+            root = self._compileTheory()
+            ddnnf = dDNNF(root, allvars, self.factory)
+            if self.smooth:
+                ddnnf = ddnnf.smooth()
+        except _Timeout:
+            self.timedout = True
+            ddnnf = None
+        finally:
+            sys.setrecursionlimit(limit)
+
+        if self.verbose:
+            self.print_stats()
+
+        return ddnnf
+
+    def print_stats(self):
+        print ("Decision Nodes: " + str(self.NODE_COUNT))
+        print ("Decompositions: " + str(self.DECOMPOSITIONS))
+        print ("Cache Hit Rate: %.3f (%d hits, %d misses)" % (self.cache.hit_rate(), self.cache.HITS, self.cache.MISSES))
+        print ("Cache Entries: %d (%d evicted)" % (len(self.cache), self.cache.EVICTIONS))
+        print ("Circuit Nodes: " + str(len(self.factory)))
+        print ("Time: %.2f" % (time.time() - self.start_time))
+
+    #--- Compilation internals
+
+    def _compileTheory(self):
+        clauses = canonical_clauses(self.theory)
+        if clauses is None:
+            return False
+        result = assign(clauses, [])
+        if result is None:
+            return False
+        (implied, rest) = result
+        return self._conjoin([self._lit(l) for l in sorted(implied, key = abs)] + [self._compile(rest)])
+
+    def _lit(self, num):
+        return self.factory.make_lit(self.theory.objLiteral(num))
+
+    def _conjoin(self, parts):
+        if False in parts:
+            return False
+        parts = [p for p in parts if p is not True]
+        if not parts:
+            return True
+        if 1 == len(parts):
+            return parts[0]
+        return self.factory.make_and(parts)
+
+    def _compile(self, clauses):
+        if not clauses:
+            return True
+
+        if self.TIMEOUT and (time.time() - self.start_time) > self.TIMEOUT:
+            raise _Timeout()
+
+        key = frozenset(clauses)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        comps = components(clauses)
+        if len(comps) > 1:
+            self.DECOMPOSITIONS += 1
+            parts = []
+            for comp in comps:
+                parts.append(self._compile(comp))
+                if parts[-1] is False:
+                    break
+            result = self._conjoin(parts)
+
+        else:
+            self.NODE_COUNT += 1
+            first = pick_var(clauses)
+            branches = []
+            for lit in [first, -first]:
+                assigned = assign(clauses, [lit])
+                if assigned is None:
+                    continue
+                (implied, rest) = assigned
+                sub = self._compile(rest)
+                if sub is False:
+                    continue
+                branches.append(self._conjoin([self._lit(l) for l in sorted(implied, key = abs)] + [sub]))
+
+            if not branches:
+                result = False
+            elif 1 == len(branches):
+                result = branches[0]
+            else:
+                result = self.factory.make_or(branches, abs(first))
+
+        self.cache.put(key, result)
+        return result
+
+
+if __name__ == '__main__':
+    from krrt.utils import get_opts, write_file
+    import os
+    myargs, flags = get_opts()
+
+    if '-i' not in myargs:
+        print ("Must specify input:")
+        print (USAGE_STRING)
+        os._exit(1)
+
+    timeout = None
+    if '-timeout' in myargs:
+        timeout = int(myargs['-timeout'])
+
+    cache_size = CACHE_SIZE
+    if '-cache' in myargs:
+        cache_size = int(myargs['-cache'])
+
+    compiler = Compiler(myargs['-i'], cache_size = cache_size, smooth = 'NO_SMOOTH' not in flags,
+                        timeout = timeout)
+    ddnnf = compiler.compile()
+
+    if 'DISABLE_STATS' not in flags:
+        compiler.print_stats()
+
+    if ddnnf is None:
+        print (" -timeout- ")
+    else:
+        print ("Models: " + str(ddnnf.count()))
+        if '-o' in myargs:
+            write_file(myargs['-o'], ddnnf.gen_nnf())
@@ -3,92 +3,155 @@ import sys
 from krrt.sat.CNF import *
 from krrt.sat.Dimacs import *
 import random
-from time import clock
 
+# time.clock was removed in Python 3.8
+try:
+    from time import clock
+except ImportError:
+    from time import perf_counter as clock
 
-def propagate(theory):
-    # We assume that either unit prop or pure literal updates will change the
-    #  number of clauses in the theory, so we repeat this process until the
-    #  clause count converges.
-    cls_count = 0
 
-    while theory.num_clauses != cls_count:
-        cls_count = theory.num_clauses
-        purelit_prop(theory)
-        unit_prop(theory)
+def propagate(theory):
+    """
+    Simplify the theory with unit and pure literal propagation until a
+    fixpoint is reached. Satisfied clauses and false literals are removed,
+    and every fixed literal is kept as a unit clause. Returns a dict with
+    the number of clauses and variables eliminated.
+    """
+    return Propagator(theory).run()
 
 
 def purelit_prop(theory):
-    # Get all of the literals seen
-    all_lits = set()
-    unit_lits = set()
-    for c in theory.clauses:
-        if 1 == len(c):
-            unit_lits.add(list(c)[0])
-        for l in c:
-            all_lits.add(l)
-
-    # Find the pure non-unit clause lits
-    pure_lits = set()
-    for v in theory.variables:
-        # Check that it isn't already a unit clause
-        if (v not in unit_lits) and (v.negate() not in unit_lits):
-            # Check that it is pure
-            if (v in all_lits) and (v.negate() not in all_lits):
-                pure_lits.add(v)
-            elif (v not in all_lits) and (v.negate() in all_lits):
-                pure_lits.add(v.negate())
-
-    # Add the newly found pure literals as unit clauses
-    for lit in pure_lits:
-        theory.addClause([lit])
+    """Simplify the theory with pure literal propagation only."""
+    return Propagator(theory).run(units = False)
 
 
 def unit_prop(theory):
-    # Separate out all of the unit clauses
-    nonUnitClauses = []
-    literals = set([])
-    for cls in theory.clauses:
-        if 1 == len(cls):
-            literals.add(list(cls)[0])
-        else:
-            nonUnitClauses.append(cls)
-
-    # Iterate through subsuming and propagating
-    stable = False
-    while not stable:
-        stable = True
-        deleteQueue = set([])
-        for i in range(len(nonUnitClauses)):
-            cls = nonUnitClauses[i]
-            # Check for unit
-            if 1 == len(cls):
-                literals.add(list(cls)[0])
-                deleteQueue.add(i)
-                stable = False
-
+    """Simplify the theory with unit propagation only."""
+    return Propagator(theory).run(pure = False)
+
+
+class Propagator:
+    """
+    Unit / pure literal propagation over per-literal occurrence lists.
+
+    Every clause keeps a count of its unassigned literals, and every
+    literal a count of the live clauses it occurs in. Assigning a literal
+    visits only the clauses it (or its negation) occurs in, so the whole
+    fixpoint takes time linear in the literal occurrences touched. Newly
+    unit clauses and newly pure literals go onto a propagation queue.
+    """
+
+    def __init__(self, theory):
+        self.theory = theory
+        n = theory.num_vars
+
+        self.clauses = [list(dict.fromkeys(cls)) for cls in theory.iterIntClauses()]
+        self.alive = [True] * len(self.clauses)
+        self.free = [len(cls) for cls in self.clauses]
+
+        # Literal indexed tables (negative literals wrap around)
+        self.assign = [0] * (2 * n + 1)
+        self.occ = [[] for i in range(2 * n + 1)]
+        self.lit_count = [0] * (2 * n + 1)
+        for (ci, cls) in enumerate(self.clauses):
+            for lit in cls:
+                self.occ[lit].append(ci)
+                self.lit_count[lit] += 1
+
+        self.conflict = False
+        self.num_units = 0
+        self.num_pure = 0
+
+    def run(self, units = True, pure = True):
+        """Propagate to a fixpoint and write the result back to the theory."""
+        n = self.theory.num_vars
+        assign = self.assign
+        lit_count = self.lit_count
+
+        # Queue of (literal, is pure) pairs
+        queue = []
+        if units:
+            queue.extend([(cls[0], False) for cls in self.clauses if 1 == len(cls)])
+        if pure:
+            for v in range(1, n + 1):
+                if lit_count[v] and not lit_count[-v]:
+                    queue.append((v, True))
+                elif lit_count[-v] and not lit_count[v]:
+                    queue.append((-v, True))
+
+        if [] in self.clauses:
+            self.conflict = True
+
+        while queue and not self.conflict:
+            (lit, is_pure) = queue.pop()
+            if 1 == assign[lit]:
+                continue
+            if -1 == assign[lit]:
+                self.conflict = True
+                break
+            if is_pure:
+                self.num_pure += 1
             else:
-                # Check for subsumption
-                for lit in cls:
-                    if lit in literals:
-                        deleteQueue.add(i)
-                        stable = False
-
-                # Check for resolution
-                oldSize = len(cls)
-                nonUnitClauses[i] = filter(lambda x: x.negate() not in literals, cls)
-                if len(nonUnitClauses[i]) != oldSize:
-                    stable = False
-
-        deleteInds = list(deleteQueue)
-        deleteInds.sort()
-        deleteInds.reverse()
-
-        for ind in deleteInds:
-            nonUnitClauses.pop(ind)
-
-    all_clauses = list(nonUnitClauses) + [[lit] for lit in literals]
-    theory.clauses = all_clauses
+                self.num_units += 1
+            self._assign(lit, queue, units, pure)
+
+        return self._writeBack()
+
+    def _assign(self, lit, queue, units, pure):
+        assign = self.assign
+        clauses = self.clauses
+        alive = self.alive
+        free = self.free
+        lit_count = self.lit_count
+
+        assign[lit] = 1
+        assign[-lit] = -1
+
+        # Clauses containing lit are satisfied and disappear
+        for ci in self.occ[lit]:
+            if not alive[ci]:
+                continue
+            alive[ci] = False
+            for other in clauses[ci]:
+                if 0 != assign[other]:
+                    continue
+                lit_count[other] -= 1
+                if pure and 0 == lit_count[other] and lit_count[-other]:
+                    queue.append((-other, True))
+
+        # Clauses containing -lit lose a literal
+        for ci in self.occ[-lit]:
+            if not alive[ci]:
+                continue
+            free[ci] -= 1
+            if 0 == free[ci]:
+                self.conflict = True
+            elif units and 1 == free[ci]:
+                for other in clauses[ci]:
+                    if 0 == assign[other]:
+                        queue.append((other, False))
+                        break
+
+    def _writeBack(self):
+        assign = self.assign
+        remaining = []
+        for (ci, cls) in enumerate(self.clauses):
+            if self.alive[ci]:
+                remaining.append([l for l in cls if 0 == assign[l]])
+
+        fixed = [v if 1 == assign[v] else -v for v in range(1, self.theory.num_vars + 1) if 0 != assign[v]]
+
+        if self.conflict:
+            remaining.append([])
+
+        self.theory.setIntClauses(remaining + [[l] for l in fixed])
+
+        return {'clauses_eliminated': self.alive.count(False),
+                'variables_eliminated': len(fixed),
+                'unit_literals': self.num_units,
+                'pure_literals': self.num_pure,
+                'conflict': self.conflict}
 
 
 USAGE_STRING = "\n\
@@ -98,17 +161,23 @@ Usage: python DPLL.py -<option> <argument> -<option> <argument> ... <FLAG> <FLAG
           -timeout <timeout>\n\
           -gui [on|off]\n\
           -showtree [on|off]\n\
-          -voh [vsids|static|random]\n\n\
+          -voh [vsids|static|random]\n\
+          -mode [recursive|iterative]\n\
+          -nodes <node-budget>\n\n\
         And the flags include:\n\
           DEBUG\n\
           DISABLE_RESULTS\n\
         "
 
 class DPLL:
-    def __init__(self, input, _debug, _timeout, voh):
+    def __init__(self, input, _debug, _timeout, voh, node_budget = None):
 
         #--- Initialize the clauses and variables
-        theory = parseFile(input)
+        if isinstance(input, Formula):
+            theory = input
+        else:
+            theory = parseFile(input)
+        self.theory = theory
         self.clauses = theory.clauses
         self.variables = [(x+1) for x in range(theory.num_vars)]
 
@@ -118,6 +187,7 @@ class DPLL:
         self.timedout = False
 
         self.TIMEOUT = _timeout
+        self.NODE_BUDGET = node_budget
         self.TARGET_DEPTH = len(self.variables)
 
         self.MAX_DEPTH = 0
@@ -125,10 +195,12 @@ class DPLL:
         self.NODE_COUNT = 0
         self.BACKTRACK_COUNT = 0
         self.DEPTH_LEVELS = []
+        self.DEPTH_HISTOGRAM = [0] * (self.TARGET_DEPTH + 1)
 
 
 
         #--- Set up the variable ordering heuristic
+        self.voh = voh
         if voh == 'static':
             self.pick_var = self.static_pick_var
         elif voh == 'random':
@@ -139,12 +211,15 @@ class DPLL:
             print ("Error: Unknown variable ordering heuristic, %s" % voh)
             sys.exit(0)
 
-    def solve(self, use_gui, display_search_tree, disable_results):
+    def solve(self, use_gui, display_search_tree, disable_results, iterative = False):
 
 
         self.start_time = clock()
 
-        sols = self.solve_complex(self.clauses, self.variables, 0)
+        if iterative:
+            sols = self.solve_iterative()
+        else:
+            sols = self.solve_complex(self.clauses, self.variables, 0)
 
         if 1 == len(sols):
             print (str(self.NODE_COUNT) + ",1")
@@ -155,7 +230,7 @@ class DPLL:
         print ("Nodes Expanded: " + str(self.NODE_COUNT))
         print ("# of Backtracks: " + str(self.BACKTRACK_COUNT))
         print ("Max Depth: " + str(self.MAX_DEPTH))
-        print ("Avg Depth: " + str(self.SUM_DEPTH / self.NODE_COUNT))
+        print ("Avg Depth: " + str(self.SUM_DEPTH / max(self.NODE_COUNT, 1)))
 
         #if display_results:
         if False:
@@ -307,6 +382,176 @@ class DPLL:
                 settings.append(var * sign)
                 return settings
 
+    def solve_iterative(self):
+        """
+        Non-recursive DPLL search with unit propagation. Rather than copying
+        the clause list at every level, each clause keeps a count of its
+        true and false literals. Assigning a literal updates the counters of
+        the clauses it occurs in, and the trail doubles as the undo stack:
+        popping a literal reverses exactly those updates. Depth statistics
+        are kept in the bounded DEPTH_HISTOGRAM rather than DEPTH_LEVELS.
+
+        Returns the same settings list as solve_complex ([0] on failure).
+        """
+        n = self.theory.num_vars
+        clauses = [list(set(cls)) for cls in self.theory.iterIntClauses()]
+        if [] in clauses:
+            return [0]
+
+        #--- Literal indexed occurrence lists (negative literals wrap around)
+        occ = [[] for i in range(2 * n + 1)]
+        for (ci, cls) in enumerate(clauses):
+            for lit in cls:
+                occ[lit].append(ci)
+
+        self.it_clauses = clauses
+        self.it_occ = occ
+        self.it_assign = [0] * (2 * n + 1)
+        self.it_true = [0] * len(clauses)
+        self.it_false = [0] * len(clauses)
+        self.it_num_sat = 0
+        self.it_trail = []
+        self.it_queue = []
+
+        #--- Stack of (trail position, decision literal, already flipped)
+        decisions = []
+
+        conflict = not self._it_propagate([c[0] for c in clauses if 1 == len(c)])
+
+        while True:
+
+            if conflict:
+                #--- Undo back to the most recent unflipped decision
+                self.BACKTRACK_COUNT += 1
+                while decisions and decisions[-1][2]:
+                    self._it_undo(decisions.pop()[0])
+                if not decisions:
+                    return [0]
+                (pos, lit, flipped) = decisions.pop()
+                self._it_undo(pos)
+                decisions.append((pos, -lit, True))
+                self._it_node(len(decisions))
+                conflict = not self._it_propagate([-lit])
+                continue
+
+            #--- Check the search budgets
+            if self.NODE_BUDGET and self.NODE_COUNT >= self.NODE_BUDGET:
+                self.timedout = True
+                return [0]
+
+            if self.TIMEOUT and (0 == (self.NODE_COUNT & 63)) and (clock() - self.start_time) > self.TIMEOUT:
+                if not self.timedout:
+                    print (str(self.NODE_COUNT) + "," + str(float(self.MAX_DEPTH) / float(max(self.TARGET_DEPTH, 1))))
+                self.timedout = True
+                return [0]
+
+            #--- See if we've satisfied all of the clauses
+            if self.it_num_sat == len(clauses):
+                return list(self.it_trail)
+
+            lit = self._it_pick_lit()
+
+            if self.debug:
+                print ("Variable and setting picked: " + str(lit))
+
+            decisions.append((len(self.it_trail), lit, False))
+            self._it_node(len(decisions))
+            conflict = not self._it_propagate([lit])
+
+    def _it_node(self, depth):
+        self.NODE_COUNT += 1
+        self.SUM_DEPTH += depth
+        self.DEPTH_HISTOGRAM[depth] += 1
+        if depth > self.MAX_DEPTH:
+            self.MAX_DEPTH = depth
+            print (str(self.NODE_COUNT) + "," + str(float(self.MAX_DEPTH) / float(max(self.TARGET_DEPTH, 1))))
+
+    def _it_propagate(self, lits):
+        """Assign the literals and everything they imply. False on conflict."""
+        assign = self.it_assign
+        clauses = self.it_clauses
+        occ = self.it_occ
+        n_true = self.it_true
+        n_false = self.it_false
+        queue = lits
+
+        while queue:
+            lit = queue.pop()
+            if 1 == assign[lit]:
+                continue
+            if -1 == assign[lit]:
+                return False
+
+            assign[lit] = 1
+            assign[-lit] = -1
+            self.it_trail.append(lit)
+
+            for ci in occ[lit]:
+                n_true[ci] += 1
+                if 1 == n_true[ci]:
+                    self.it_num_sat += 1
+
+            # Every counter is updated before reporting a conflict so that
+            #  the undo stays exact
+            conflict = False
+            for ci in occ[-lit]:
+                n_false[ci] += 1
+                if 0 == n_true[ci]:
+                    size = len(clauses[ci])
+                    if n_false[ci] == size:
+                        conflict = True
+                    elif n_false[ci] == size - 1:
+                        for other in clauses[ci]:
+                            if 0 == assign[other]:
+                                queue.append(other)
+                                break
+            if conflict:
+                return False
+
+        return True
+
+    def _it_undo(self, pos):
+        """Pop the trail back to length pos, reversing the counter updates."""
+        assign = self.it_assign
+        occ = self.it_occ
+        n_true = self.it_true
+        n_false = self.it_false
+        trail = self.it_trail
+
+        while len(trail) > pos:
+            lit = trail.pop()
+            assign[lit] = 0
+            assign[-lit] = 0
+            for ci in occ[lit]:
+                n_true[ci] -= 1
+                if 0 == n_true[ci]:
+                    self.it_num_sat -= 1
+            for ci in occ[-lit]:
+                n_false[ci] -= 1
+
+    def _it_pick_lit(self):
+        assign = self.it_assign
+        n = self.theory.num_vars
+        free = [v for v in range(1, n + 1) if 0 == assign[v]]
+
+        if 'static' == self.voh:
+            return free[-1] * random.choice([-1, 1])
+
+        elif 'random' == self.voh:
+            return random.choice(free) * random.choice([-1, 1])
+
+        else:
+            #--- Most occurrences in the clauses that are not yet satisfied
+            best_lit = free[0]
+            best_count = -1
+            for v in free:
+                pos = len([ci for ci in self.it_occ[v] if 0 == self.it_true[ci]])
+                neg = len([ci for ci in self.it_occ[-v] if 0 == self.it_true[ci]])
+                if pos + neg > best_count:
+                    best_count = pos + neg
+                    best_lit = -v if neg > pos else v
+            return best_lit
+
     def set_variable(self, cls_list, var, sign):
 
         new_clause_list = []
@@ -391,29 +636,37 @@ if __name__ == '__main__':
     import os
     myargs, flags = getopts(argv)
 
-    if not myargs.has_key('-i'):
+    if '-i' not in myargs:
         print ("Must specify input:")
         print (USAGE_STRING)
         os._exit(1)
 
     use_gui = True
-    if myargs.has_key('-gui'):
+    if '-gui' in myargs:
         if myargs['-gui'] == "off":
             use_gui = False
 
     display_search_tree = False
-    if myargs.has_key('-showtree'):
+    if '-showtree' in myargs:
         if myargs['-showtree'] == "on":
             display_search_tree = True
 
     timeout = 120
-    if myargs.has_key('-timeout'):
+    if '-timeout' in myargs:
         timeout = int(myargs['-timeout'])
 
-    coh = 'random'
-    if myargs.has_key('-voh'):
+    voh = 'random'
+    if '-voh' in myargs:
         voh = myargs['-voh']
 
+    iterative = False
+    if '-mode' in myargs:
+        iterative = (myargs['-mode'] == "iterative")
+
+    node_budget = None
+    if '-nodes' in myargs:
+        node_budget = int(myargs['-nodes'])
+
     if 'DEBUG' in flags:
         debug = True
     else:
@@ -425,5 +678,5 @@ if __name__ == '__main__':
         disable_results = False
 
 
-    solver = DPLL(myargs['-i'], debug, timeout, voh)
-    solver.solve(use_gui=use_gui, display_search_tree=display_search_tree, disable_results=disable_results)
+    solver = DPLL(myargs['-i'], debug, timeout, voh, node_budget)
+    solver.solve(use_gui=use_gui, display_search_tree=display_search_tree, disable_results=disable_results, iterative=iterative)
@@ -1,39 +1,169 @@
-import re
+import time
+from array import array
+from itertools import compress, count
+from operator import not_, sub
+
+from krrt.utils import open_file
 from .CNF import *
 
+# Number of bytes read from the input at a time
+CHUNK_SIZE = 1 << 22
+
 def nullCNF():
     """Return a default CNF Formula (no clauses / variables)"""
     return Formula()
 
-def parseFile(file):
-    """Parse a Dimacs CNF file and return the appropriate CNF Formula Object"""
-    
-    pComment = re.compile('c.*')
-    pStats = re.compile('p\s*cnf\s*(\d*)\s*(\d*)')
-    
-    formula = Formula()
-    
-    f = open(file, 'r')
-    file_lines = f.readlines()
+def parseFile(file, compact = False, stats = None, verbose = False, chunk_size = CHUNK_SIZE):
+    """
+    Parse a Dimacs CNF file and return the appropriate CNF Formula Object
+
+    The file is streamed in large chunks and the integers are tokenized a
+    chunk at a time, so clauses may freely span lines or share a line.
+    Files compressed with gzip, bzip2 or xz are decompressed on the fly.
+
+        compact:    Return a CompactFormula rather than a Formula.
+        stats:      Optional dict that is filled with the parse statistics
+                    (bytes, clauses, literals, seconds, MB/s).
+        verbose:    Print the parse throughput when done.
+    """
+
+    start = time.time()
+
+    if compact:
+        formula = CompactFormula()
+    else:
+        formula = Formula()
+
+    parser = _ChunkParser(formula)
+
+    f = open_file(file, 'rb')
+    carry = b''
+    while not parser.finished:
+        data = f.read(chunk_size)
+        if not data:
+            break
+        parser.num_bytes += len(data)
+
+        # Only hand over complete lines so that comments are never split
+        data = carry + data
+        cut = data.rfind(b'\n')
+        if -1 == cut:
+            carry = data
+            continue
+        carry = data[cut+1:]
+        parser.parse(data[:cut+1])
     f.close()
-    
-    while len(file_lines) > 0:
-        line = file_lines.pop(0)
-        
-        # Only deal with lines that aren't comments
-        if not pComment.match(line) and not pStats.match(line):
-            nums = line.rstrip('\n').split(' ')
-            cls = []
-            for lit in nums[:-1]:
-                if lit != '':
-                    num = abs(int(lit))
-                    if int(lit) < 0:
-                        cls.append(Not(num))
-                    else:
-                        cls.append(num)
-            
-            if len(cls) > 0:
-                formula.addClause(cls)
-    
+
+    if carry and not parser.finished:
+        parser.parse(carry)
+    parser.finish()
+
+    elapsed = time.time() - start
+    results = {'bytes': parser.num_bytes,
+               'clauses': formula.num_clauses,
+               'literals': parser.num_literals,
+               'declared_vars': parser.declared_vars,
+               'declared_clauses': parser.declared_clauses,
+               'seconds': elapsed,
+               'MB/s': parser.num_bytes / (1024.0 * 1024.0) / max(elapsed, 1e-9)}
+
+    if stats is not None:
+        stats.update(results)
+
+    if verbose:
+        print ("Parsed %d clauses (%d literals, %.1f MB) in %.2fs -- %.1f MB/s" % \
+               (results['clauses'], results['literals'], results['bytes'] / (1024.0 * 1024.0),
+                results['seconds'], results['MB/s']))
+
+    if parser.declared_clauses is not None and parser.declared_clauses != formula.num_clauses:
+        print ("Warning: Header declared %d clauses, but %d were found." % \
+               (parser.declared_clauses, formula.num_clauses))
+
     return formula
-    
+
+
+class _ChunkParser:
+    """Turns chunks of complete Dimacs lines into clauses of a formula."""
+
+    def __init__(self, formula):
+        self.formula = formula
+        self.compact = isinstance(formula, CompactFormula)
+        self.pending = array('i')
+        self.finished = False
+        self.num_bytes = 0
+        self.num_literals = 0
+        self.declared_vars = None
+        self.declared_clauses = None
+
+    def parse(self, data):
+        # Numeric lines never contain these characters, so the common case
+        #  can skip the line by line scan entirely
+        if b'c' in data or b'p' in data or b'%' in data:
+            data = self._stripLines(data)
+
+        nums = array('i', map(int, data.split()))
+        if 0 == len(nums):
+            return
+
+        top = max(max(nums), -min(nums))
+        if top > self.formula.num_vars:
+            self.formula.reserveVariables(top)
+
+        if self.pending:
+            self.pending.extend(nums)
+            nums = self.pending
+
+        # Every 0 terminates a clause; whatever trails the last one is kept
+        #  for the next chunk
+        zeros = list(compress(count(), map(not_, nums)))
+        if not zeros:
+            self.pending = nums
+            return
+        last = zeros[-1]
+        self.pending = nums[last+1:]
+        self.num_literals += last + 1 - len(zeros)
+
+        if self.compact:
+            # Bulk copy the literals, and recover each clause end from the
+            #  position of its 0 minus the number of 0's before it
+            formula = self.formula
+            base = len(formula.literals)
+            formula.literals.extend(filter(None, nums[:last]))
+            formula.offsets.extend(map(sub, zeros, range(-base, len(zeros) - base)))
+        else:
+            start = 0
+            for stop in zeros:
+                self.formula.addIntClause(nums[start:stop].tolist())
+                start = stop + 1
+
+    def finish(self):
+        # A final clause without the terminating 0
+        if self.pending:
+            self.num_literals += len(self.pending)
+            self.formula.addIntClause(self.pending.tolist())
+            self.pending = array('i')
+
+    def _stripLines(self, data):
+        keep = []
+        for line in data.split(b'\n'):
+            token = line.lstrip()[:1]
+            if b'c' == token:
+                continue
+            elif b'p' == token:
+                self._parseHeader(line)
+            elif b'%' == token:
+                # Old SATLIB files terminate the clauses with a '%' line
+                self.finished = True
+                break
+            else:
+                keep.append(line)
+        return b' '.join(keep)
+
+    def _parseHeader(self, line):
+        parts = line.split()
+        assert len(parts) >= 4 and b'cnf' == parts[1], "Bad header line: %s" % line
+        self.declared_vars = int(parts[2])
+        self.declared_clauses = int(parts[3])
+
+        # Create the variables up front so the numbering matches the file
+        self.formula.reserveVariables(self.declared_vars)
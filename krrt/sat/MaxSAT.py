@@ -0,0 +1,275 @@
+import time
+
+from krrt.sat.CNF import Formula, LevelWeightedFormula
+from krrt.sat.CDCL import IncrementalSolver
+
+
+def maxsat(theory, **options):
+    """Solve a weighted formula, returning the MaxSAT object (see MaxSAT)."""
+    solver = MaxSAT(theory, **options)
+    solver.solve()
+    return solver
+
+
+class MaxSAT:
+    """
+    Core-guided (OLL, as in RC2) MaxSAT solver for the WeightedFormula
+    family, on top of the incremental CDCL solver.
+
+    Every soft clause C gets an assumption literal a, with the hard clause
+    -a | C (unit soft clauses use their literal directly). Each unsatisfiable
+    core of assumptions raises the lower bound by the smallest weight w in
+    the core, and takes w off every assumption in it. The core literals are
+    then counted with a totalizer, and "at most one of them is false" is
+    assumed with weight w. When such a bound shows up in a later core it is
+    loosened by one, again with the weight of that core. Every model found
+    gives an upper bound.
+
+    With stratify, the soft clauses are added in strata of decreasing
+    importance: the levels of a LevelWeightedFormula (highest first), or
+    otherwise the distinct weights. The search finishes a stratum before
+    adding the next, keeping the cores found so far.
+
+    Weights of -1 mark hard clauses. For the level formulas, the weight of
+    a soft clause is its weight plus the offset of its level, exactly as
+    written by writeCNF. Bounds are printed as they improve when verbose,
+    and passed to on_bound(lower, upper) if given.
+    """
+
+    def __init__(self, theory, stratify = True, timeout = None, verbose = False,
+                 on_bound = None, **solver_options):
+
+        self.theory = theory
+        self.stratify = stratify
+        self.TIMEOUT = timeout
+        self.verbose = verbose
+        self.on_bound = on_bound
+        self.timedout = False
+
+        self.num_vars = theory.num_vars
+        self.sat = IncrementalSolver(Formula(), **solver_options)
+        self.sat.theory.reserveVariables(self.num_vars)
+        self.hard_ok = True
+
+        self.soft = []          # original soft clauses as (lits, weight)
+        self.strata = []        # lists of indices into soft
+        self._loadTheory()
+
+        # Working assumptions: weight of each, and the (outputs, bound) of totalizer bounds
+        self.weight = {}
+        self.sums = {}
+
+        self.model = None
+        self.cost = None
+        self.lower_bound = 0
+        self.upper_bound = None
+
+        self.SAT_CALLS = 0
+        self.CORES = 0
+        self.SUM_CORE = 0
+
+    #--- Loading
+
+    def _loadTheory(self):
+        theory = self.theory
+        if isinstance(theory, LevelWeightedFormula):
+            offsets = {}
+            total = 0
+            for level in sorted(theory.getLevels()):
+                offsets[level] = total
+                total += theory.level_weight(level, total)
+
+            by_level = {}
+            for (lits, weight, level) in theory.iterIntLevelClauses():
+                if -1 == weight:
+                    self._addHard(lits)
+                else:
+                    by_level.setdefault(level, []).append(len(self.soft))
+                    self.soft.append((lits, weight + offsets[level]))
+            groups = [by_level[level] for level in sorted(by_level, reverse = True)]
+
+        else:
+            for (lits, weight) in theory.iterIntWeightedClauses():
+                if -1 == weight:
+                    self._addHard(lits)
+                else:
+                    self.soft.append((lits, weight))
+            by_weight = {}
+            for (i, (lits, weight)) in enumerate(self.soft):
+                by_weight.setdefault(weight, []).append(i)
+            groups = [by_weight[w] for w in sorted(by_weight, reverse = True)]
+
+        if self.stratify and groups:
+            self.strata = groups
+        else:
+            self.strata = [list(range(len(self.soft)))]
+
+    def _addHard(self, lits):
+        if 0 == len(lits):
+            self.hard_ok = False
+        self.sat.addIntClause(list(lits))
+
+    def _newVar(self):
+        formula = self.sat.theory
+        formula.reserveVariables(formula.num_vars + 1)
+        return formula.num_vars
+
+    def _addSoft(self, lits, weight):
+        lits = list(set(lits))
+        if 1 == len(lits):
+            a = lits[0]
+        else:
+            a = self._newVar()
+            self.sat.addIntClause([-a] + lits)
+        self.weight[a] = self.weight.get(a, 0) + weight
+
+    def _totalizer(self, lits):
+        """
+        Unary count of the true lits: output i is forced true once at least
+        i+1 of them are (only the upward direction is needed here).
+        """
+        if 1 == len(lits):
+            return list(lits)
+
+        left = self._totalizer(lits[:len(lits) // 2])
+        right = self._totalizer(lits[len(lits) // 2:])
+        outputs = [self._newVar() for i in range(len(lits))]
+        for a in range(len(left) + 1):
+            for b in range(len(right) + 1):
+                if a + b > 0:
+                    cls = [outputs[a + b - 1]]
+                    if a:
+                        cls.append(-left[a - 1])
+                    if b:
+                        cls.append(-right[b - 1])
+                    self.sat.addIntClause(cls)
+        return outputs
+
+    #--- Search
+
+    def solve(self):
+        """
+        Returns True once an optimal model is found (in model, with its
+        cost), False if the hard clauses are unsatisfiable and None on a
+        timeout (model and cost then hold the best model found, if any).
+        """
+        self.start_time = time.time()
+
+        if not self.hard_ok:
+            return False
+
+        for stratum in self.strata:
+            for i in stratum:
+                (lits, weight) = self.soft[i]
+                if 0 == len(lits):
+                    self.lower_bound += weight
+                elif weight > 0:
+                    self._addSoft(lits, weight)
+
+            result = self._solveStratum()
+            if result is not True:
+                return result
+            if self.upper_bound == self.lower_bound:
+                break
+
+        return True
+
+    def _solveStratum(self):
+        while True:
+            if self.TIMEOUT:
+                remaining = self.TIMEOUT - (time.time() - self.start_time)
+                if remaining <= 0:
+                    self.timedout = True
+                    return None
+                self.sat.solver.TIMEOUT = remaining
+
+            assumptions = [a for a in self.weight if self.weight[a] > 0]
+            self.SAT_CALLS += 1
+            result = self.sat.solve(assumptions)
+
+            if result is None:
+                self.timedout = True
+                return None
+
+            if result:
+                self._improve(self.sat.model)
+                return True
+
+            core = list(set(self.sat.core))
+            if not core:
+                return False
+
+            self.CORES += 1
+            self.SUM_CORE += len(core)
+            w = min([self.weight[a] for a in core])
+            self.lower_bound += w
+            self._report()
+
+            for a in core:
+                self.weight[a] -= w
+                if 0 == self.weight[a]:
+                    del self.weight[a]
+
+            # Loosen the totalizer bounds in the core by one
+            for a in core:
+                if a in self.sums:
+                    (outputs, bound) = self.sums[a]
+                    if bound + 1 < len(outputs):
+                        self._assumeSum(outputs, bound + 1, w)
+
+            if len(core) > 1:
+                self._assumeSum(self._totalizer([-a for a in core]), 1, w)
+
+    def _assumeSum(self, outputs, bound, weight):
+        """Assume that fewer than bound+1 of the totalizer inputs are true."""
+        a = -outputs[bound]
+        self.weight[a] = self.weight.get(a, 0) + weight
+        self.sums[a] = (outputs, bound)
+
+    def _improve(self, model):
+        value = [False] * (self.num_vars + 1)
+        for l in model[:self.num_vars]:
+            value[abs(l)] = l > 0
+
+        cost = 0
+        for (lits, weight) in self.soft:
+            if not any(value[abs(l)] == (l > 0) for l in lits):
+                cost += weight
+
+        if self.upper_bound is None or cost < self.upper_bound:
+            self.upper_bound = cost
+            self.cost = cost
+            self.model = [v if value[v] else -v for v in range(1, self.num_vars + 1)]
+            self._report()
+
+    def _report(self):
+        if self.verbose:
+            print ("Bounds: %d <= cost <= %s (%.2fs)" % (self.lower_bound, str(self.upper_bound),
+                                                         time.time() - self.start_time))
+        if self.on_bound:
+            self.on_bound(self.lower_bound, self.upper_bound)
+
+    #--- Results
+
+    def getModel(self):
+        """Return the best model as a dict from Variable to bool (None for Optimized formulas)."""
+        if self.model is None or not self.theory.mapping:
+            return None
+        unmapping = self.theory.unmapping
+        return {unmapping[abs(l)]: l > 0 for l in self.model if abs(l) < len(unmapping)}
+
+    def falsified(self):
+        """Return the (DIMACS clause, weight) pairs the best model falsifies."""
+        if self.model is None:
+            return None
+        value = set(self.model)
+        return [(lits, weight) for (lits, weight) in self.soft if not any(l in value for l in lits)]
+
+    def print_stats(self):
+        print ("SAT Calls: " + str(self.SAT_CALLS))
+        print ("Cores: " + str(self.CORES))
+        print ("Avg Core Size: " + str(float(self.SUM_CORE) / max(self.CORES, 1)))
+        print ("Strata: " + str(len(self.strata)))
+        print ("Lower Bound: " + str(self.lower_bound))
+        print ("Upper Bound: " + str(self.upper_bound))
+        print ("Time: %.2f" % (time.time() - self.start_time))
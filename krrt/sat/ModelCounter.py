@@ -0,0 +1,170 @@
+import sys
+import time
+
+from krrt.sat.CNF import Formula
+from krrt.sat.Dimacs import parseFile
+from krrt.sat.Compiler import assign, components, pick_var, canonical_clauses, \
+                              ComponentCache, CACHE_SIZE
+
+
+USAGE_STRING = "\n\
+Usage: python ModelCounter.py -<option> <argument> -<option> <argument> ... <FLAG> <FLAG> ...\n\n\
+        Where options are:\n\
+          -i <input-file>\n\
+          -timeout <timeout>\n\
+          -cache <max cached literals>\n\n\
+        And the flags include:\n\
+          DISABLE_STATS\n\
+        "
+
+def count(theory, **options):
+    """Count the models of a Formula (or DIMACS file) (see ModelCounter)."""
+    return ModelCounter(theory, **options).count()
+
+
+class _Timeout(Exception):
+    pass
+
+
+class ModelCounter:
+    """
+    Exact (#SAT) model counter working directly on a Formula, without
+    building a circuit. The search is the one of krrt.sat.Compiler:
+    unit propagation after every decision, independent counting (and
+    multiplying) of components that share no variables, and an LRU
+    component cache bounded by cache_size literals.
+
+    Branching picks the variable with the most occurrences in the
+    component, trying its more frequent polarity first, as in
+    DPLL.vsids_pick_var.
+    """
+
+    def __init__(self, theory, cache_size = CACHE_SIZE, timeout = None, verbose = False):
+
+        if not isinstance(theory, Formula):
+            theory = parseFile(theory)
+        self.theory = theory
+        self.cache = ComponentCache(cache_size)
+        self.TIMEOUT = timeout
+        self.verbose = verbose
+        self.timedout = False
+
+        self.NODE_COUNT = 0
+        self.DECOMPOSITIONS = 0
+        self.CONFLICTS = 0
+
+    def count(self):
+        """Return the number of models over all of the variables, or None on a timeout."""
+        self.start_time = time.time()
+
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, 10 * self.theory.num_vars + 1000))
+        try:
+            result = self._countTheory()
+        except _Timeout:
+            self.timedout = True
+            result = None
+        finally:
+            sys.setrecursionlimit(limit)
+
+        if self.verbose:
+            self.print_stats()
+
+        return result
+
+    def print_stats(self):
+        print ("Nodes Explored: " + str(self.NODE_COUNT))
+        print ("Decompositions: " + str(self.DECOMPOSITIONS))
+        print ("Conflicts: " + str(self.CONFLICTS))
+        print ("Cache Hit Rate: %.3f (%d hits, %d misses)" % (self.cache.hit_rate(), self.cache.HITS, self.cache.MISSES))
+        print ("Cache Entries: %d (%d evicted)" % (len(self.cache), self.cache.EVICTIONS))
+        print ("Time: %.2f" % (time.time() - self.start_time))
+
+    #--- Counting internals
+
+    def _countTheory(self):
+        clauses = canonical_clauses(self.theory)
+        if clauses is None:
+            return 0
+        result = assign(clauses, [])
+        if result is None:
+            return 0
+        (implied, rest) = result
+        free = self.theory.num_vars - len(implied) - len(_variables(rest))
+        return 2**free * self._count(rest)
+
+    def _count(self, clauses):
+        """Count the models of clauses over the variables they mention."""
+        if not clauses:
+            return 1
+
+        if self.TIMEOUT and (time.time() - self.start_time) > self.TIMEOUT:
+            raise _Timeout()
+
+        key = frozenset(clauses)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        comps = components(clauses)
+        if len(comps) > 1:
+            self.DECOMPOSITIONS += 1
+            total = 1
+            for comp in comps:
+                total *= self._count(comp)
+                if 0 == total:
+                    break
+
+        else:
+            self.NODE_COUNT += 1
+            num_vars = len(_variables(clauses))
+            first = pick_var(clauses)
+            total = 0
+            for lit in [first, -first]:
+                assigned = assign(clauses, [lit])
+                if assigned is None:
+                    self.CONFLICTS += 1
+                    continue
+                (implied, rest) = assigned
+                sub = self._count(rest)
+                if 0 == sub:
+                    self.CONFLICTS += 1
+                    continue
+                total += 2**(num_vars - len(implied) - len(_variables(rest))) * sub
+
+        self.cache.put(key, total)
+        return total
+
+
+def _variables(clauses):
+    return set([abs(l) for cls in clauses for l in cls])
+
+
+if __name__ == '__main__':
+    from krrt.utils import get_opts
+    import os
+    myargs, flags = get_opts()
+
+    if '-i' not in myargs:
+        print ("Must specify input:")
+        print (USAGE_STRING)
+        os._exit(1)
+
+    timeout = None
+    if '-timeout' in myargs:
+        timeout = int(myargs['-timeout'])
+
+    cache_size = CACHE_SIZE
+    if '-cache' in myargs:
+        cache_size = int(myargs['-cache'])
+
+    counter = ModelCounter(myargs['-i'], cache_size = cache_size, timeout = timeout)
+    result = counter.count()
+
+    if 'DISABLE_STATS' not in flags:
+        counter.print_stats()
+
+    if result is None:
+        print (" -timeout- ")
+    else:
+        print ("Models: " + str(result))
@@ -0,0 +1,305 @@
+import os
+import sys
+import time
+import random
+import multiprocessing
+from array import array
+
+# Shared memory needs python >= 3.8
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+try:
+    from queue import Empty
+except ImportError:
+    from Queue import Empty
+
+from krrt.sat.CNF import Formula, CompactFormula
+from krrt.sat.Dimacs import parseFile
+from krrt.sat.CDCL import CDCL
+from krrt.sat.DPLL import DPLL, clock
+
+
+USAGE_STRING = "\n\
+Usage: python Portfolio.py -<option> <argument> -<option> <argument> ... <FLAG> <FLAG> ...\n\n\
+        Where options are:\n\
+          -i <input-file>\n\
+          -timeout <timeout>\n\
+          -processes <max worker processes>\n\n\
+        And the flags include:\n\
+          DISABLE_STATS\n\
+        "
+
+# The default portfolio: CDCL under different heuristics, restart policies
+# and seeds, plus the iterative DPLL as a fallback for small instances
+CONFIGS = [
+    {'solver': 'cdcl', 'voh': 'vsids', 'restarts': 'luby', 'seed': 0},
+    {'solver': 'cdcl', 'voh': 'vsids', 'restarts': 'geometric', 'seed': 1},
+    {'solver': 'cdcl', 'voh': 'vsids', 'restarts': 'none', 'seed': 2},
+    {'solver': 'cdcl', 'voh': 'random', 'restarts': 'luby', 'seed': 3},
+    {'solver': 'cdcl', 'voh': 'static', 'restarts': 'luby', 'seed': 4},
+    {'solver': 'dpll', 'voh': 'vsids', 'seed': 5},
+]
+
+
+def solve(theory, **options):
+    """Solve a Formula (or DIMACS file) with a portfolio, returning the Portfolio object."""
+    portfolio = Portfolio(theory, **options)
+    portfolio.solve()
+    return portfolio
+
+
+def describe(config):
+    """Short description of a configuration, e.g. 'cdcl voh=vsids restarts=luby seed=0'."""
+    return ' '.join([config['solver']] + ["%s=%s" % (k, str(config[k])) for k in sorted(config) if 'solver' != k])
+
+
+class Portfolio:
+    """
+    Parallel portfolio of solver configurations over the same Formula.
+
+    The clauses are packed once into a shared memory block (a header with
+    the number of variables and clauses, the int64 clause offsets and the
+    int32 literals, as in CompactFormula), and every configuration runs in
+    its own worker process that loads its solver straight from that block.
+    The first worker to prove the formula satisfiable or unsatisfiable
+    wins, and the rest are terminated.
+
+    A configuration is a dict with the solver ('cdcl' or 'dpll'), its
+    variable ordering heuristic (voh), the restart policy (CDCL only) and
+    a random seed. At most processes workers run at once (all of them by
+    default), and queued configurations start as others give up.
+    """
+
+    def __init__(self, theory, configs = None, processes = None, timeout = None,
+                 verbose = False):
+
+        assert shared_memory is not None, "The portfolio needs multiprocessing.shared_memory (python >= 3.8)"
+
+        if not isinstance(theory, Formula):
+            theory = parseFile(theory, compact = True)
+        self.theory = theory
+        self.configs = list(configs or CONFIGS)
+        self.processes = processes or len(self.configs)
+        self.TIMEOUT = timeout
+        self.verbose = verbose
+        self.timedout = False
+
+        for config in self.configs:
+            assert config.get('solver') in ['cdcl', 'dpll'], "Unknown solver in config: %s" % str(config)
+
+        self.result = None
+        self.model = None
+        self.winner = None
+        self.stats = {}
+
+    def solve(self):
+        """
+        Returns True (with the model of the winner in model), False if the
+        formula is unsatisfiable, or None if every configuration timed out.
+        """
+        self.start_time = time.time()
+
+        shm = _share(self.theory)
+        results = multiprocessing.Queue()
+        pending = list(range(len(self.configs)))
+        running = {}
+
+        try:
+            while pending or running:
+                while pending and len(running) < self.processes:
+                    i = pending.pop(0)
+                    proc = multiprocessing.Process(target = _work,
+                                                   args = (i, self.configs[i], shm.name,
+                                                           self._remaining(), results))
+                    proc.daemon = True
+                    proc.start()
+                    running[i] = proc
+
+                remaining = self._remaining()
+                if remaining is not None and remaining <= 0:
+                    self.timedout = True
+                    break
+
+                try:
+                    (i, result, model, stats) = results.get(timeout = remaining)
+                except Empty:
+                    self.timedout = True
+                    break
+
+                running.pop(i).join()
+                self.stats[i] = stats
+                if self.verbose:
+                    print ("%s: %s (%.2fs)" % (describe(self.configs[i]), str(result), stats['time']))
+
+                if result is not None:
+                    self.result = result
+                    self.model = model
+                    self.winner = i
+                    break
+
+        finally:
+            for proc in running.values():
+                proc.terminate()
+            for proc in running.values():
+                proc.join()
+            results.close()
+            shm.close()
+            shm.unlink()
+
+        return self.result
+
+    def _remaining(self):
+        if not self.TIMEOUT:
+            return None
+        return self.TIMEOUT - (time.time() - self.start_time)
+
+    def getModel(self):
+        """Return the model of the winner as a dict from Variable to bool."""
+        if self.model is None:
+            return None
+        unmapping = self.theory.unmapping
+        return {unmapping[abs(l)]: l > 0 for l in self.model if abs(l) < len(unmapping)}
+
+    def print_stats(self):
+        if self.winner is None:
+            print ("Winner: none")
+        else:
+            print ("Winner: " + describe(self.configs[self.winner]))
+            for (k, v) in sorted(self.stats[self.winner].items()):
+                print ("  %s: %s" % (k, str(v)))
+        print ("Configurations: " + str(len(self.configs)))
+        print ("Time: %.2f" % (time.time() - self.start_time))
+
+
+#--- Shared clause storage
+
+def _share(theory):
+    """Pack the clauses of theory into a new shared memory block."""
+    offsets = [0]
+    literals = []
+    for cls in theory.iterIntClauses():
+        literals.extend(cls)
+        offsets.append(len(literals))
+
+    num_clauses = len(offsets) - 1
+    size = 8 * (2 + len(offsets)) + 4 * len(literals)
+    shm = shared_memory.SharedMemory(create = True, size = max(size, 1))
+
+    header = shm.buf[:8 * (2 + len(offsets))].cast('q')
+    header[0] = theory.num_vars
+    header[1] = num_clauses
+    header[2:] = _view(offsets, 'q')
+    header.release()
+
+    lits = shm.buf[8 * (2 + len(offsets)):size].cast('i')
+    lits[:] = _view(literals, 'i')
+    lits.release()
+
+    return shm
+
+
+def _view(values, code):
+    return memoryview(array(code, values))
+
+
+def _load(buf):
+    """Unpack a shared block into (num_vars, offsets, literals) arrays."""
+    head = buf[:16].cast('q')
+    (num_vars, num_clauses) = (head[0], head[1])
+    head.release()
+
+    end = 8 * (3 + num_clauses)
+    view = buf[16:end].cast('q')
+    offsets = array('q', view)
+    view.release()
+
+    view = buf[end:end + 4 * offsets[-1]].cast('i')
+    literals = array('i', view)
+    view.release()
+
+    return (num_vars, offsets, literals)
+
+
+def _work(index, config, name, timeout, results):
+    start = time.time()
+    shm = shared_memory.SharedMemory(name = name)
+    try:
+        (num_vars, offsets, literals) = _load(shm.buf)
+    finally:
+        shm.close()
+
+    # Keep the solvers' progress output out of the parent's terminal
+    sys.stdout = open(os.devnull, 'w')
+
+    try:
+        if 'cdcl' == config['solver']:
+            solver = CDCL(None, timeout = timeout, voh = config.get('voh', 'vsids'),
+                          restarts = config.get('restarts', 'luby'), seed = config.get('seed'))
+            solver.growTo(num_vars)
+            for i in range(len(offsets) - 1):
+                if not solver.addClause(literals[offsets[i]:offsets[i + 1]].tolist()):
+                    break
+            result = solver.solve()
+            model = solver.model
+            stats = {'decisions': solver.NODE_COUNT, 'conflicts': solver.BACKTRACK_COUNT,
+                     'restarts': solver.RESTART_COUNT}
+
+        else:
+            random.seed(config.get('seed'))
+            theory = CompactFormula()
+            theory.reserveVariables(num_vars)
+            theory.literals = literals
+            theory.offsets = offsets
+            solver = DPLL(theory, False, timeout, config.get('voh', 'vsids'))
+            # DPLL measures its timeout against its own clock
+            solver.start_time = clock()
+            trail = solver.solve_iterative()
+            if solver.timedout:
+                (result, model) = (None, None)
+            elif [0] == trail:
+                (result, model) = (False, None)
+            else:
+                true = set(trail)
+                (result, model) = (True, [v if v in true else -v for v in range(1, num_vars + 1)])
+            stats = {'nodes': solver.NODE_COUNT, 'backtracks': solver.BACKTRACK_COUNT}
+
+    except Exception as e:
+        (result, model, stats) = (None, None, {'error': repr(e)})
+
+    stats['time'] = time.time() - start
+    results.put((index, result, model, stats))
+
+
+if __name__ == '__main__':
+    from krrt.utils import get_opts
+    myargs, flags = get_opts()
+
+    if '-i' not in myargs:
+        print ("Must specify input:")
+        print (USAGE_STRING)
+        os._exit(1)
+
+    timeout = None
+    if '-timeout' in myargs:
+        timeout = int(myargs['-timeout'])
+
+    processes = None
+    if '-processes' in myargs:
+        processes = int(myargs['-processes'])
+
+    portfolio = Portfolio(myargs['-i'], processes = processes, timeout = timeout)
+    result = portfolio.solve()
+
+    if 'DISABLE_STATS' not in flags:
+        portfolio.print_stats()
+
+    print ("\n\nSolution:")
+    if result is None:
+        print (" -timeout- ")
+    elif result:
+        print (portfolio.model)
+    else:
+        print (" -unsatisfiable- ")
@@ -0,0 +1,367 @@
+import time
+
+
+def preprocess(theory, **options):
+    """
+    Simplify a Formula and return the Preprocessor that did so. The
+    simplified Formula is in its formula attribute, and its models can be
+    mapped back to the original theory with reconstruct / mapModel.
+    """
+    pre = Preprocessor(theory, **options)
+    pre.run()
+    return pre
+
+
+class Preprocessor:
+    """
+    CNF preprocessing over the DIMACS integers of a Formula.
+
+    The clauses are kept as sets, indexed by per-literal occurrence sets,
+    and simplified with
+        - unit propagation,
+        - backward subsumption,
+        - self-subsuming strengthening,
+        - bounded variable elimination, and
+        - failed literal probing,
+    repeated until nothing changes or the time budget runs out.
+
+    Subsumption, strengthening and probing preserve equivalence. Units and
+    eliminated variables are recorded on a reconstruction stack of
+    (pivot literal, clause) pairs, which is replayed in reverse to extend a
+    model of the simplified formula to the original variables.
+
+        time_budget:        Seconds to spend in total (None for no limit).
+        elim_occ_limit:     Skip variables whose positive and negative
+                            occurrences both exceed this.
+        elim_clause_limit:  Never create a resolvent longer than this.
+        elim_grow:          How many more clauses an elimination may leave
+                            than it removes.
+        probe_limit:        Maximum number of variables probed per round.
+    """
+
+    def __init__(self, theory, time_budget = None, subsumption = True, elimination = True,
+                 probing = True, elim_occ_limit = 10, elim_clause_limit = 20, elim_grow = 0,
+                 probe_limit = 1000, verbose = False):
+
+        self.theory = theory
+        self.formula = None
+        self.TIME_BUDGET = time_budget
+        self.subsumption = subsumption
+        self.elimination = elimination
+        self.probing = probing
+        self.elim_occ_limit = elim_occ_limit
+        self.elim_clause_limit = elim_clause_limit
+        self.elim_grow = elim_grow
+        self.probe_limit = probe_limit
+        self.verbose = verbose
+
+        self.stack = []
+        self.conflict = False
+        self.timedout = False
+
+        self.SUBSUMED = 0
+        self.STRENGTHENED = 0
+        self.ELIMINATED = 0
+        self.FAILED_LITERALS = 0
+        self.UNITS = 0
+
+    def run(self):
+        """Simplify the theory, returning the simplified Formula."""
+        self.start_time = time.time()
+        self._load()
+
+        self._propagate()
+
+        changed = True
+        while changed and not self.conflict and not self._outOfTime():
+            changed = False
+            if self.subsumption:
+                changed = self._subsume() or changed
+            if self.elimination and not self.conflict:
+                changed = self._eliminate() or changed
+            if self.probing and not self.conflict:
+                changed = self._probe() or changed
+
+        self.formula = self._output()
+
+        if self.verbose:
+            self.print_stats()
+
+        return self.formula
+
+    def reconstruct(self, model):
+        """
+        Extend a model (DIMACS literals) of the simplified formula to a
+        model of the original theory, returned as a list of DIMACS literals
+        for every variable.
+        """
+        value = [False] * (self.num_vars + 1)
+        for lit in model:
+            if abs(lit) <= self.num_vars:
+                value[abs(lit)] = lit > 0
+
+        for (pivot, cls) in reversed(self.stack):
+            satisfied = False
+            for l in cls:
+                if value[abs(l)] == (l > 0):
+                    satisfied = True
+                    break
+            if not satisfied:
+                value[abs(pivot)] = pivot > 0
+
+        return [v if value[v] else -v for v in range(1, self.num_vars + 1)]
+
+    def mapModel(self, model):
+        """Return the reconstructed model as a dict from Variable to bool."""
+        unmapping = self.theory.unmapping
+        return {unmapping[abs(l)]: l > 0 for l in self.reconstruct(model)}
+
+    def print_stats(self):
+        print ("Subsumed Clauses: " + str(self.SUBSUMED))
+        print ("Strengthened Clauses: " + str(self.STRENGTHENED))
+        print ("Eliminated Variables: " + str(self.ELIMINATED))
+        print ("Failed Literals: " + str(self.FAILED_LITERALS))
+        print ("Units: " + str(self.UNITS))
+        if self.formula is not None:
+            print ("Clauses: %d -> %d" % (self.theory.num_clauses, self.formula.num_clauses))
+        print ("Time: %.2f" % (time.time() - self.start_time))
+
+    #--- Clause database
+
+    def _load(self):
+        n = self.theory.num_vars
+        self.num_vars = n
+        self.clauses = []
+        self.occ = [set() for i in range(2 * n + 1)]
+        self.value = [0] * (2 * n + 1)
+        self.eliminated = [False] * (n + 1)
+        self.units = []
+        self.touched = set()
+
+        for cls in self.theory.iterIntClauses():
+            self._addClause(set(cls))
+
+    def _outOfTime(self):
+        if self.TIME_BUDGET and (time.time() - self.start_time) > self.TIME_BUDGET:
+            self.timedout = True
+        return self.timedout
+
+    def _addClause(self, cls):
+        for l in cls:
+            if -l in cls:
+                return
+        if 0 == len(cls):
+            self.conflict = True
+        ci = len(self.clauses)
+        self.clauses.append(cls)
+        for l in cls:
+            self.occ[l].add(ci)
+        if 1 == len(cls):
+            self.units.append(ci)
+        self.touched.add(ci)
+
+    def _removeClause(self, ci):
+        for l in self.clauses[ci]:
+            self.occ[l].discard(ci)
+        self.clauses[ci] = None
+
+    def _strengthen(self, ci, lit):
+        cls = self.clauses[ci]
+        cls.discard(lit)
+        self.occ[lit].discard(ci)
+        self.touched.add(ci)
+        if 0 == len(cls):
+            self.conflict = True
+        elif 1 == len(cls):
+            self.units.append(ci)
+
+    def _propagate(self):
+        """Assign the pending unit clauses and everything they imply."""
+        while self.units and not self.conflict:
+            ci = self.units.pop()
+            cls = self.clauses[ci]
+            if cls is None or 1 != len(cls):
+                continue
+            lit = next(iter(cls))
+            if -1 == self.value[lit]:
+                self.conflict = True
+                break
+
+            self.value[lit] = 1
+            self.value[-lit] = -1
+            self.stack.append((lit, [lit]))
+            self.UNITS += 1
+
+            for cj in list(self.occ[lit]):
+                self._removeClause(cj)
+            for cj in list(self.occ[-lit]):
+                self._strengthen(cj, -lit)
+
+    #--- Subsumption and strengthening
+
+    def _subsume(self):
+        changed = False
+        queue = sorted([ci for ci in self.touched if self.clauses[ci] is not None],
+                       key = lambda ci: len(self.clauses[ci]))
+        self.touched = set()
+
+        for ci in queue:
+            if self.conflict or self._outOfTime():
+                break
+            cls = self.clauses[ci]
+            if cls is None:
+                continue
+
+            # Backward subsumption through the rarest literal of the clause
+            best = min(cls, key = lambda l: len(self.occ[l]))
+            for cj in list(self.occ[best]):
+                other = self.clauses[cj]
+                if cj != ci and len(other) >= len(cls) and cls <= other:
+                    self._removeClause(cj)
+                    self.SUBSUMED += 1
+                    changed = True
+
+            # Self-subsuming resolution: (C - l) | {-l} <= D lets -l go from D
+            for lit in list(cls):
+                rest = cls - set([lit])
+                for cj in list(self.occ[-lit]):
+                    other = self.clauses[cj]
+                    if cj != ci and len(other) >= len(cls) and rest <= other:
+                        self._strengthen(cj, -lit)
+                        self.STRENGTHENED += 1
+                        changed = True
+
+            self._propagate()
+
+        return changed
+
+    #--- Bounded variable elimination
+
+    def _eliminate(self):
+        changed = False
+        occ = self.occ
+        candidates = [v for v in range(1, self.num_vars + 1) \
+                      if not self.eliminated[v] and 0 == self.value[v] and (occ[v] or occ[-v])]
+        candidates.sort(key = lambda v: len(occ[v]) * len(occ[-v]))
+
+        for v in candidates:
+            if self.conflict or self._outOfTime():
+                break
+            if self.eliminated[v] or 0 != self.value[v]:
+                continue
+            if len(occ[v]) > self.elim_occ_limit and len(occ[-v]) > self.elim_occ_limit:
+                continue
+
+            resolvents = self._resolvents(v)
+            if resolvents is None:
+                continue
+
+            for ci in list(occ[v]):
+                self.stack.append((v, list(self.clauses[ci])))
+                self._removeClause(ci)
+            for ci in list(occ[-v]):
+                self.stack.append((-v, list(self.clauses[ci])))
+                self._removeClause(ci)
+            for r in resolvents:
+                self._addClause(r)
+
+            self.eliminated[v] = True
+            self.ELIMINATED += 1
+            changed = True
+            self._propagate()
+
+        return changed
+
+    def _resolvents(self, v):
+        """Return the non-tautological resolvents on v, or None if too many."""
+        pos = [self.clauses[ci] for ci in self.occ[v]]
+        neg = [self.clauses[ci] for ci in self.occ[-v]]
+        limit = len(pos) + len(neg) + self.elim_grow
+
+        resolvents = []
+        for p in pos:
+            p_rest = p - set([v])
+            for n in neg:
+                r = p_rest | (n - set([-v]))
+                tautology = False
+                for l in r:
+                    if -l in r:
+                        tautology = True
+                        break
+                if tautology:
+                    continue
+                if len(r) > self.elim_clause_limit:
+                    return None
+                resolvents.append(r)
+                if len(resolvents) > limit:
+                    return None
+        return resolvents
+
+    #--- Failed literal probing
+
+    def _probe(self):
+        changed = False
+        occ = self.occ
+        candidates = [v for v in range(1, self.num_vars + 1) \
+                      if not self.eliminated[v] and 0 == self.value[v] and occ[v] and occ[-v]]
+        candidates.sort(key = lambda v: -(len(occ[v]) + len(occ[-v])))
+
+        for v in candidates[:self.probe_limit]:
+            if self.conflict or self._outOfTime():
+                break
+            for lit in [v, -v]:
+                if 0 != self.value[lit]:
+                    continue
+                if self._failed(lit):
+                    self.FAILED_LITERALS += 1
+                    self._addClause(set([-lit]))
+                    self._propagate()
+                    changed = True
+
+        return changed
+
+    def _failed(self, lit):
+        """Check whether unit propagating lit leads to a conflict."""
+        value = self.value
+        assigned = {lit: True}
+        queue = [lit]
+
+        while queue:
+            x = queue.pop()
+            for ci in self.occ[-x]:
+                free = None
+                num_free = 0
+                satisfied = False
+                for l in self.clauses[ci]:
+                    if 1 == value[l] or l in assigned:
+                        satisfied = True
+                        break
+                    if -1 == value[l] or -l in assigned:
+                        continue
+                    free = l
+                    num_free += 1
+                if satisfied:
+                    continue
+                if 0 == num_free:
+                    return True
+                if 1 == num_free:
+                    assigned[free] = True
+                    queue.append(free)
+
+        return False
+
+    #--- Output
+
+    def _output(self):
+        formula = self.theory.__class__()
+        formula.mapping = dict(self.theory.mapping)
+        formula.unmapping = list(self.theory.unmapping)
+        formula.varnum = self.theory.varnum
+        formula.comments = list(self.theory.comments)
+
+        if self.conflict:
+            formula.setIntClauses([[]])
+        else:
+            formula.setIntClauses([sorted(cls, key = abs) for cls in self.clauses if cls is not None])
+
+        return formula
@@ -2,4 +2,11 @@
 from . import CNF
 from . import Dimacs
 from . import DPLL
+from . import CDCL
+from . import Preprocessor
 from . import dDNNF
+from . import Circuit
+from . import Compiler
+from . import ModelCounter
+from . import MaxSAT
+from . import Portfolio
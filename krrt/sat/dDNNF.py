@@ -1,6 +1,105 @@
 
-from krrt.utils import read_file
-from krrt.sat import CNF
+import weakref
+
+
+class NodeFactory:
+    """
+    Unique table for d-DNNF nodes. Asking for a node that is structurally
+    equal to a live one made before (same type, literal / switch and
+    children) returns the existing node, so equal subcircuits are shared
+    within and across transformations. Children are compared by identity,
+    which is enough since they come from the same table. The table only
+    holds weak references, so nodes no circuit uses any more are dropped.
+
+    Every traversal (see dDNNF._reset) starts a new pass. Nodes carry the
+    pass their memo fields belong to, and are cleared when a pass first
+    reaches them, from the root or through the table.
+    """
+
+    def __init__(self):
+        self.table = weakref.WeakValueDictionary()
+        self.current = 0
+        self.HITS = 0
+
+    def _unique(self, key, build):
+        node = self.table.get(key)
+        if node is None:
+            node = build()
+            node._pass = self.current
+            self.table[key] = node
+        else:
+            self.HITS += 1
+            self.refresh(node)
+        return node
+
+    def _childKey(self, children):
+        return tuple(sorted([(-1 if ch else -2) if bool == type(ch) else id(ch) for ch in children]))
+
+    def make_lit(self, lit):
+        return self._unique(('L', str(lit)), lambda: Lit(lit))
+
+    def make_and(self, children):
+        return self._unique(('A',) + self._childKey(children), lambda: And(children))
+
+    def make_or(self, children, switch_var = 0):
+        return self._unique(('O', str(switch_var)) + self._childKey(children),
+                            lambda: Or(children, switch_var))
+
+    def intern(self, root):
+        """Register an existing graph bottom-up, so later nodes can share it."""
+        if bool == type(root):
+            return
+        done = set()
+        stack = [(root, False)]
+        while stack:
+            (node, expanded) = stack.pop()
+            if id(node) in done:
+                continue
+            if not expanded:
+                stack.append((node, True))
+                for ch in node.children:
+                    if bool != type(ch) and id(ch) not in done:
+                        stack.append((ch, False))
+                continue
+            done.add(id(node))
+            if isinstance(node, Lit):
+                key = ('L', str(node.lit))
+            elif isinstance(node, Or):
+                key = ('O', str(node.switch_var)) + self._childKey(node.children)
+            else:
+                key = ('A',) + self._childKey(node.children)
+            self.table.setdefault(key, node)
+
+    def reset(self):
+        """Start a new pass, leaving the memo fields of every node stale."""
+        self.current += 1
+
+    def refresh(self, root):
+        """
+        Clear the memo fields of the nodes reachable from root that this
+        pass has not reached yet, without recursion.
+        """
+        if bool == type(root) or root._pass == self.current:
+            return
+        root._pass = self.current
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            _clear(node)
+            for ch in node.children:
+                if bool != type(ch) and ch._pass != self.current:
+                    ch._pass = self.current
+                    stack.append(ch)
+
+    def __len__(self):
+        return len(self.table)
+
+
+def _clear(node):
+    node._count = -1
+    node._nnf_index = -1
+    node._replacement = None
+
 
 class Node:
 
@@ -10,15 +109,17 @@ class Node:
         self._count = -1
         self._nnf_index = -1
         self._replacement = None
+        self._usedvars = None
+        self._pass = -1
 
     @property
     def usedvars(self):
-        if self._replacement is None:
-            self._replacement = set()
+        if self._usedvars is None:
+            self._usedvars = set()
             for ch in self.children:
                 if bool != type(ch):
-                    self._replacement = self._replacement | ch.usedvars
-        return self._replacement
+                    self._usedvars = self._usedvars | ch.usedvars
+        return self._usedvars
     
     @property
     def nnf_index(self):
@@ -41,37 +142,37 @@ class Node:
                 if ch not in [True,False]:
                     ch.crawl(seen)
 
-    def condition(self, lits):
+    def condition(self, lits, factory):
         if self._replacement is None:
             def recursively_apply(ch):
                 if ch in [True, False]:
                     return ch
                 else:
-                    return ch.condition(lits)
+                    return ch.condition(lits, factory)
             vals = [recursively_apply(ch) for ch in self.children]
-            self._replacement = self._compress(vals)
+            self._replacement = self._compress(vals, factory)
         return self._replacement
     
-    def forget(self, vars):
+    def forget(self, vars, factory):
         if self._replacement is None:
             def recursively_apply(ch):
                 if ch in [True, False]:
                     return ch
                 else:
-                    return ch.forget(vars)
+                    return ch.forget(vars, factory)
             vals = [recursively_apply(ch) for ch in self.children]
-            self._replacement = self._compress(vals)
+            self._replacement = self._compress(vals, factory)
         return self._replacement
 
-    def simplify(self):
+    def simplify(self, factory):
         if self._replacement is None:
             def recursively_apply(ch):
                 if ch in [True, False]:
                     return ch
                 else:
-                    return ch.simplify()
+                    return ch.simplify(factory)
             vals = [recursively_apply(ch) for ch in self.children]
-            self._replacement = self._compress(vals)
+            self._replacement = self._compress(vals, factory)
         return self._replacement
     
     def dual_children(self, vals):
@@ -92,23 +193,23 @@ class Node:
         self._nnf_index = len(nlist)
         nlist.append(self)
 
-    def ensure_vars(self, vars):
+    def ensure_vars(self, vars, factory):
         if 0 == len(vars):
             return self
         elif isinstance(self, And):
             parent = self
         elif isinstance(self, Lit) or isinstance(self, Or):
-            parent = And([self])
-            parent = parent.smooth()
+            parent = factory.make_and([self])
+            parent = parent.smooth(factory)
         else:
             assert False, "Not sure how to ensure variables for node type %s" % str(type(self))
 
         new_children = []
         for v in vars:
-            new_children.append(Or([Lit(v), Lit(v.negate())]))
+            new_children.append(factory.make_or([factory.make_lit(v), factory.make_lit(v.negate())]))
 
-        new_parent = And(parent.children + new_children)
-        new_parent = new_parent.smooth()
+        new_parent = factory.make_and(parent.children + new_children)
+        new_parent = new_parent.smooth(factory)
 
         return new_parent
         
@@ -129,7 +230,7 @@ class And(Node):
                     self._count[v] *= counts[ch][v]
         return self._count
 
-    def _compress(self, vals):
+    def _compress(self, vals, factory):
         new_vals = list(filter(lambda x: x != True, vals))
         if False in new_vals:
             return False
@@ -146,16 +247,16 @@ class And(Node):
                     final_vals.extend(ch.children)
                 else:
                     final_vals.append(ch)
-            return And(final_vals)
+            return factory.make_and(final_vals)
 
-    def smooth(self):
+    def smooth(self, factory):
         if self._replacement is None:
             new_vals = []
             new_vars = set()
             for ch in self.children:
-                new_vals.append(ch.smooth())
+                new_vals.append(ch.smooth(factory))
                 new_vars = new_vars | new_vals[-1]._vars
-            self._replacement = And(new_vals)
+            self._replacement = factory.make_and(new_vals)
             self._replacement._vars = new_vars
         return self._replacement
 
@@ -192,7 +293,7 @@ class Or(Node):
                     self._count[v] += counts[ch][v]
         return self._count
 
-    def _compress(self, vals):
+    def _compress(self, vals, factory):
         new_vals = list(filter(lambda x: x != False, vals))
         if True in new_vals:
             return True
@@ -209,17 +310,17 @@ class Or(Node):
                     final_vals.extend(ch.children)
                 else:
                     final_vals.append(ch)
-            return Or(final_vals)
+            return factory.make_or(final_vals)
 
-    def smooth(self):
+    def smooth(self, factory):
         if self._replacement is None:
             new_vals = []
             new_vars = set()
             for ch in self.children:
-                new_vals.append(ch.smooth())
+                new_vals.append(ch.smooth(factory))
                 new_vars = new_vars | new_vals[-1]._vars
-            final_vals = [ch.ensure_vars(new_vars - ch._vars) for ch in new_vals]
-            self._replacement = Or(final_vals)
+            final_vals = [ch.ensure_vars(new_vars - ch._vars, factory) for ch in new_vals]
+            self._replacement = factory.make_or(final_vals, self.switch_var)
             self._replacement._vars = new_vars
         return self._replacement
 
@@ -273,32 +374,32 @@ class Lit(Node):
             toret[self.lit.negate()] = 0
         return toret
 
-    def condition(self, lits):
+    def condition(self, lits, factory):
         if self._replacement is None:
             if self.lit in lits:
                 self._replacement = True
             elif self.lit.negate() in lits:
                 self._replacement = False
             else:
-                self._replacement = Lit(self.lit)
+                self._replacement = factory.make_lit(self.lit)
         return self._replacement
     
-    def forget(self, vars):
+    def forget(self, vars, factory):
         if self._replacement is None:
             if self.lit.var in vars:
                 self._replacement = True
             else:
-                self._replacement = Lit(self.lit)
+                self._replacement = factory.make_lit(self.lit)
         return self._replacement
 
-    def simplify(self):
+    def simplify(self, factory):
         if self._replacement is None:
-            self._replacement = Lit(self.lit)
+            self._replacement = factory.make_lit(self.lit)
         return self._replacement
 
-    def smooth(self):
+    def smooth(self, factory):
         if self._replacement is None:
-            self._replacement = Lit(self.lit)
+            self._replacement = factory.make_lit(self.lit)
             self._replacement._vars = set([self.lit.var])
         return self._replacement
 
@@ -312,14 +413,22 @@ class Lit(Node):
 
 class dDNNF:
 
-    def __init__(self, root, allvars):
+    def __init__(self, root, allvars, factory = None):
         self.root = root
         self.allvars = allvars
         self.usedvars = set()
+        if factory is None:
+            factory = NodeFactory()
+            factory.intern(root)
+        self.factory = factory
         if bool != type(self.root):
-            self.root.reset()
             self.usedvars = self.root.usedvars
-            self.root.reset()
+
+    def _reset(self):
+        # Shared nodes may carry memo fields from other circuits of the factory
+        self.factory.reset()
+        if bool != type(self.root):
+            self.factory.refresh(self.root)
 
     def size(self):
         seen = set()
@@ -328,14 +437,19 @@ class dDNNF:
         return len(seen)
 
     def count(self, vars = set()):
+        """
+        Count the models (or, given vars, the models where each variable is
+        true) with exact integers. See Circuit.count, through compile(), for
+        log-space and modular counting.
+        """
         if bool == type(self.root):
             count = int(self.root) * (2**len(self.allvars))
             if vars:
-                return {v: (count/2) for v in vars}
+                return {v: (count // 2) for v in vars}
             else:
                 return count
 
-        self.root.reset()
+        self._reset()
 
         counts = self.root.count(vars)
 
@@ -344,58 +458,73 @@ class dDNNF:
         else:
             return counts[-1]
 
-        toret = {v: 2**len(self.allvars - self.root.usedvars) * counts[v] for v in vars}
+        # Integer arithmetic throughout, so counts above 2^53 stay exact
+        scale = 2**len(self.allvars - self.root.usedvars)
+        toret = {v: scale * counts[v] for v in vars}
 
         for var in (vars - self.usedvars):
-            toret[var] = counts[-1] / 2
+            toret[var] = scale * counts[-1] // 2
 
         return toret
 
     def condition(self, lits):
         if bool == type(self.root):
-            return dDNNF(self.root, self.allvars - set([l.var for l in lits]))
-        self.root.reset()
-        return dDNNF(self.root.condition(lits), self.allvars - set([l.var for l in lits]))
+            return dDNNF(self.root, self.allvars - set([l.var for l in lits]), self.factory)
+        self._reset()
+        return dDNNF(self.root.condition(lits, self.factory),
+                     self.allvars - set([l.var for l in lits]), self.factory)
     
     def forget(self, vars):
         if bool == type(self.root):
-            return dDNNF(self.root, self.allvars - set(vars))
-        self.root.reset()
-        return dDNNF(self.root.forget(vars), self.allvars - set(vars))
+            return dDNNF(self.root, self.allvars - set(vars), self.factory)
+        self._reset()
+        return dDNNF(self.root.forget(vars, self.factory), self.allvars - set(vars), self.factory)
 
     def simplify(self):
         if bool == type(self.root):
-            return dDNNF(self.root, self.allvars)
-        self.root.reset()
-        return dDNNF(self.root.simplify(), self.allvars)
+            return dDNNF(self.root, self.allvars, self.factory)
+        self._reset()
+        return dDNNF(self.root.simplify(self.factory), self.allvars, self.factory)
 
     def smooth(self):
         if bool == type(self.root):
-            return dDNNF(self.root, self.allvars)
+            return dDNNF(self.root, self.allvars, self.factory)
 
         # Simplify before smoothing
-        self.root.reset()
-        simp_root = self.root.simplify()
+        self._reset()
+        simp_root = self.root.simplify(self.factory)
+        if bool == type(simp_root):
+            return dDNNF(simp_root, self.allvars, self.factory)
 
         # Smooth
-        simp_root.reset()
-        smooth_root = simp_root.smooth()
-        smooth_root = smooth_root.ensure_vars(self.allvars - smooth_root._vars)
-        smooth_root.reset()
+        self.factory.reset()
+        self.factory.refresh(simp_root)
+        smooth_root = simp_root.smooth(self.factory)
+        smooth_root = smooth_root.ensure_vars(self.allvars - smooth_root._vars, self.factory)
 
         assert len(self.allvars) == len(smooth_root._vars)
 
-        return dDNNF(smooth_root, self.allvars)
+        smooth = dDNNF(smooth_root, self.allvars, self.factory)
+        smooth._reset()
+        return smooth
 
     def is_smooth(self):
         if bool == type(self.root):
             return True
-        self.root.reset()
+        self._reset()
         return self.root.is_smooth()
     
+    def compile(self):
+        """
+        Return the flat-array Circuit for this d-DNNF (see krrt.sat.Circuit),
+        which evaluates without recursion or reset() between queries.
+        """
+        from krrt.sat.Circuit import Circuit
+        return Circuit.from_ddnnf(self)
+
     def gen_nnf(self):
         n_list = []
-        self.root.reset()
+        self._reset()
         self.root.assign_nnf_indices(n_list)
         assert self.root == n_list[-1]
         for i in range(len(n_list)):
@@ -419,52 +548,10 @@ class dDNNF:
 
 
 def parseNNF(fname):
-
-    lines = read_file(fname)
-    (nNodes, nEdges, nVars) = map(int, lines.pop(0).split()[1:])
-    assert nNodes == len(lines)
-
-    # TODO: Double check that this badlist isn't included in the final d-DNNF
-    badlist = set()
-    allvars = set()
-    nodes = []
-
-    for line in lines:
-
-        parts = line.split()
-
-        if 'A 0' == line:
-            nodes.append(True)
-
-        elif 'O 0 0' == line:
-            nodes.append(False)
-
-        elif 'L' == parts[0]:
-            num = int(parts[1])
-            lit = CNF.Variable(abs(num))
-            allvars.add(lit)
-            if num < 0:
-                lit = CNF.Not(lit)
-            nodes.append(Lit(lit))
-
-        elif 'A' == parts[0]:
-            nCh = int(parts[1])
-            children = list(map(int, parts[2:]))
-            assert nCh == len(children), "Bad line? %s" % line
-            assert max(children) < len(nodes)
-            nodes.append(And([nodes[i] for i in children]))
-
-        elif 'O' == parts[0]:
-            switch = int(parts[1])
-            nCh = int(parts[2])
-            children = list(map(int, parts[3:]))
-            assert nCh == len(children), "Bad line? %s" % line
-            assert max(children) < len(nodes)
-            nodes.append(Or([nodes[i] for i in children], switch))
-            if 0 == switch:
-                badlist.add(len(nodes) - 1)
-
-        else:
-            assert False, "Unrecognized line: %s" % line
-
-    return dDNNF(nodes[-1], allvars)
+    """
+    Read a c2d / d4 .nnf file into a dDNNF. The file is streamed into a
+    flat Circuit first (see krrt.sat.Circuit.parseNNF, which can be used
+    directly to skip building the object graph).
+    """
+    from krrt.sat.Circuit import parseNNF as parseCircuit
+    return parseCircuit(fname).to_ddnnf()
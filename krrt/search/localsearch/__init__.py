@@ -1 +1,2 @@
 from . import viz
+from .engine import LocalSearch, walksat, probsat
@@ -0,0 +1,404 @@
+import random
+import time
+
+from krrt.sat.CNF import WeightedFormula, LevelWeightedFormula
+from krrt.sat.Dimacs import parseFile
+
+
+USAGE_STRING = "\n\
+Usage: python engine.py -<option> <argument> -<option> <argument> ... <FLAG> <FLAG> ...\n\n\
+        Where options are:\n\
+          -i <input-file>\n\
+          -method <walksat|probsat|gsat>\n\
+          -flips <max flips per try>\n\
+          -tries <max tries>\n\
+          -noise <walk probability>\n\
+          -seed <random seed>\n\
+          -timeout <timeout>\n\n\
+        And the flags include:\n\
+          DISABLE_STATS\n\
+        "
+
+METHODS = ['walksat', 'probsat', 'gsat']
+
+
+def walksat(theory, **options):
+    """Run WalkSAT on a formula, returning the LocalSearch object (see LocalSearch)."""
+    search = LocalSearch(theory, method = 'walksat', **options)
+    search.solve()
+    return search
+
+
+def probsat(theory, **options):
+    """Run probSAT on a formula, returning the LocalSearch object (see LocalSearch)."""
+    search = LocalSearch(theory, method = 'probsat', **options)
+    search.solve()
+    return search
+
+
+class LocalSearch:
+    """
+    Stochastic local search over a Formula, or over the WeightedFormula
+    family as (weighted) MaxSAT.
+
+    The state keeps, for every clause, the number of true literals and the
+    xor of their variables (the critical variable once a single literal is
+    true), and for every variable its break count (the weight of the
+    clauses it alone satisfies) and make count (the weight of the false
+    clauses it occurs in), along with the list of false clauses. Flipping a
+    variable only visits the clauses it occurs in.
+
+    The methods pick a false clause at random and then flip one of its
+    variables:
+        - walksat: a variable with no break if there is one, otherwise a
+          random one with probability noise, or else one of least break,
+        - probsat: a variable drawn with probability (eps + break)^-cb,
+        - gsat: with probability noise a random one, otherwise the one with
+          the best make - break over the clause.
+
+    Hard clauses (weight -1) weigh top_weight, and the soft clauses of
+    level formulas weigh their weight plus the offset of their level,
+    exactly as written by writeCNF. The best model that satisfies the hard
+    clauses is kept, so the search also works as anytime MaxSAT.
+
+    With trace = True, every try records its initial assignment, the
+    variables flipped and the cost after every flip (see getStates).
+    """
+
+    def __init__(self, theory, method = 'walksat', noise = 0.5, cb = 2.06, eps = 1.0,
+                 max_flips = 100000, max_tries = 10, target = 0, seed = None,
+                 timeout = None, trace = False, verbose = False):
+
+        assert method in METHODS, "Unknown local search method: %s" % str(method)
+
+        self.theory = theory
+        self.method = method
+        self.noise = noise
+        self.cb = cb
+        self.eps = eps
+        self.max_flips = max_flips
+        self.max_tries = max_tries
+        self.target = target
+        self.rng = random.Random(seed)
+        self.TIMEOUT = timeout
+        self.tracing = trace
+        self.verbose = verbose
+        self.timedout = False
+
+        self.num_vars = theory.num_vars
+        self._loadTheory()
+
+        n = self.num_vars
+        self.value = [False] * (n + 1)
+        self.breaks = [0] * (n + 1)
+        self.makes = [0] * (n + 1)
+        self.true_count = [0] * len(self.clauses)
+        self.critical = [0] * len(self.clauses)
+        self.unsat = []
+        self.unsat_pos = [-1] * len(self.clauses)
+        self.current = 0
+
+        self.model = None
+        self.cost = None
+        self.trace = []
+
+        self.FLIPS = 0
+        self.TRIES = 0
+
+    #--- Loading
+
+    def _loadTheory(self):
+        theory = self.theory
+        if isinstance(theory, LevelWeightedFormula):
+            offsets = {}
+            total = 0
+            for level in sorted(theory.getLevels()):
+                offsets[level] = total
+                total += theory.level_weight(level, total)
+            weighted = [(lits, weight if -1 == weight else weight + offsets[level])
+                        for (lits, weight, level) in theory.iterIntLevelClauses()]
+        elif isinstance(theory, WeightedFormula):
+            weighted = list(theory.iterIntWeightedClauses())
+        else:
+            weighted = [(lits, 1) for lits in theory.iterIntClauses()]
+
+        self.top = 1 + sum([w for (lits, w) in weighted if -1 != w])
+        self.clauses = []
+        self.weight = []
+        self.base_cost = 0
+        self.hard_ok = True
+
+        # Literal indexed occurrence lists (negative literals wrap around)
+        self.occ = [[] for i in range(2 * self.num_vars + 1)]
+
+        for (lits, weight) in weighted:
+            lits = list(dict.fromkeys(lits))
+            if any(-l in lits for l in lits):
+                continue
+            hard = (-1 == weight)
+            if not lits:
+                if hard:
+                    self.hard_ok = False
+                else:
+                    self.base_cost += weight
+                continue
+            if not hard and 0 == weight:
+                continue
+            ci = len(self.clauses)
+            self.clauses.append(lits)
+            self.weight.append(self.top if hard else weight)
+            for l in lits:
+                self.occ[l].append(ci)
+
+    #--- State
+
+    def _initialize(self, values):
+        self.value = [False] + list(values)
+        value = self.value
+        self.breaks = [0] * (self.num_vars + 1)
+        self.makes = [0] * (self.num_vars + 1)
+        self.unsat = []
+        self.unsat_pos = [-1] * len(self.clauses)
+        self.current = 0
+
+        for (ci, lits) in enumerate(self.clauses):
+            count = 0
+            crit = 0
+            for l in lits:
+                if value[abs(l)] == (l > 0):
+                    count += 1
+                    crit ^= abs(l)
+            self.true_count[ci] = count
+            self.critical[ci] = crit
+            w = self.weight[ci]
+            if 0 == count:
+                self._addUnsat(ci)
+                self.current += w
+                for l in lits:
+                    self.makes[abs(l)] += w
+            elif 1 == count:
+                self.breaks[crit] += w
+
+    def _addUnsat(self, ci):
+        self.unsat_pos[ci] = len(self.unsat)
+        self.unsat.append(ci)
+
+    def _removeUnsat(self, ci):
+        pos = self.unsat_pos[ci]
+        last = self.unsat.pop()
+        if last != ci:
+            self.unsat[pos] = last
+            self.unsat_pos[last] = pos
+        self.unsat_pos[ci] = -1
+
+    def flip(self, v):
+        """Flip variable v, updating the counts of the clauses it occurs in."""
+        value = self.value
+        true_count = self.true_count
+        critical = self.critical
+        breaks = self.breaks
+        makes = self.makes
+        weight = self.weight
+        clauses = self.clauses
+
+        made = v if not value[v] else -v
+        value[v] = not value[v]
+
+        for ci in self.occ[made]:
+            w = weight[ci]
+            count = true_count[ci]
+            true_count[ci] = count + 1
+            if 0 == count:
+                self._removeUnsat(ci)
+                self.current -= w
+                for l in clauses[ci]:
+                    makes[abs(l)] -= w
+                breaks[v] += w
+            elif 1 == count:
+                breaks[critical[ci]] -= w
+            critical[ci] ^= v
+
+        for ci in self.occ[-made]:
+            w = weight[ci]
+            count = true_count[ci]
+            true_count[ci] = count - 1
+            critical[ci] ^= v
+            if 1 == count:
+                self._addUnsat(ci)
+                self.current += w
+                for l in clauses[ci]:
+                    makes[abs(l)] += w
+                breaks[v] -= w
+            elif 2 == count:
+                breaks[critical[ci]] += w
+
+        self.FLIPS += 1
+
+    #--- Variable selection
+
+    def _pickVar(self):
+        rng = self.rng
+        lits = self.clauses[self.unsat[rng.randrange(len(self.unsat))]]
+        breaks = self.breaks
+
+        if 'walksat' == self.method:
+            scores = [breaks[abs(l)] for l in lits]
+            best = min(scores)
+            if best > 0 and rng.random() < self.noise:
+                return abs(rng.choice(lits))
+            return abs(rng.choice([l for (l, s) in zip(lits, scores) if s == best]))
+
+        elif 'probsat' == self.method:
+            probs = [(self.eps + breaks[abs(l)]) ** -self.cb for l in lits]
+            r = rng.random() * sum(probs)
+            for (l, p) in zip(lits, probs):
+                r -= p
+                if r <= 0:
+                    return abs(l)
+            return abs(lits[-1])
+
+        else:
+            if rng.random() < self.noise:
+                return abs(rng.choice(lits))
+            makes = self.makes
+            scores = [makes[abs(l)] - breaks[abs(l)] for l in lits]
+            best = max(scores)
+            return abs(rng.choice([l for (l, s) in zip(lits, scores) if s == best]))
+
+    #--- Search
+
+    def solve(self, initial = None):
+        """
+        Run up to max_tries tries of max_flips flips each, starting from
+        random assignments (or from initial, a list of DIMACS literals, on
+        the first try). Returns True once a model of cost at most target is
+        found, and None otherwise; model and cost then hold the best model
+        that satisfies the hard clauses, if one was found.
+        """
+        self.start_time = time.time()
+        if not self.hard_ok:
+            return None
+
+        for t in range(self.max_tries):
+            self.TRIES += 1
+            if 0 == t and initial is not None:
+                values = [False] * self.num_vars
+                for l in initial:
+                    values[abs(l) - 1] = l > 0
+            else:
+                values = [self.rng.random() < 0.5 for i in range(self.num_vars)]
+
+            self._initialize(values)
+            if self.tracing:
+                self.trace.append((list(values), [], []))
+
+            result = self._try()
+            if result is not False:
+                return result
+
+        return None
+
+    def _try(self):
+        self._record()
+        if self._done():
+            return True
+
+        for i in range(self.max_flips):
+            if self.TIMEOUT and 0 == (i & 1023) and (time.time() - self.start_time) > self.TIMEOUT:
+                self.timedout = True
+                return None
+
+            # Every clause holds, so base_cost (above target) is the optimum
+            if not self.unsat:
+                return None
+
+            v = self._pickVar()
+            self.flip(v)
+            if self.tracing:
+                self.trace[-1][1].append(v)
+                self.trace[-1][2].append(self.base_cost + self.current)
+
+            self._record()
+            if self._done():
+                return True
+
+        return False
+
+    def _done(self):
+        return self.cost is not None and self.cost <= self.target
+
+    def _record(self):
+        if self.current >= self.top:
+            return
+        cost = self.base_cost + self.current
+        if self.cost is None or cost < self.cost:
+            self.cost = cost
+            self.model = [v if self.value[v] else -v for v in range(1, self.num_vars + 1)]
+            if self.verbose:
+                print ("Cost: %d (%d flips, %.2fs)" % (cost, self.FLIPS, time.time() - self.start_time))
+
+    #--- Results
+
+    def getModel(self):
+        """Return the best model as a dict from Variable to bool (None for Optimized formulas)."""
+        if self.model is None or not self.theory.mapping:
+            return None
+        unmapping = self.theory.unmapping
+        return {unmapping[abs(l)]: l > 0 for l in self.model if abs(l) < len(unmapping)}
+
+    def getStates(self, index = -1):
+        """
+        Replay the trace of a try as a list of states in the format of the
+        krrt.viz tools: lists of 1 / -1 values with a leading garbage bit
+        (use first_bit_garbage = True).
+        """
+        (values, flips, costs) = self.trace[index]
+        state = [1] + [1 if val else -1 for val in values]
+        states = [list(state)]
+        for v in flips:
+            state[v] *= -1
+            states.append(list(state))
+        return states
+
+    def print_stats(self):
+        print ("Method: " + self.method)
+        print ("Tries: " + str(self.TRIES))
+        print ("Flips: " + str(self.FLIPS))
+        print ("Best Cost: " + str(self.cost))
+        print ("Time: %.2f" % (time.time() - self.start_time))
+
+
+if __name__ == '__main__':
+    from krrt.utils import get_opts
+    import os
+    myargs, flags = get_opts()
+
+    if '-i' not in myargs:
+        print ("Must specify input:")
+        print (USAGE_STRING)
+        os._exit(1)
+
+    options = {}
+    if '-method' in myargs:
+        options['method'] = myargs['-method']
+    if '-flips' in myargs:
+        options['max_flips'] = int(myargs['-flips'])
+    if '-tries' in myargs:
+        options['max_tries'] = int(myargs['-tries'])
+    if '-noise' in myargs:
+        options['noise'] = float(myargs['-noise'])
+    if '-seed' in myargs:
+        options['seed'] = int(myargs['-seed'])
+    if '-timeout' in myargs:
+        options['timeout'] = int(myargs['-timeout'])
+
+    search = LocalSearch(parseFile(myargs['-i']), **options)
+    result = search.solve()
+
+    if 'DISABLE_STATS' not in flags:
+        search.print_stats()
+
+    if result:
+        print ("Satisfiable")
+    else:
+        print ("Unknown")
@@ -21,6 +21,51 @@ def save_CSV(data, filename, delimiter = ','):
     
     write_file(filename, output)
 
+COMPRESSED_MAGIC = [(b'\x1f\x8b', 'gzip'),
+                    (b'BZh', 'bz2'),
+                    (b'\xfd7zXZ\x00', 'lzma')]
+
+COMPRESSED_EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'lzma'}
+
+def open_file(file_name, mode = 'r', compress = None):
+    """
+    Open a file that may be compressed with gzip, bzip2 or xz.
+
+    When reading, the compression is detected from the leading magic
+    bytes of the file. When writing, it is taken from the compress
+    parameter ('gzip', 'bz2', 'lzma', or True for gzip) or, failing
+    that, from the file extension.
+    """
+    import os
+
+    codec = compress
+    if codec is True:
+        codec = 'gzip'
+    if 'r' in mode:
+        f = open(file_name, 'rb')
+        head = f.read(6)
+        f.close()
+        for (magic, name) in COMPRESSED_MAGIC:
+            if head.startswith(magic):
+                codec = name
+    elif codec is None:
+        codec = COMPRESSED_EXTENSIONS.get(os.path.splitext(file_name)[1])
+
+    if codec is None:
+        return open(file_name, mode)
+
+    import sys
+    import importlib
+    module = importlib.import_module(codec)
+    if sys.version_info[0] < 3:
+        # Python 2 has neither text modes nor bz2.open
+        mode = mode.replace('t', '')
+        if 'bz2' == codec:
+            return module.BZ2File(file_name, mode)
+    elif 'b' not in mode and 't' not in mode:
+        mode += 't'
+    return module.open(file_name, mode)
+
 def read_file(file_name):
     """Return a list of the lines of a file."""
     f = open(file_name, 'r')
@@ -0,0 +1,30 @@
+"""Brute-force references shared by the tests."""
+
+import itertools
+
+from krrt.sat.CNF import Formula
+
+
+def satisfies(bits, clauses):
+    """Whether the assignment bits (bits[v - 1] for variable v) satisfies every clause."""
+    return all(any((l > 0) == bits[abs(l) - 1] for l in cls) for cls in clauses)
+
+def models_of(n, clauses):
+    """Every model of the clauses over the variables 1..n, as tuples of booleans."""
+    return [bits for bits in itertools.product([False, True], repeat = n) if satisfies(bits, clauses)]
+
+def is_satisfiable(n, clauses):
+    return any(satisfies(bits, clauses) for bits in itertools.product([False, True], repeat = n))
+
+def random_clauses(rng, n, m, width = 4):
+    """m random clauses over the variables 1..n, each with 1 to width literals."""
+    return [[rng.choice([-1, 1]) * rng.randint(1, n) for i in range(rng.randint(1, width))] \
+            for j in range(m)]
+
+def int_formula(clauses, n = 0, cls = Formula):
+    """A formula of class cls over (at least) the variables 1..n, with the given clauses."""
+    f = cls()
+    f.reserveVariables(n)
+    for c in clauses:
+        f.addIntClause(c)
+    return f
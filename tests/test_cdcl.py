@@ -0,0 +1,81 @@
+import random
+import unittest
+
+from krrt.sat.CNF import Formula, CompactFormula
+from krrt.sat.CDCL import CDCL, IncrementalSolver
+
+from tests.helpers import is_satisfiable, random_clauses, int_formula
+
+
+class CDCLTest(unittest.TestCase):
+
+    def _check(self, solver, n, clauses):
+        result = solver.solve()
+        self.assertEqual(result, is_satisfiable(n, clauses))
+        if result:
+            model = set(solver.model)
+            self.assertTrue(all(any(l in model for l in cls) for cls in clauses))
+
+    def test_matches_brute_force(self):
+        rng = random.Random(4)
+        for t in range(150):
+            n = rng.randint(1, 10)
+            clauses = random_clauses(rng, n, rng.randint(1, 50))
+            for cls in [Formula, CompactFormula]:
+                f = int_formula(clauses, cls = cls)
+                for voh in ['vsids', 'static', 'random']:
+                    for restarts in ['luby', 'geometric', 'none']:
+                        self._check(CDCL(f, voh = voh, restarts = restarts, seed = t),
+                                    f.num_vars, clauses)
+
+    def test_empty_clause(self):
+        f = Formula()
+        f.addIntClause([1, 2])
+        f.addIntClause([])
+        self.assertEqual(CDCL(f).solve(), False)
+
+
+class AssumptionTest(unittest.TestCase):
+
+    def test_assumptions_and_cores(self):
+        rng = random.Random(5)
+        for t in range(200):
+            n = rng.randint(1, 8)
+            clauses = random_clauses(rng, n, rng.randint(1, 20))
+            solver = IncrementalSolver(seed = t)
+            for c in clauses:
+                solver.addIntClause(c)
+
+            # Several calls on the one solver, each under other assumptions
+            for k in range(4):
+                assumptions = [rng.choice([-1, 1]) * v for v in rng.sample(range(1, n + 1), rng.randint(0, n))]
+                result = solver.solve(assumptions)
+                self.assertEqual(result, is_satisfiable(n, clauses + [[a] for a in assumptions]))
+                if result:
+                    model = set(solver.model)
+                    self.assertTrue(set(assumptions) <= model)
+                    self.assertTrue(all(any(l in model for l in cls) for cls in clauses))
+                else:
+                    self.assertTrue(set(solver.core) <= set(assumptions))
+                    self.assertFalse(is_satisfiable(n, clauses + [[a] for a in solver.core]))
+
+    def test_clauses_added_between_calls(self):
+        f = Formula()
+        f.addIntClause([1, 2])
+        solver = IncrementalSolver(f)
+        self.assertEqual(solver.solve([-1]), True)
+
+        f.addIntClause([-2, 3])
+        solver.addIntClause([-3])
+        self.assertEqual(solver.solve([-1]), False)
+        self.assertEqual(solver.core, [-1])
+        self.assertEqual(solver.solve(), True)
+        self.assertEqual(solver.getModel()[f.unmapping[1]], True)
+
+        variable = f.unmapping[1]
+        self.assertEqual(solver.solve([variable.negate()]), False)
+        self.assertEqual(solver.core, [variable.negate()])
+
+
+if __name__ == '__main__':
+    unittest.main()
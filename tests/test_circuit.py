@@ -0,0 +1,247 @@
+import os
+import math
+import sys
+import random
+from fractions import Fraction
+import shutil
+import tempfile
+import unittest
+
+from krrt.sat.CNF import Not
+
+from tests.helpers import models_of, random_clauses, int_formula
+
+
+def _circuit(f, models):
+    """
+    The decision tree of models as a smooth, deterministic Circuit over the
+    variables of f, with equal subtrees shared. The models set the first
+    variables of f, and any variables past those are left free.
+    """
+    from krrt.sat.Circuit import Circuit, LIT, AND, OR
+
+    n = len(models[0]) if models else 0
+    circuit = Circuit(list(f.unmapping), f.unmapping[1:])
+    lits = {}
+    nodes = {}
+
+    def lit(l):
+        if l not in lits:
+            lits[l] = circuit.addNode(LIT, l)
+        return lits[l]
+
+    # tails holds what is left of each model once variables 1..i are set
+    def build(i, tails):
+        if (i, tails) not in nodes:
+            if i == n:
+                nodes[(i, tails)] = circuit.addNode(AND)
+            else:
+                branches = []
+                for (val, l) in [(True, i + 1), (False, -(i + 1))]:
+                    rest = frozenset([t[1:] for t in tails if t[0] == val])
+                    if not rest:
+                        continue
+                    # dDNNF nodes take no constant children, so leaves are literals
+                    if i + 1 == n:
+                        branches.append(lit(l))
+                    else:
+                        branches.append(circuit.addNode(AND, 0, [lit(l), build(i + 1, rest)]))
+                nodes[(i, tails)] = circuit.addNode(OR, 0, branches, i + 1)
+        return nodes[(i, tails)]
+
+    if models:
+        build(0, frozenset(models))
+    else:
+        circuit.addNode(OR)
+    return circuit
+
+def _instances(seed, num):
+    """Random small formulas with their models and circuits."""
+    rng = random.Random(seed)
+    for t in range(num):
+        n = rng.randint(1, 7)
+        clauses = random_clauses(rng, n, rng.randint(0, 14), 3)
+        f = int_formula(clauses, n)
+        models = models_of(n, clauses)
+        yield (rng, f, models, _circuit(f, models))
+
+def _query(rng, f):
+    """A random partial assignment, as literals and as (index, value) pairs."""
+    n = f.num_vars
+    fixed = [(i, rng.random() < 0.5) for i in rng.sample(range(n), rng.randint(0, n))]
+    lits = [f.unmapping[i + 1] if val else Not(f.unmapping[i + 1].obj) for (i, val) in fixed]
+    return (lits, fixed)
+
+
+@unittest.skipIf(sys.version_info[0] < 3, "Circuit needs python 3")
+class CircuitTest(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        for (rng, f, models, circuit) in _instances(10, 80):
+            self.assertEqual(circuit.count(), len(models))
+            self.assertEqual(circuit.is_sat(), bool(models))
+            self.assertEqual(circuit.to_ddnnf().count(), len(models))
+            self.assertTrue(circuit.is_smooth())
+
+            for k in range(3):
+                (lits, fixed) = _query(rng, f)
+                conditioned = circuit.condition(lits).smooth()
+                self.assertTrue(conditioned.is_smooth())
+                self.assertEqual(conditioned.count(),
+                                 len([bits for bits in models if all(bits[i] == val for (i, val) in fixed)]))
+
+            # Forgetting all but one variable keeps whether it can be true or false
+            keep = rng.randrange(f.num_vars)
+            var = f.unmapping[keep + 1]
+            forgot = circuit.forget([f.unmapping[i + 1] for i in range(f.num_vars) if i != keep])
+            for (lit, val) in [(var, True), (Not(var.obj), False)]:
+                self.assertEqual(forgot.condition([lit]).is_sat(),
+                                 any(bits[keep] == val for bits in models))
+
+
+@unittest.skipIf(sys.version_info[0] < 3, "Circuit needs python 3")
+class WeightedCountTest(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        for (rng, f, models, circuit) in _instances(11, 80):
+            n = f.num_vars
+            variables = [f.unmapping[i + 1] for i in range(n)]
+            weights = {}
+            for v in variables:
+                if rng.random() < 0.8:
+                    weights[v] = Fraction(rng.randint(0, 5), rng.randint(1, 4))
+                if rng.random() < 0.8:
+                    weights[v.negate()] = Fraction(rng.randint(0, 5), rng.randint(1, 4))
+
+            def weight(bits):
+                w = 1
+                for (v, val) in zip(variables, bits):
+                    w *= weights.get(v if val else v.negate(), 1)
+                return w
+
+            self.assertEqual(circuit.wmc(weights), sum([weight(bits) for bits in models]))
+
+            marginals = circuit.marginals(weights)
+            self.assertEqual(len(marginals), 2 * n)
+            for (i, v) in enumerate(variables):
+                self.assertEqual(marginals[v], sum([weight(bits) for bits in models if bits[i]]))
+                self.assertEqual(marginals[v.negate()], sum([weight(bits) for bits in models if not bits[i]]))
+
+            counts = circuit.count(set(variables))
+            for (i, v) in enumerate(variables):
+                self.assertEqual(counts[v], len([bits for bits in models if bits[i]]))
+
+
+@unittest.skipIf(sys.version_info[0] < 3, "Circuit needs python 3")
+class NNFTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, text):
+        path = os.path.join(self.directory, name)
+        f = open(path, 'w')
+        f.write(text)
+        f.close()
+        return path
+
+    def test_header_variables_without_literals(self):
+        from krrt.sat.Circuit import parseNNF
+
+        circuit = parseNNF(self._write('true.nnf', "nnf 1 0 4\nA 0\n"))
+        self.assertEqual(len(circuit.allvars), 4)
+        self.assertEqual(circuit.count(), 16)
+
+        circuit = parseNNF(self._write('lit.nnf', "nnf 1 0 3\nL -2\n"))
+        self.assertEqual(len(circuit.allvars), 3)
+        self.assertEqual(circuit.smooth().count(), 4)
+
+    def test_tautology_round_trip(self):
+        from krrt.sat.Circuit import Circuit, AND, parseNNF
+
+        f = int_formula([], 4)
+        circuit = Circuit(list(f.unmapping), f.unmapping[1:])
+        circuit.addNode(AND)
+        self.assertEqual(circuit.count(), 16)
+
+        path = os.path.join(self.directory, 'true.nnf')
+        circuit.writeNNF(path)
+        self.assertEqual(parseNNF(path).count(), 16)
+
+    def test_round_trips_keep_the_count(self):
+        from krrt.sat.Circuit import parseNNF, loadCircuit
+
+        for (t, (rng, f, models, circuit)) in enumerate(_instances(13, 60)):
+            expected = len(models)
+            self.assertEqual(circuit.count(), expected)
+
+            path = os.path.join(self.directory, 'c%d.nnf' % t)
+            circuit.writeNNF(path)
+            self.assertEqual(parseNNF(path).count(), expected)
+
+            path = os.path.join(self.directory, 'c%d.bin' % t)
+            circuit.writeBinary(path)
+            loaded = loadCircuit(path)
+            self.assertEqual(loaded.count(), expected)
+            del loaded
+
+
+@unittest.skipIf(sys.version_info[0] < 3, "Circuit needs python 3")
+class BatchTest(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        for (rng, f, models, circuit) in _instances(14, 60):
+            queries = [_query(rng, f) for k in range(12)]
+            expected = [len([bits for bits in models if all(bits[i] == val for (i, val) in fixed)]) \
+                        for (lits, fixed) in queries]
+            lits = [q[0] for q in queries]
+
+            self.assertEqual(circuit._batchPython(lits, 'count'), expected)
+            self.assertEqual(circuit.batch(lits, exact = True), expected)
+            self.assertEqual([int(round(c)) for c in circuit.batch(lits, batch_size = 5)], expected)
+            self.assertEqual(circuit.batch(lits, mode = 'sat'), [c > 0 for c in expected])
+
+    def test_variables_outside_the_circuit(self):
+        f = int_formula([[1, -2]], 3)
+        circuit = _circuit(f, models_of(2, [[1, -2]]))
+        outside = int_formula([], 5).unmapping[5]
+        for query in [[outside], [Not(outside.obj), f.unmapping[1]], [f.unmapping[3], outside]]:
+            expected = circuit.condition(query).smooth().count()
+            self.assertEqual(circuit._batchPython([query], 'count'), [expected])
+            self.assertEqual(circuit.batch([query], exact = True), [expected])
+
+
+@unittest.skipIf(sys.version_info[0] < 3, "Circuit needs python 3")
+class ArithmeticTest(unittest.TestCase):
+
+    def test_arithmetics_agree(self):
+        from krrt.sat.Circuit import ModularArithmetic
+
+        for (rng, f, models, circuit) in _instances(15, 60):
+            exact = circuit.count()
+            self.assertEqual(circuit.count(arithmetic = 'mod'), exact % ((1 << 61) - 1))
+            self.assertEqual(circuit.count(arithmetic = ModularArithmetic(7)), exact % 7)
+            if exact:
+                self.assertAlmostEqual(circuit.count(arithmetic = 'log'), math.log(exact))
+            else:
+                self.assertEqual(circuit.count(arithmetic = 'log'), float('-inf'))
+
+            variables = set([f.unmapping[i + 1] for i in range(f.num_vars)])
+            counts = circuit.count(variables)
+            for (v, c) in circuit.count(variables, arithmetic = ModularArithmetic(5)).items():
+                self.assertEqual(c, counts[v] % 5)
+
+    def test_large_counts(self):
+        # Far more models than a float holds exactly
+        circuit = _circuit(int_formula([], 201), models_of(2, [[1, 2]]))
+        exact = 3 * 2 ** 199
+        self.assertEqual(circuit.count(), exact)
+        self.assertAlmostEqual(circuit.count(arithmetic = 'log'), math.log(3) + 199 * math.log(2))
+        self.assertEqual(circuit.count(arithmetic = 'mod'), exact % ((1 << 61) - 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+
+from krrt.sat.CNF import Formula, WeightedFormula, LevelWeightedFormula, \
+    OptimizedWeightedFormula, OptimizedLevelWeightedFormula, \
+    CompactFormula, CompactWeightedFormula, CompactLevelWeightedFormula
+
+
+class CompactFormulaTest(unittest.TestCase):
+
+    ROWS = [[1, -2, 1], [3], [-3, 2, 2, -3], []]
+
+    def test_matches_object_formula(self):
+        plain = Formula()
+        compact = CompactFormula()
+        for lits in self.ROWS:
+            plain.addIntClause(lits)
+            compact.addIntClause(lits)
+        self.assertEqual(compact.num_vars, plain.num_vars)
+        self.assertEqual(compact.clauses, plain.clauses)
+        self.assertEqual([sorted(c) for c in compact.iterIntClauses()],
+                         [sorted(c) for c in plain.iterIntClauses()])
+
+    def test_duplicate_literals(self):
+        for (cls, extra) in [(CompactFormula, ()), (CompactWeightedFormula, (2,)),
+                             (CompactLevelWeightedFormula, (2, 0))]:
+            f = cls()
+            for lits in self.ROWS:
+                f.addIntClause(lits, *extra)
+            self.assertEqual([sorted(c) for c in f.iterIntClauses()], [[-2, 1], [3], [-3, 2], []])
+
+
+class SetIntClausesTest(unittest.TestCase):
+
+    def test_replaces_clauses(self):
+        for cls in [Formula, CompactFormula]:
+            f = cls()
+            f.addIntClause([1, -2, 3])
+            f.setIntClauses([[2], [-1, 3]])
+            self.assertEqual([sorted(c) for c in f.iterIntClauses()], [[2], [-1, 3]])
+            self.assertEqual(f.num_vars, 3)
+
+    def test_reserves_variables(self):
+        for cls in [Formula, CompactFormula]:
+            f = cls()
+            f.reserveVariables(5)
+            f.setIntClauses([[5, -3]])
+            self.assertEqual(f.num_vars, 5)
+            self.assertEqual([sorted(c) for c in f.iterIntClauses()], [[-3, 5]])
+
+        f = CompactFormula()
+        f.setIntClauses([[5, -3, 5], [2]])
+        self.assertEqual(f.num_vars, 5)
+        self.assertEqual(len(f.clauses), 2)
+        self.assertEqual([sorted(c) for c in f.iterIntClauses()], [[-3, 5], [2]])
+
+    def test_refused_on_weighted_formulas(self):
+        for (cls, row) in [(WeightedFormula, ([1, 2], 3)),
+                           (CompactWeightedFormula, ([1, 2], 3)),
+                           (LevelWeightedFormula, ([1, 2], 3, 0)),
+                           (CompactLevelWeightedFormula, ([1, 2], 3, 0))]:
+            f = cls()
+            f.addIntClause(*row)
+            self.assertRaises(AssertionError, f.setIntClauses, [[1]])
+            self.assertEqual(f.num_clauses, 1)
+
+
+class ReorderTest(unittest.TestCase):
+
+    CLAUSES = [([3, -4], 2), ([1, 2], -1), ([-2, 4], 5), ([1], 7), ([-3, 2], 1)]
+
+    def check(self, f, rows):
+        before = sorted(rows(f))
+        for method in ['litsort', 'random', 'bfs', 'annealing', 'all']:
+            f.minimizeClauseWidth(method, seed = 0)
+            self.assertEqual(f.num_clauses, len(self.CLAUSES))
+            self.assertEqual(sorted(rows(f)), before)
+
+    def test_weighted(self):
+        for cls in [WeightedFormula, CompactWeightedFormula]:
+            f = cls()
+            for (lits, weight) in self.CLAUSES:
+                f.addIntClause(lits, weight)
+            self.check(f, lambda f: [(sorted(lits), w) for (lits, w) in f.iterIntWeightedClauses()])
+
+    def test_compact_level_weighted(self):
+        f = CompactLevelWeightedFormula()
+        for (i, (lits, weight)) in enumerate(self.CLAUSES):
+            f.addIntClause(lits, weight, i % 2)
+        top = f.top_weight
+        self.check(f, lambda f: [(sorted(lits), w, l) for (lits, w, l) in f.iterIntLevelClauses()])
+        self.assertEqual(f.top_weight, top)
+
+    def test_level_weighted(self):
+        f = LevelWeightedFormula()
+        for (i, (lits, weight)) in enumerate(self.CLAUSES):
+            f.addIntClause(lits, weight, i % 2)
+        self.check(f, lambda f: [(sorted(lits), w, l) for (lits, w, l) in f.iterIntLevelClauses()])
+
+    def test_hard_clauses_kept_apart(self):
+        f = OptimizedWeightedFormula()
+        for (i, (lits, weight)) in enumerate(self.CLAUSES):
+            f.addIntClause(lits, None if i % 2 else weight)
+        self.check(f, lambda f: [(sorted(lits), w) for (lits, w) in f.iterIntWeightedClauses()])
+        self.assertEqual(len(f.hard_clauses), 2)
+
+        f = OptimizedLevelWeightedFormula()
+        for (i, (lits, weight)) in enumerate(self.CLAUSES):
+            f.addIntClause(lits, weight, i % 3 - 1)
+        self.check(f, lambda f: [(sorted(lits), w, l) for (lits, w, l) in f.iterIntLevelClauses()])
+        self.assertEqual(len(f.hard_clauses), 2)
+
+    def test_order_matches_object_formula(self):
+        compact = CompactWeightedFormula()
+        plain = WeightedFormula()
+        for (lits, weight) in self.CLAUSES:
+            compact.addIntClause(lits, weight)
+            plain.addIntClause(lits, weight)
+        compact.minimizeClauseWidth('litsort')
+        plain.minimizeClauseWidth('litsort')
+        self.assertEqual([(sorted(lits), w) for (lits, w) in compact.iterIntWeightedClauses()],
+                         [(sorted(lits), w) for (lits, w) in plain.iterIntWeightedClauses()])
+
+
+if __name__ == '__main__':
+    unittest.main()
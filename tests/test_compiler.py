@@ -0,0 +1,47 @@
+import sys
+import random
+import unittest
+
+from krrt.sat.CNF import Formula, CompactFormula
+
+from tests.helpers import models_of, random_clauses, int_formula
+
+
+@unittest.skipIf(sys.version_info[0] < 3, "dDNNF needs python 3")
+class CompilerTest(unittest.TestCase):
+
+    def test_counts_match_brute_force(self):
+        from krrt.sat.Compiler import compile
+
+        rng = random.Random(16)
+        for t in range(150):
+            n = rng.randint(1, 9)
+            clauses = random_clauses(rng, n, rng.randint(0, 24), 3)
+            models = models_of(n, clauses)
+            for (cls, cache_size) in [(Formula, 1000000), (CompactFormula, 4)]:
+                f = int_formula(clauses, n, cls)
+                ddnnf = compile(f, cache_size = cache_size)
+                self.assertTrue(ddnnf.is_smooth())
+                self.assertEqual(ddnnf.count(), len(models))
+
+                variables = [f.unmapping[i] for i in range(1, n + 1)]
+                marginals = ddnnf.count(set(variables))
+                for (i, v) in enumerate(variables):
+                    self.assertEqual(marginals[v], len([bits for bits in models if bits[i]]))
+
+    def test_unsmoothed(self):
+        from krrt.sat.Compiler import compile
+
+        f = Formula()
+        f.reserveVariables(3)
+        f.addIntClause([1, 2])
+        ddnnf = compile(f, smooth = False)
+        self.assertEqual(ddnnf.smooth().count(), 6)
+
+        f.addIntClause([-1])
+        f.addIntClause([-2])
+        self.assertEqual(compile(f).count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
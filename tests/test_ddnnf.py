@@ -0,0 +1,86 @@
+import gc
+import sys
+import random
+import unittest
+
+from krrt.sat.CNF import Not
+
+from tests.helpers import models_of, random_clauses, int_formula
+
+
+def _decision_ddnnf(f, models):
+    """
+    The decision tree of models (over every variable of f) as a smooth
+    dDNNF, built through one NodeFactory so that equal subtrees are shared.
+    """
+    from krrt.sat.dDNNF import dDNNF, NodeFactory
+
+    factory = NodeFactory()
+    variables = f.unmapping[1:]
+
+    def build(i, tails):
+        branches = []
+        for (val, lit) in [(True, variables[i]), (False, Not(variables[i].obj))]:
+            rest = [t[1:] for t in tails if t[0] == val]
+            if rest and i + 1 == len(variables):
+                branches.append(factory.make_lit(lit))
+            elif rest:
+                branches.append(factory.make_and([factory.make_lit(lit), build(i + 1, rest)]))
+        return factory.make_or(branches, variables[i])
+
+    return dDNNF(build(0, models) if models else False, set(variables), factory)
+
+
+@unittest.skipIf(sys.version_info[0] < 3, "dDNNF needs python 3")
+class NodeFactoryTest(unittest.TestCase):
+
+    def test_equal_nodes_are_shared(self):
+        from krrt.sat.dDNNF import NodeFactory
+
+        f = int_formula([], 2)
+        (a, b) = (f.unmapping[1], f.unmapping[2])
+        factory = NodeFactory()
+        x = factory.make_and([factory.make_lit(a), factory.make_lit(b)])
+        y = factory.make_and([factory.make_lit(b), factory.make_lit(a)])
+        self.assertTrue(x is y)
+        self.assertTrue(factory.make_or([x, True], a) is factory.make_or([True, x], a))
+
+    def test_unused_nodes_are_dropped(self):
+        from krrt.sat.dDNNF import NodeFactory
+
+        f = int_formula([], 3)
+        factory = NodeFactory()
+        lits = [factory.make_lit(v) for v in f.unmapping[1:]]
+        node = factory.make_and(lits)
+        self.assertEqual(len(factory), 4)
+
+        del node
+        gc.collect()
+        self.assertEqual(len(factory), 3)
+
+    def test_repeated_queries_on_a_shared_factory(self):
+        rng = random.Random(12)
+        for t in range(150):
+            n = rng.randint(1, 7)
+            clauses = random_clauses(rng, n, rng.randint(0, 16), 3)
+            models = models_of(n, clauses)
+            f = int_formula(clauses, n)
+            ddnnf = _decision_ddnnf(f, models)
+
+            # Every query goes through the one factory of the circuit
+            for k in range(3):
+                i = rng.randrange(n)
+                var = f.unmapping[i + 1]
+                pos = rng.random() < 0.5
+                lit = var if pos else Not(var.obj)
+                self.assertEqual(ddnnf.condition([lit]).smooth().count(),
+                                 len([bits for bits in models if bits[i] == pos]))
+
+                # Forgetting loses determinism, so only its models are checked
+                forgot = ddnnf.forget([var]).smooth()
+                self.assertEqual(forgot.count() > 0, len(models) > 0)
+                self.assertEqual(ddnnf.count(), len(models))
+
+
+if __name__ == '__main__':
+    unittest.main()
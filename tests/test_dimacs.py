@@ -0,0 +1,150 @@
+import io
+import os
+import bz2
+import gzip
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+from krrt.sat import CNF
+from krrt.sat.CNF import Formula, CompactFormula, WeightedFormula, CompactWeightedFormula, \
+    LevelWeightedFormula, CompactLevelWeightedFormula
+from krrt.sat.Dimacs import parseFile
+
+TEXT = b"""c A comment, with numbers 1 2 0 that are not clauses
+p cnf 5 4
+1 -2
+ 3 0 -4 5 0
+c another comment
+2 0
+-1 -3 -5
+0
+"""
+
+CLAUSES = [[-2, 1, 3], [-4, 5], [2], [-5, -3, -1]]
+
+
+class ParseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, opener = open):
+        path = os.path.join(self.directory, name)
+        f = opener(path, 'wb')
+        f.write(TEXT)
+        f.close()
+        return path
+
+    def test_chunks(self):
+        path = self._write('a.cnf')
+        for chunk_size in [1, 2, 3, 7, 64, 1 << 20]:
+            for compact in [False, True]:
+                stats = {}
+                f = parseFile(path, compact = compact, stats = stats, chunk_size = chunk_size)
+                self.assertTrue(isinstance(f, CompactFormula if compact else Formula))
+                self.assertEqual([sorted(c) for c in f.iterIntClauses()], CLAUSES)
+                self.assertEqual(f.num_vars, 5)
+                self.assertEqual(stats['clauses'], 4)
+                self.assertEqual(stats['literals'], 9)
+
+    def test_compressed(self):
+        for (name, opener) in [('a.cnf.gz', gzip.open), ('a.cnf.bz2', bz2.BZ2File)]:
+            f = parseFile(self._write(name, opener), chunk_size = 5)
+            self.assertEqual([sorted(c) for c in f.iterIntClauses()], CLAUSES)
+
+
+def _normalize(wcnf):
+    """
+    Sort the lines of a WCNF text, and the literals of each clause, since
+    the object formulas keep their clauses in sets (and by level).
+    """
+    lines = []
+    for line in wcnf.splitlines():
+        if line and line[0] not in 'cp':
+            parts = line.split()
+            line = ' '.join([parts[0]] + sorted(parts[1:-1], key = lambda l: abs(int(l))) + ['0'])
+        lines.append(line)
+    return sorted(lines)
+
+
+class WriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.batch = CNF.WRITE_BATCH
+        CNF.WRITE_BATCH = 3
+
+    def tearDown(self):
+        CNF.WRITE_BATCH = self.batch
+        shutil.rmtree(self.directory)
+
+    def _read(self, name, opener = open):
+        f = opener(os.path.join(self.directory, name), 'rb')
+        text = f.read()
+        f.close()
+        return text.decode()
+
+    def _outputs(self, f, prefix):
+        """Write f out in every way, checking that all give the same text."""
+        stream = io.BytesIO()
+        f.writeCNF(stream)
+        text = stream.getvalue().decode()
+
+        # Text streams of python 2 only take unicode
+        if sys.version_info[0] >= 3:
+            stream = io.StringIO()
+            f.writeCNF(stream)
+            self.assertEqual(stream.getvalue(), text)
+
+        f.writeCNF(os.path.join(self.directory, prefix + '.cnf'))
+        self.assertEqual(self._read(prefix + '.cnf'), text)
+        f.writeCNF(os.path.join(self.directory, prefix + '.cnf.gz'))
+        self.assertEqual(self._read(prefix + '.cnf.gz', gzip.open), text)
+        f.writeCNF(os.path.join(self.directory, prefix + '.x'), compress = 'bz2')
+        self.assertEqual(self._read(prefix + '.x', bz2.BZ2File), text)
+        return text
+
+    def test_round_trip(self):
+        rng = random.Random(3)
+        clauses = [[rng.choice([-1, 1]) * v for v in rng.sample(range(1, 13), rng.randint(1, 4))] \
+                   for j in range(40)]
+        for cls in [Formula, CompactFormula]:
+            f = cls()
+            for c in clauses:
+                f.addIntClause(c)
+            text = self._outputs(f, cls.__name__)
+            self.assertTrue("p cnf %d 40\n" % f.num_vars in text)
+
+            parsed = parseFile(os.path.join(self.directory, cls.__name__ + '.cnf.gz'))
+            self.assertEqual([sorted(c) for c in parsed.iterIntClauses()],
+                             [sorted(c) for c in f.iterIntClauses()])
+
+    def test_weighted_formulas(self):
+        rng = random.Random(4)
+        rows = [([rng.choice([-1, 1]) * v for v in rng.sample(range(1, 10), rng.randint(1, 3))],
+                 rng.choice([-1, 1, 2, 7]), rng.randint(0, 2)) for j in range(25)]
+        texts = {}
+        for cls in [WeightedFormula, CompactWeightedFormula]:
+            f = cls()
+            for (lits, weight, level) in rows:
+                f.addIntClause(sorted(lits, key = abs), weight)
+            texts[cls] = self._outputs(f, cls.__name__)
+        self.assertEqual(_normalize(texts[WeightedFormula]), _normalize(texts[CompactWeightedFormula]))
+
+        for cls in [LevelWeightedFormula, CompactLevelWeightedFormula]:
+            f = cls()
+            for (lits, weight, level) in rows:
+                f.addIntClause(sorted(lits, key = abs), weight, level)
+            texts[cls] = self._outputs(f, cls.__name__)
+        self.assertEqual(_normalize(texts[LevelWeightedFormula]),
+                         _normalize(texts[CompactLevelWeightedFormula]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import sys
+import random
+import unittest
+
+from krrt.sat.DPLL import DPLL, propagate, unit_prop, purelit_prop
+
+from tests.helpers import models_of, is_satisfiable, random_clauses, int_formula
+
+
+class _Quiet(object):
+    def write(self, text):
+        pass
+
+
+class IterativeDPLLTest(unittest.TestCase):
+
+    def _solve(self, solver):
+        # The search reports its progress on stdout
+        stdout = sys.stdout
+        sys.stdout = _Quiet()
+        try:
+            return solver.solve_iterative()
+        finally:
+            sys.stdout = stdout
+
+    def test_matches_brute_force(self):
+        rng = random.Random(6)
+        for t in range(150):
+            n = rng.randint(1, 9)
+            clauses = random_clauses(rng, n, rng.randint(1, 40))
+            f = int_formula(clauses)
+            sat = is_satisfiable(f.num_vars, clauses)
+            for voh in ['vsids', 'static', 'random']:
+                settings = self._solve(DPLL(f, False, None, voh))
+                if sat:
+                    model = set(settings)
+                    self.assertTrue(all(any(l in model for l in cls) for cls in clauses))
+                else:
+                    self.assertEqual(settings, [0])
+
+    def test_node_budget(self):
+        f = int_formula([[v, v + 1] for v in range(1, 30, 2)])
+        solver = DPLL(f, False, None, 'static', node_budget = 3)
+        self.assertEqual(self._solve(solver), [0])
+        self.assertTrue(solver.timedout)
+
+
+class PropagationTest(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        rng = random.Random(8)
+        for t in range(300):
+            n = rng.randint(1, 8)
+            clauses = random_clauses(rng, n, rng.randint(1, 25))
+            models = set(models_of(n, clauses))
+            for simplify in [propagate, unit_prop, purelit_prop]:
+                f = int_formula(clauses)
+                simplify(f)
+                left = set(models_of(n, list(f.iterIntClauses())))
+                if simplify is unit_prop:
+                    # Unit propagation keeps the fixed literals as units
+                    self.assertEqual(left, models)
+                else:
+                    # Pure literals only keep the formula satisfiable
+                    self.assertEqual(bool(left), bool(models))
+                    self.assertTrue(left <= models)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+import os
+import sys
+import unittest
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Each problem directory holds a domain, a problem and its grounding by the
+# original queue engine (grounding.txt, in the format of _ground)
+PROBLEMS = ['logistics', 'misc']
+
+
+def _ground(name, **options):
+    """Explore a test problem and return its grounding as lines of text."""
+    from krrt.planning.pddl import open as parsePDDL
+    from krrt.planning.pddl.instantiate import explore
+
+    task = parsePDDL(task_filename = os.path.join(DATA, name, 'problem.pddl'),
+                     domain_filename = os.path.join(DATA, name, 'domain.pddl'))
+    (reachable, atoms, actions, axioms, params) = explore(task, **options)
+
+    def effects(effs):
+        return [(sorted(map(str, cond)), str(eff)) for (cond, eff) in effs]
+
+    lines = ['%s' % reachable]
+    lines.extend(sorted([str(atom) for atom in atoms]))
+    # The engines may find the actions in different orders
+    lines.extend(sorted(['%s %s %s %s %s' % (a.name, sorted(map(str, a.precondition)),
+                                             effects(a.add_effects), effects(a.del_effects), a.cost)
+                         for a in actions]))
+    lines.extend(sorted(['%s %s %s' % (ax.name, sorted(map(str, ax.condition)), ax.effect)
+                         for ax in axioms]))
+    for name in sorted(params):
+        lines.append('%s %s' % (name, sorted(params[name])))
+    return lines
+
+def _expected(name):
+    f = open(os.path.join(DATA, name, 'grounding.txt'))
+    lines = f.read().splitlines()
+    f.close()
+    return lines
+
+
+@unittest.skipIf(sys.version_info[0] >= 3, "The PDDL translator needs python 2")
+class InternedModelTest(unittest.TestCase):
+
+    def test_decoded_model(self):
+        from krrt.planning.pddl import open as parsePDDL
+        from krrt.planning.pddl import build_model, pddl_to_prolog
+
+        for name in PROBLEMS:
+            task = parsePDDL(task_filename = os.path.join(DATA, name, 'problem.pddl'),
+                             domain_filename = os.path.join(DATA, name, 'domain.pddl'))
+            prog = pddl_to_prolog.translate(task)
+            (facts, symbols) = build_model.compute_model(prog, decode = False)
+            self.assertEqual(len(set(facts)), len(facts))
+            for fact in facts:
+                self.assertEqual(symbols.encode(symbols.decode(fact)), fact)
+
+            model = build_model.compute_model(pddl_to_prolog.translate(task))
+            self.assertEqual(sorted(map(str, model)), sorted(map(str, symbols.decode_all(facts))))
+
+
+@unittest.skipIf(sys.version_info[0] >= 3, "The PDDL translator needs python 2")
+class SeminaiveTest(unittest.TestCase):
+
+    def test_queue_engine(self):
+        for name in PROBLEMS:
+            self.assertEqual(_ground(name), _expected(name))
+
+    def test_seminaive_engine(self):
+        for name in PROBLEMS:
+            self.assertEqual(_ground(name, engine = 'seminaive'), _expected(name))
+
+    def test_seminaive_engine_with_numpy(self):
+        from krrt.planning.pddl import seminaive
+        if seminaive.numpy is None:
+            self.skipTest("NumPy is not installed")
+        for name in PROBLEMS:
+            self.assertEqual(_ground(name, engine = 'seminaive', use_numpy = True), _expected(name))
+
+
+def _program():
+    """
+    A small exploration program, built directly rather than translated,
+    with every kind of rule: joins on one and on two variables, a join
+    with a constant, a product and projections.
+    """
+    from krrt.planning.pddl import Atom
+    from krrt.planning.pddl.pddl_to_prolog import PrologProgram, Rule
+
+    prog = PrologProgram()
+    for (a, b) in [('l1', 'l2'), ('l2', 'l3'), ('l3', 'l1'), ('l3', 'l4'), ('l5', 'l1')]:
+        prog.add_fact(Atom('road', [a, b]))
+    for (a, b) in [('l2', 'l3'), ('l3', 'l1'), ('l4', 'l3')]:
+        prog.add_fact(Atom('rail', [a, b]))
+    for (car, loc) in [('c1', 'l1'), ('c2', 'l5')]:
+        prog.add_fact(Atom('car', [car]))
+        prog.add_fact(Atom('at', [car, loc]))
+
+    rules = [
+        ('join', [Atom('at', ['?c', '?x']), Atom('road', ['?x', '?y'])], Atom('at', ['?c', '?y'])),
+        ('join', [Atom('road', ['?x', '?y']), Atom('rail', ['?x', '?y'])], Atom('both', ['?x', '?y'])),
+        ('join', [Atom('at', ['?c', 'l4']), Atom('car', ['?c'])], Atom('done', ['?c'])),
+        ('product', [Atom('car', ['?c']), Atom('both', ['?x', '?y'])], Atom('ticket', ['?c', '?x', '?y'])),
+        ('project', [Atom('ticket', ['?c', '?x', '?y'])], Atom('sold', ['?x'])),
+        ('project', [Atom('at', ['?c', '?x'])], Atom('visited', ['?x'])),
+    ]
+    for (kind, conditions, effect) in rules:
+        rule = Rule(conditions, effect)
+        rule.type = kind
+        prog.add_rule(rule)
+    return prog
+
+
+class EngineTest(unittest.TestCase):
+
+    # Besides the initial facts
+    DERIVED = ['at(c1, l2)', 'at(c1, l3)', 'at(c1, l4)', 'at(c2, l1)', 'at(c2, l2)', 'at(c2, l3)',
+               'at(c2, l4)', 'both(l2, l3)', 'both(l3, l1)', 'done(c1)', 'done(c2)', 'sold(l2)',
+               'sold(l3)', 'ticket(c1, l2, l3)', 'ticket(c1, l3, l1)', 'ticket(c2, l2, l3)',
+               'ticket(c2, l3, l1)', 'visited(l1)', 'visited(l2)', 'visited(l3)', 'visited(l4)',
+               'visited(l5)']
+
+    def _model(self, **options):
+        from krrt.planning.pddl import seminaive
+
+        prog = _program()
+        # The engines report their progress on stdout
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            model = seminaive.compute_model(prog, **options)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+        facts = set([str(fact.atom) for fact in prog.facts])
+        self.assertEqual(len(model), len(set(map(str, model))))
+        return sorted(['%s(%s)' % (atom.predicate, ', '.join(atom.args)) \
+                       for atom in model if str(atom) not in facts])
+
+    def test_seminaive_engine(self):
+        self.assertEqual(self._model(), self.DERIVED)
+
+    def test_seminaive_engine_with_numpy(self):
+        from krrt.planning.pddl import seminaive
+        if seminaive.numpy is None:
+            self.skipTest("NumPy is not installed")
+        self.assertEqual(self._model(use_numpy = True), self.DERIVED)
+
+
+@unittest.skipIf(sys.version_info[0] >= 3, "The PDDL translator needs python 2")
+class ParallelTest(unittest.TestCase):
+
+    def _actions(self, name, **options):
+        from krrt.planning.pddl import open as parsePDDL
+        from krrt.planning.pddl.instantiate import explore
+
+        task = parsePDDL(task_filename = os.path.join(DATA, name, 'problem.pddl'),
+                         domain_filename = os.path.join(DATA, name, 'domain.pddl'))
+        return [a.name for a in explore(task, **options)[2]]
+
+    def test_parallel_instantiation(self):
+        for name in PROBLEMS:
+            serial = self._actions(name)
+            for processes in [2, 3]:
+                self.assertEqual(_ground(name, processes = processes), _expected(name))
+                # The chunks are put back in order, so even the order is kept
+                self.assertEqual(self._actions(name, processes = processes), serial)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import random
+import unittest
+import itertools
+
+from krrt.sat.CNF import WeightedFormula
+from krrt.search.localsearch.engine import LocalSearch, METHODS
+
+from tests.helpers import satisfies, is_satisfiable, random_clauses, int_formula
+
+
+def _cost(weighted, bits):
+    return sum([w for (lits, w) in weighted if not any((l > 0) == bits[abs(l) - 1] for l in lits)])
+
+
+class LocalSearchTest(unittest.TestCase):
+
+    def test_empty_soft_clause(self):
+        f = WeightedFormula()
+        f.reserveVariables(2)
+        f.addIntClause([1, 2], -1)
+        f.addIntClause([], 3)
+        for method in METHODS:
+            search = LocalSearch(f, method = method, max_flips = 50, max_tries = 2, seed = 1)
+            self.assertEqual(search.solve(), None)
+            self.assertEqual(search.cost, 3)
+            self.assertTrue(1 in search.model or 2 in search.model)
+
+            search = LocalSearch(f, method = method, target = 3, seed = 1)
+            self.assertTrue(search.solve())
+
+    def test_finds_models(self):
+        rng = random.Random(19)
+        for t in range(60):
+            n = rng.randint(1, 8)
+            clauses = random_clauses(rng, n, rng.randint(0, 16), 3)
+            f = int_formula(clauses, n)
+            sat = is_satisfiable(n, clauses)
+
+            for method in METHODS:
+                search = LocalSearch(f, method = method, max_flips = 500, max_tries = 4, seed = t)
+                self.assertEqual(search.solve(), True if sat else None)
+                if sat:
+                    self.assertEqual(search.cost, 0)
+                    self.assertTrue(satisfies([l > 0 for l in search.model], clauses))
+
+    def test_weighted_costs(self):
+        rng = random.Random(20)
+        for t in range(40):
+            n = rng.randint(1, 6)
+            weighted = [([rng.choice([-1, 1]) * rng.randint(1, n) for i in range(rng.randint(0, 3))],
+                         rng.choice([-1, 1, 2, 5])) for j in range(rng.randint(1, 12))]
+            f = WeightedFormula()
+            f.reserveVariables(n)
+            for (lits, w) in weighted:
+                f.addIntClause(lits, w)
+
+            soft = [(lits, w) for (lits, w) in weighted if -1 != w]
+            hard = [(lits, 1) for (lits, w) in weighted if -1 == w]
+            costs = [_cost(soft, bits) for bits in itertools.product([False, True], repeat = n) \
+                     if 0 == _cost(hard, bits)]
+
+            search = LocalSearch(f, max_flips = 500, max_tries = 2, seed = t)
+            search.solve()
+            if not costs:
+                self.assertEqual(search.model, None)
+            else:
+                self.assertTrue(search.cost >= min(costs))
+                bits = [l > 0 for l in search.model]
+                self.assertEqual(_cost(hard, bits), 0)
+                self.assertEqual(_cost(soft, bits), search.cost)
+
+
+if __name__ == '__main__':
+    unittest.main()
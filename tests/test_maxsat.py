@@ -0,0 +1,82 @@
+import random
+import unittest
+import itertools
+
+from krrt.sat.CNF import WeightedFormula, CompactWeightedFormula, LevelWeightedFormula
+from krrt.sat.MaxSAT import MaxSAT
+
+
+def _holds(bits, lits):
+    return any((l > 0) == bits[abs(l) - 1] for l in lits)
+
+def _cost(bits, soft):
+    return sum([w for (lits, w) in soft if not _holds(bits, lits)])
+
+def _optimum(n, hard, soft):
+    costs = [_cost(bits, soft) for bits in itertools.product([False, True], repeat = n) \
+             if all(_holds(bits, lits) for lits in hard)]
+    return min(costs) if costs else None
+
+def _random_clause(rng, n):
+    return [rng.choice([-1, 1]) * rng.randint(1, n) for i in range(rng.randint(1, 3))]
+
+
+class MaxSATTest(unittest.TestCase):
+
+    def _check(self, f, n, hard, soft):
+        expected = _optimum(n, hard, soft)
+        for stratify in [True, False]:
+            solver = MaxSAT(f, stratify = stratify)
+            result = solver.solve()
+            if expected is None:
+                self.assertEqual(result, False)
+                continue
+            self.assertEqual(result, True)
+            self.assertEqual(solver.cost, expected)
+            self.assertEqual(solver.lower_bound, expected)
+
+            bits = [l > 0 for l in solver.model[:n]]
+            self.assertTrue(all(_holds(bits, lits) for lits in hard))
+            self.assertEqual(_cost(bits, soft), expected)
+
+    def test_weighted(self):
+        rng = random.Random(18)
+        for t in range(150):
+            n = rng.randint(1, 7)
+            hard = [_random_clause(rng, n) for i in range(rng.randint(0, 6))]
+            soft = [(_random_clause(rng, n), rng.randint(1, 5)) for i in range(rng.randint(1, 10))]
+            for cls in [WeightedFormula, CompactWeightedFormula]:
+                f = cls()
+                f.reserveVariables(n)
+                for lits in hard:
+                    f.addIntClause(lits, -1)
+                for (lits, w) in soft:
+                    f.addIntClause(lits, w)
+                self._check(f, n, hard, soft)
+
+    def test_levels(self):
+        rng = random.Random(19)
+        for t in range(100):
+            n = rng.randint(1, 6)
+            hard = [_random_clause(rng, n) for i in range(rng.randint(0, 4))]
+            f = LevelWeightedFormula()
+            f.reserveVariables(n)
+            for lits in hard:
+                f.addIntClause(lits, -1, 0)
+            rows = [(_random_clause(rng, n), rng.randint(1, 5), rng.randint(0, 2)) \
+                    for i in range(rng.randint(1, 8))]
+            for (lits, w, level) in rows:
+                f.addIntClause(lits, w, level)
+
+            # The soft weights as written by writeCNF
+            offsets = {}
+            total = 0
+            for level in sorted(f.getLevels()):
+                offsets[level] = total
+                total += f.level_weight(level, total)
+            soft = [(lits, w + offsets[level]) for (lits, w, level) in rows]
+            self._check(f, n, hard, soft)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import random
+import unittest
+
+from krrt.sat.CNF import Formula, CompactFormula
+from krrt.sat.ModelCounter import count
+
+from tests.helpers import models_of, random_clauses, int_formula
+
+
+class ModelCounterTest(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        rng = random.Random(17)
+        for t in range(200):
+            n = rng.randint(1, 10)
+            clauses = random_clauses(rng, n, rng.randint(0, 30), 3)
+            expected = len(models_of(n, clauses))
+            for (cls, cache_size) in [(Formula, 1000000), (CompactFormula, 4)]:
+                f = int_formula(clauses, n, cls)
+                self.assertEqual(count(f, cache_size = cache_size), expected)
+
+    def test_trivial_formulas(self):
+        f = Formula()
+        f.reserveVariables(5)
+        self.assertEqual(count(f), 32)
+        f.addIntClause([])
+        self.assertEqual(count(f), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
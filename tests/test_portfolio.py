@@ -0,0 +1,79 @@
+import sys
+import random
+import unittest
+
+from krrt.sat.CNF import Formula, CompactFormula
+from krrt.sat import Portfolio
+
+from tests.helpers import is_satisfiable, random_clauses, int_formula
+
+
+def _pigeonhole(pigeons, holes):
+    """Every pigeon in some hole, and no two in the same one (unsatisfiable if pigeons > holes)."""
+    var = lambda p, h: p * holes + h + 1
+    clauses = [[var(p, h) for h in range(holes)] for p in range(pigeons)]
+    for h in range(holes):
+        for p in range(pigeons):
+            for q in range(p + 1, pigeons):
+                clauses.append([-var(p, h), -var(q, h)])
+    return clauses
+
+
+@unittest.skipIf(Portfolio.shared_memory is None, "The portfolio needs python >= 3.8")
+class PortfolioTest(unittest.TestCase):
+
+    def test_shared_clauses(self):
+        f = CompactFormula()
+        for cls in [[1, -2], [3], [-1, 2, -3, 4]]:
+            f.addIntClause(cls)
+        shm = Portfolio._share(f)
+        try:
+            (num_vars, offsets, literals) = Portfolio._load(shm.buf)
+            self.assertEqual(num_vars, 4)
+            self.assertEqual([list(literals[offsets[i]:offsets[i + 1]]) for i in range(3)],
+                             [[1, -2], [3], [-1, 2, -3, 4]])
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def test_matches_brute_force(self):
+        rng = random.Random(20)
+        configs = [Portfolio.CONFIGS[0], Portfolio.CONFIGS[3], Portfolio.CONFIGS[-1]]
+        for t in range(12):
+            n = rng.randint(1, 9)
+            clauses = random_clauses(rng, n, rng.randint(1, 40), 3)
+            f = int_formula(clauses, cls = [Formula, CompactFormula][t % 2])
+
+            portfolio = Portfolio.solve(f, configs = configs, processes = 2)
+            self.assertEqual(portfolio.result, is_satisfiable(f.num_vars, clauses))
+            self.assertTrue(portfolio.winner in range(len(configs)))
+            if portfolio.result:
+                model = set(portfolio.model)
+                self.assertTrue(all(any(l in model for l in cls) for cls in clauses))
+
+    def test_dpll_timeout(self):
+        try:
+            from queue import Queue
+        except ImportError:
+            from Queue import Queue
+
+        # Far more than a second of search for the DPLL solver
+        shm = Portfolio._share(int_formula(_pigeonhole(9, 8), cls = CompactFormula))
+        results = Queue()
+        stdout = sys.stdout
+        try:
+            Portfolio._work(0, Portfolio.CONFIGS[-1], shm.name, 0.2, results)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+            shm.close()
+            shm.unlink()
+
+        (index, result, model, stats) = results.get()
+        self.assertFalse('error' in stats)
+        self.assertEqual(result, None)
+        self.assertTrue(stats['time'] < 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
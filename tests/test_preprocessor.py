@@ -0,0 +1,45 @@
+import random
+import unittest
+
+from krrt.sat.CNF import Formula, CompactFormula
+from krrt.sat.Preprocessor import preprocess
+
+from tests.helpers import models_of, is_satisfiable, random_clauses, int_formula
+
+
+def _satisfies(model, clauses):
+    model = set(model)
+    return all(any(l in model for l in cls) for cls in clauses)
+
+
+class PreprocessorTest(unittest.TestCase):
+
+    def test_models_are_reconstructed(self):
+        rng = random.Random(8)
+        for t in range(300):
+            n = rng.randint(1, 9)
+            clauses = random_clauses(rng, n, rng.randint(1, 30))
+            cls = [Formula, CompactFormula][t % 2]
+            f = int_formula(clauses, n, cls)
+
+            pre = preprocess(f, elim_grow = rng.choice([0, 2]))
+            self.assertTrue(isinstance(pre.formula, cls))
+            simplified = list(pre.formula.iterIntClauses())
+            models = models_of(n, simplified)
+            self.assertEqual(bool(models), is_satisfiable(n, clauses))
+            for bits in models:
+                model = [(i + 1) if b else -(i + 1) for (i, b) in enumerate(bits)]
+                self.assertTrue(_satisfies(pre.reconstruct(model), clauses))
+
+    def test_conflict(self):
+        f = Formula()
+        f.addIntClause([1, 2])
+        f.addIntClause([-1])
+        f.addIntClause([-2])
+        pre = preprocess(f)
+        self.assertTrue(pre.conflict)
+        self.assertEqual(list(pre.formula.iterIntClauses()), [[]])
+
+
+if __name__ == '__main__':
+    unittest.main()
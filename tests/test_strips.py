@@ -0,0 +1,138 @@
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+DOMAIN = os.path.join(DATA, 'logistics', 'domain.pddl')
+PROBLEM = os.path.join(DATA, 'logistics', 'problem.pddl')
+
+
+def _names(fluents):
+    return sorted([f.name for f in fluents])
+
+def _summary(problem):
+    """A comparable form of an (F, A, I, G) tuple."""
+    (F, A, I, G) = problem
+    actions = dict([(name, (_names(a.precond), _names(a.adds), _names(a.dels), a.line, a.cost)) \
+                    for (name, a) in A.items()])
+    return (_names(F), actions, _names(I), _names(G))
+
+
+@unittest.skipIf(sys.version_info[0] >= 3, "The PDDL translator needs python 2")
+class GroundingCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cached_problem(self):
+        from krrt.planning.strips import parse_problem, GroundingCache
+
+        expected = _summary(parse_problem(DOMAIN, PROBLEM))
+
+        cache = GroundingCache(os.path.join(self.directory, 'cache'))
+        self.assertEqual(_summary(parse_problem(DOMAIN, PROBLEM, cache)), expected)
+        self.assertEqual((cache.HITS, cache.MISSES), (0, 1))
+        self.assertEqual(_summary(parse_problem(DOMAIN, PROBLEM, cache)), expected)
+        self.assertEqual((cache.HITS, cache.MISSES), (1, 1))
+
+        # A new cache object on the same directory
+        self.assertEqual(_summary(parse_problem(DOMAIN, PROBLEM, cache.directory)), expected)
+
+    def test_keys_and_eviction(self):
+        from krrt.planning.strips import GroundingCache
+
+        problem = os.path.join(self.directory, 'problem.pddl')
+        shutil.copy(PROBLEM, problem)
+        cache = GroundingCache(os.path.join(self.directory, 'cache'), max_bytes = 0)
+        key = cache.key(DOMAIN, problem)
+        self.assertEqual(cache.key(DOMAIN, PROBLEM), key)
+
+        f = open(problem, 'a')
+        f.write('\n')
+        f.close()
+        self.assertNotEqual(cache.key(DOMAIN, problem), key)
+
+        # Nothing fits in zero bytes, and an unreadable entry is a miss
+        cache.store(key, (set(), {}, set(), set()))
+        self.assertEqual(cache.load(key), None)
+        f = open(cache.path(key), 'wb')
+        f.write(b'garbage')
+        f.close()
+        self.assertEqual(cache.load(key), None)
+        self.assertEqual(cache.MISSES, 2)
+
+
+def _random_problem(rng, num_fluents, num_actions):
+    from krrt.planning.strips import Action, Fluent
+
+    F = set([Fluent('f%d' % i) for i in range(num_fluents)])
+    fluents = sorted(F, key = lambda f: f.name)
+    A = {}
+    for i in range(num_actions):
+        name = 'a%d' % i
+        A[name] = Action(set(rng.sample(fluents, rng.randint(0, 3))),
+                         set(rng.sample(fluents, rng.randint(0, 3))),
+                         set(rng.sample(fluents, rng.randint(0, 3))), name)
+    I = set(rng.sample(fluents, num_fluents // 2))
+    G = set(rng.sample(fluents, 3))
+    return (F, A, I, G)
+
+
+class CompiledTaskTest(unittest.TestCase):
+
+    def _check(self, problem, use_numpy = False, depth = 3):
+        from krrt.planning.strips import CompiledTask, is_applicable, progress_state, regress_state
+
+        (F, A, I, G) = problem
+        task = CompiledTask(F, A, I, G, use_numpy = use_numpy)
+        self.assertEqual(task.decode(task.init), I)
+        self.assertEqual(task.decode(task.goal), G)
+
+        # Expand a few layers both ways, comparing every successor
+        layer = [I]
+        for d in range(depth):
+            next_layer = []
+            for state in layer:
+                mask = task.encode(state)
+                self.assertEqual(task.is_goal(mask), G <= state)
+                if use_numpy:
+                    self.assertEqual(task.from_words(task.words(mask)), mask)
+
+                expected = sorted([name for (name, a) in A.items() if is_applicable(state, a)])
+                successors = task.successors(mask)
+                self.assertEqual(sorted([act.action.line for (act, s) in successors]), expected)
+                for (act, succ) in successors:
+                    a = act.action
+                    self.assertEqual(task.decode(succ), progress_state(state, a))
+                    self.assertEqual(progress_state(mask, act), succ)
+                    self.assertEqual(task.decode(regress_state(mask, act)), regress_state(state, a))
+                    self.assertEqual(is_applicable(mask, act, True), is_applicable(state, a, True))
+                    next_layer.append(progress_state(state, a))
+            layer = next_layer[:20]
+
+    def test_random_problems(self):
+        from krrt.planning.strips import bitset
+
+        rng = random.Random(25)
+        for t in range(20):
+            # Past 64 fluents the numpy masks take several words
+            problem = _random_problem(rng, rng.choice([5, 40, 130]), 30)
+            self._check(problem)
+            if bitset.numpy is not None:
+                self._check(problem, use_numpy = True)
+
+    @unittest.skipIf(sys.version_info[0] >= 3, "The PDDL translator needs python 2")
+    def test_grounded_problem(self):
+        from krrt.planning.strips import parse_problem
+
+        self._check(parse_problem(DOMAIN, PROBLEM))
+
+
+if __name__ == '__main__':
+    unittest.main()